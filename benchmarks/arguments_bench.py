@@ -0,0 +1,113 @@
+# Measures how many commands every function call runs before and after the arguments are passed in scores (-O), on
+# the examples of the guide and on generated programs that call functions with int and float arguments, and checks that
+# the programs still do the same thing: the load function and every other function that isn't generated is run after
+# the load function, before and after, and before and after all the optimizations of -O.
+# Usage: python benchmarks/arguments_bench.py [functions] [runs]
+import math
+import os
+import re
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from inline_bench import CountingMachine, check  # noqa: E402
+from peephole_bench import examples, generate  # noqa: E402
+from radon.arguments import NUMBER_TYPES, ArgumentAllocator  # noqa: E402
+from radon.constants import ConstantPropagator  # noqa: E402
+from radon.dp_ast import parse_str  # noqa: E402
+from radon.error import RadonError  # noqa: E402
+from radon.inliner import Inliner  # noqa: E402
+from radon.ir import DataGet  # noqa: E402
+from radon.optimizer import PeepholeOptimizer  # noqa: E402
+from radon.registers import RegisterAllocator, SlotAllocator  # noqa: E402
+from radon.transpiler import MERGEABLE_FOLDERS, Transpiler, reset_builtins  # noqa: E402
+
+NAMESPACE = "mypack"
+ARG_SCORE = re.compile(r"arg_\d+ __temp__")
+FLOAT_LITERAL = re.compile(r"(-?\d+\.\d+)[fd]?")
+
+
+def generate_arguments(fn_count: int) -> str:
+    # functions with int and float arguments that call each other, and a recursive one
+    lines = []
+    for i in range(fn_count):
+        lines.append(f"fn clamp{i}(int v, int lo, int hi) {{\n    if (v < lo) {{ return lo }}\n"
+                     f"    if (v > hi) {{ return hi }}\n    return v\n}}")
+        lines.append(f"fn mix{i}(float a, float t, int n) {{\n    a += t * 2.0\n    return a * t + clamp{i}(n, 0, "
+                     f"{i + 10})\n}}")
+        lines.append(f"fn count{i}(int n): int {{\n    if (n > 0) {{ return count{i}(n - 1) + clamp{i}(n, 1, 2) }}\n"
+                     f"    return 0\n}}")
+        lines.append(f"r{i} = mix{i}({i}.5, 1.25, {i * 3}) + count{i}({i % 4})")
+    return "\n".join(lines)
+
+
+class ArgumentMachine(CountingMachine):
+    """
+    Doesn't show the scores of the arguments either, and reads a float back from the storage with the scale it was
+    stored with, like the scores of the arguments keep it.
+    """
+
+    def visible(self):
+        return {k: v for (k, v) in super().visible().items() if not (isinstance(k, str) and ARG_SCORE.fullmatch(k))}
+
+    def run(self, cmd):
+        if isinstance(cmd, DataGet) and cmd.source.startswith("storage ") and cmd.scale is not None:
+            value = self.read(cmd.source)
+            if isinstance(value, tuple) and len(value) == 3 and value[1] in NUMBER_TYPES \
+                    and float(value[2]) * float(cmd.scale) == 1.0:
+                return value[0]
+            match = FLOAT_LITERAL.fullmatch(value) if isinstance(value, str) else None
+            if match is not None:
+                return math.floor(float(match.group(1)) * float(cmd.scale))
+        return super().run(cmd)
+
+
+def main():
+    fn_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    programs = list(examples()) + [generate(fn_count), generate_arguments(fn_count // 4)]
+    (moved, failures, took) = (0, 0, 0.0)
+    totals = [0, 0, 0, 0]
+    for code in programs:
+        try:
+            reset_builtins()
+            transpiler = Transpiler(*parse_str(code), pack_namespace=NAMESPACE)
+        except (RadonError, RecursionError):
+            # some of the examples are only parts of a program, or don't build yet
+            continue
+        files = transpiler.files
+        arguments = {f.file_name: [arg.store.location for arg in f.arguments] for f in transpiler.functions
+                     if f.type == "radon" and f.file_name in files
+                     and all(arg.store_via == "stack" for arg in f.arguments)}
+        # the functions that take arguments only run when they are called
+        called = set(f.file_name for f in transpiler.functions if len(f.arguments) > 0)
+        after = {name: list(cmds) for (name, cmds) in files.items()}
+        start = perf_counter()
+        moved += ArgumentAllocator(NAMESPACE).allocate(after, arguments)
+        took += perf_counter() - start
+        res = check(files, after, runs, "passing the arguments in scores", ArgumentMachine, called)
+        failures += res[0]
+        for i in range(4):
+            totals[i] += res[i + 1]
+        # all the passes of -O
+        optimized = {name: list(cmds) for (name, cmds) in files.items()}
+        functions = {f.file_name: (f.name, f.inline) for f in transpiler.functions
+                     if f.type == "radon" and f.file_name in files}
+        Inliner(NAMESPACE).inline(optimized, functions)
+        ArgumentAllocator(NAMESPACE).allocate(optimized, arguments)
+        ConstantPropagator(NAMESPACE, MERGEABLE_FOLDERS).propagate(optimized)
+        PeepholeOptimizer().optimize(optimized)
+        RegisterAllocator(NAMESPACE).allocate(optimized)
+        SlotAllocator(NAMESPACE).allocate(optimized)
+        failures += check(files, optimized, runs, "-O", ArgumentMachine, called)[0]
+    print(f"Input: {len(programs)} programs")
+    print(f"Arguments passed in scores: {moved} in {took:.4f}s")
+    print(f"Commands run: {totals[0]} -> {totals[1]}, function calls: {totals[2]} -> {totals[3]}")
+    if totals[2] > 0:
+        print(f"Commands per call: {totals[0] / totals[2]:.2f} -> {totals[1] / totals[3]:.2f}")
+    print(f"Equivalence: {failures} functions differ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# Measures transpiling class and object heavy code, where argument, array and assignment type checks compare
+# object types a lot.
+# Usage: python benchmarks/class_types_bench.py [classes]
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from radon.dp_ast import parse_str  # noqa: E402
+from radon.transpiler import Transpiler  # noqa: E402
+
+
+OBJECT = '{"x": %d, "y": [1.0, 2.0], "z": {"a": 1, "b": [1, 2], "c": {"p": [1.0], "q": 2}}}'
+
+
+def generate(class_count: int) -> str:
+    lines = ["ints = [1, 2]", "floats = [1.0]"]
+    for i in range(class_count):
+        lines.append(f"class C{i} {{")
+        lines.append("    a = 0")
+        lines.append("    list = [1, 2, 3]")
+        lines.append("    floats = [1.0, 2.0]")
+        lines.append(f"    C{i}(int a, int[] list) {{ this.a = a }}")
+        lines.append("    add(int[] other, float[] fl, int b) { return this.a + b }")
+        lines.append("}")
+        lines.append(f"c{i} = C{i}({i}, ints)")
+        for j in range(5):
+            lines.append(f"r{i}_{j} = c{i}.add(ints, floats, {j})")
+        lines.append(f"a{i} = [" + ", ".join(OBJECT % j for j in range(10)) + "]")
+        for j in range(5):
+            lines.append(f"o{i} = " + OBJECT % j)
+    return "\n".join(lines)
+
+
+def main():
+    class_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    statements, macros = parse_str(generate(class_count))
+    print(f"Input: {class_count} classes, {len(statements)} statements")
+    start = perf_counter()
+    transpiler = Transpiler(statements, macros)
+    took = perf_counter() - start
+    print(f"Transpiler: {len(transpiler.files)} files in {took:.4f}s")
+    # structurally equal, separately built nested object types
+    t1 = transpiler.variables["o0"].type
+    t2 = transpiler.variables["o1"].type
+    start = perf_counter()
+    for _ in range(100000):
+        _ = t1 == t2
+        _ = t1 != t2
+    took = perf_counter() - start
+    print(f"Type comparisons: 200000 in {took:.4f}s")
+
+
+if __name__ == "__main__":
+    main()
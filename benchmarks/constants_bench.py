@@ -0,0 +1,205 @@
+# Measures how many commands the constant propagation (-O) changes or removes in the examples of the guide and in
+# generated programs, and how many commands are left after the peephole optimizer with and without it. Checks that the
+# programs still do the same thing: every function file that doesn't depend on the values known where it's called is
+# run before and after the propagation, following the calls, with the values of the storages modelled too, and so are
+# the functions of a data folder that change the scores the load function sets.
+# Usage: python benchmarks/constants_bench.py [functions] [runs]
+import math
+import os
+import random
+import re
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from peephole_bench import Machine, examples, generate  # noqa: E402
+from registers_bench import ProgramMachine  # noqa: E402
+from radon.constants import ConstantPropagator, data_aliases  # noqa: E402
+from radon.dp_ast import parse_str  # noqa: E402
+from radon.error import RadonError  # noqa: E402
+from radon.ir import DataGet, DataModify, DataRemove, Execute, ScoreCondition, lift_all  # noqa: E402
+from radon.optimizer import PeepholeOptimizer  # noqa: E402
+from radon.transpiler import MERGEABLE_FOLDERS, Transpiler, reset_builtins  # noqa: E402
+
+NAMESPACE = "mypack"
+INT_LITERAL = re.compile(r"(-?\d+)[bsL]?")
+
+
+def generate_constants(fn_count: int) -> str:
+    # variables set once, values that follow from them, and branches on them
+    lines = []
+    for i in range(fn_count):
+        lines.append(f"k{i} = {i + 3}\nm{i} = k{i} * 3 + {i}")
+        lines.append(f"if (m{i} > {i * 4 + 5}) {{\n    q{i} = m{i} - k{i}\n}} else {{\n    q{i} = k{i} * 2\n}}")
+        lines.append(f"fn g{i}(int x) {{\n    y = x * k{i} + m{i}\n    if (y > 0) {{ y += k{i} }}\n    return y\n}}")
+        lines.append(f"r{i} = g{i}(q{i}) + q{i} % 4\nt{i} = {i}\nt{i} += 1\nt{i} *= m{i}")
+    return "\n".join(lines)
+
+
+def data_writers():
+    # functions of the data folder, which aren't transpiled, that change the scores the load function sets and run the
+    # functions that read them
+    code = "a = 5\nc = 7\nfn tick {\n    b = a + c + 1\n}\nfn show() {\n    print(c * 2)\n}"
+    data = {"poke": f"scoreboard players set a {NAMESPACE}.global 42\nfunction {NAMESPACE}:tick",
+            "reset": f"scoreboard players operation c {NAMESPACE}.global = a {NAMESPACE}.global\n"
+                     f"function {NAMESPACE}:show"}
+    return code, data
+
+
+class StorageMachine(ProgramMachine):
+    """
+    Keeps the values of the storages too: the literals that are written to them, and the values read from the other
+    locations otherwise.
+    """
+
+    def __init__(self, files, scores) -> None:
+        super().__init__(files, scores)
+        # location -> literal, or what made the value
+        self.storage = {}
+
+    def visible(self):
+        res = dict(self.scores)
+        res.update({("storage", k): v for (k, v) in self.storage.items()})
+        return res
+
+    def event(self, cmd) -> int:
+        if isinstance(cmd, Execute):
+            # the conditions the propagation removes are the ones that always pass
+            key = " ".join(str(c) for c in cmd.clauses if not isinstance(c, ScoreCondition)) + f" run {cmd.run}"
+        else:
+            key = str(cmd)
+        self.trace.append((key, self.visible()))
+        return random.Random(key).randint(-1000, 1000)
+
+    def stack(self, location: str):
+        # the list that location is the last element of, like the arguments of the functions
+        if not location.endswith("[-1]"):
+            return None
+        items = self.storage.get(location[:-4])
+        return items if isinstance(items, tuple) and items[0] == "list" and len(items) > 2 else None
+
+    def read(self, location: str):
+        if location in self.storage:
+            return self.storage[location]
+        if self.stack(location) is not None:
+            return self.stack(location)[-1]
+        return "data", location, len(self.trace)
+
+    def write(self, location: str, value) -> None:
+        items = self.stack(location)
+        self.storage = {k: v for (k, v) in self.storage.items()
+                        if not data_aliases(k, location) or (items is not None and k == location[:-4])}
+        if items is not None:
+            self.storage[location[:-4]] = items[:-1] + (() if value is None else (value,))
+        elif value is not None:
+            self.storage[location] = value
+
+    def run(self, cmd):
+        if isinstance(cmd, DataGet) and cmd.source.startswith("storage "):
+            value = self.read(cmd.source)
+            match = INT_LITERAL.fullmatch(value) if isinstance(value, str) else None
+            if match is not None:
+                return math.floor(int(match.group(1)) * (1.0 if cmd.scale is None else float(cmd.scale)))
+            return random.Random(repr((value, cmd.scale))).randint(-1000, 1000)
+        if isinstance(cmd, DataRemove) and cmd.target.startswith("storage "):
+            self.write(cmd.target, None)
+            return True
+        if isinstance(cmd, DataModify) and cmd.target.startswith("storage "):
+            source = cmd.source if cmd.kind == "value" else self.read(cmd.source)
+            if cmd.mode == "set" and cmd.kind in ("value", "from"):
+                self.write(cmd.target, source)
+            elif cmd.mode == "append" and cmd.kind in ("value", "from"):
+                items = self.storage.get(cmd.target)
+                if not (isinstance(items, tuple) and items[0] == "list"):
+                    items = ("list", self.read(cmd.target))
+                self.write(cmd.target, items + (source,))
+            elif cmd.mode == "set":
+                self.write(cmd.target, (cmd.kind, source, cmd.bounds))
+            else:
+                self.write(cmd.target, (self.read(cmd.target), cmd.mode, cmd.kind, source, cmd.bounds))
+            return True
+        self.data.clear()
+        if not isinstance(cmd, Execute):
+            return super().run(cmd)
+        # without the slots of the register benchmark, the storages are all modelled here
+        res = Machine.run(self, cmd)
+        if res is not False:
+            for clause in cmd.stores:
+                if clause.target in self.data:
+                    value = self.data.pop(clause.target)
+                    exact = clause.data_type == "int" and clause.scale == "1"
+                    self.write(clause.target, str(value) if exact else (value, clause.data_type, clause.scale))
+        return res
+
+
+def run_program(files, name, scores):
+    machine = StorageMachine(files, scores)
+    try:
+        machine.call(name)
+    except RecursionError:
+        # both runs stop after the same number of commands
+        machine.trace.append(("stopped", {}))
+    return machine.trace + [("end", machine.visible())]
+
+
+def check(before, after, propagator: ConstantPropagator, runs: int) -> int:
+    failures = 0
+    for name in before:
+        if name in propagator.entered:
+            # runs with the values known where it's called
+            continue
+        scores = set()
+        for cmd in before[name]:
+            scores.update(cmd.score_reads() | cmd.score_writes())
+        for seed in range(runs):
+            rnd = random.Random(seed)
+            start = {score: rnd.randint(-1000, 1000) for score in sorted(scores)}
+            if name != "__load__":
+                # the load function has run before
+                start.update(propagator.constants)
+            if run_program(before, name, start) != run_program(after, name, start):
+                print(f"Not equivalent: {name}")
+                failures += 1
+                break
+    return failures
+
+
+def count(files) -> int:
+    files = {name: list(cmds) for (name, cmds) in files.items()}
+    PeepholeOptimizer().optimize(files)
+    return sum(len(cmds) for cmds in files.values())
+
+
+def main():
+    fn_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    programs = [(code, {}) for code in list(examples()) + [generate(fn_count), generate_constants(fn_count // 4)]]
+    programs.append(data_writers())
+    (folded, without, with_constants, failures, took) = (0, 0, 0, 0, 0.0)
+    for (code, data) in programs:
+        try:
+            reset_builtins()
+            files = Transpiler(*parse_str(code), pack_namespace=NAMESPACE).files
+        except (RadonError, RecursionError):
+            # some of the examples are only parts of a program, or don't build yet
+            continue
+        after = {name: list(cmds) for (name, cmds) in files.items()}
+        propagator = ConstantPropagator(NAMESPACE, MERGEABLE_FOLDERS)
+        start = perf_counter()
+        folded += propagator.propagate(after, external=list(data.values()))
+        took += perf_counter() - start
+        # the functions of the data folder are run too, they are the same before and after
+        for (name, text) in data.items():
+            files[name] = after[name] = lift_all(text.split("\n"))
+        failures += check(files, after, propagator, runs)
+        without += count(files)
+        with_constants += count(after)
+    print(f"Input: {len(programs)} programs")
+    print(f"Constants folded: {folded} commands in {took:.4f}s")
+    print(f"After the peephole optimizer: {without} -> {with_constants} commands")
+    print(f"Equivalence: {failures} functions differ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# Measures transpiling a program that defines and calls many functions, some of them overloaded.
+# Usage: python benchmarks/function_table_bench.py [functions]
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from radon.dp_ast import parse_str  # noqa: E402
+from radon.transpiler import Transpiler  # noqa: E402
+
+
+def generate(fn_count: int) -> str:
+    lines = []
+    for i in range(fn_count):
+        if i % 10 == 0 and i > 0:
+            # an overload of the previous function
+            lines.append(f"fn f{i - 1}(int a, int b) {{ return a + b + {i} }}")
+        else:
+            lines.append(f"fn f{i}(int x) {{ return x + {i} }}")
+    for i in range(0, fn_count, 7):
+        if i % 10 != 0 or i == 0:
+            lines.append(f"r{i} = f{i}({i})")
+    return "\n".join(lines)
+
+
+def main():
+    fn_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    statements, macros = parse_str(generate(fn_count))
+    print(f"Input: {fn_count} functions, {len(statements)} statements")
+    start = perf_counter()
+    transpiler = Transpiler(statements, macros)
+    took = perf_counter() - start
+    print(f"Transpiler: {len(transpiler.files)} files in {took:.4f}s")
+
+
+if __name__ == "__main__":
+    main()
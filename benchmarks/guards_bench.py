@@ -0,0 +1,103 @@
+# Measures how many commands the removal of the __returned__, __break__ and __continue__ checks that can never pass
+# saves, on the examples of the guide and on generated programs full of blocks inside functions and loops, some of which
+# can break, continue or return, and checks that the programs still do the same thing: the load function and every
+# other function is run after the load function, before and after, by the interpreter of inline_bench.py.
+# Usage: python benchmarks/guards_bench.py [functions] [runs]
+import os
+import re
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from arguments_bench import ArgumentMachine  # noqa: E402
+from inline_bench import check  # noqa: E402
+from peephole_bench import examples, generate  # noqa: E402
+import radon.transpiler  # noqa: E402
+from radon.dp_ast import parse_str  # noqa: E402
+from radon.error import RadonError  # noqa: E402
+from radon.guards import GuardEliminator  # noqa: E402
+from radon.transpiler import Transpiler, reset_builtins  # noqa: E402
+
+NAMESPACE = "mypack"
+# the flags of the loops, and the ones of the listeners, which are numbered differently by the first build
+FLAG = re.compile(r"__(?:break|continue)__\d+ __temp__|__event__\w+ __temp__")
+
+
+def generate_blocks(fn_count: int) -> str:
+    # loops whose blocks never leave them, loops that break, continue and return from inside a block, and functions
+    # that only return at their end
+    lines = []
+    for i in range(fn_count):
+        lines.append(f"fn plain{i}(int n) {{\n    s = 0\n    for (a = 0; a < n; a++) {{\n"
+                     f"        if (a % 3 == 0) {{ s += a }} else {{ s -= 1 }}\n"
+                     f"        while (s > {i + 50}) {{\n            if (s % 2 == 0) {{ s /= 2 }}\n"
+                     f"            s -= 1\n        }}\n    }}\n    print(s)\n}}")
+        lines.append(f"fn leave{i}(int n) {{\n    t = 0\n    for (b = 0; b < n; b++) {{\n"
+                     f"        if (b == {i % 5 + 3}) {{\n            t += 100\n            break\n        }}\n"
+                     f"        if (b % 2 == 1) {{\n            t += 1\n            continue\n        }}\n"
+                     f"        if (t > {i + 20}) {{\n            print(t)\n            return t\n        }}\n"
+                     f"        t += b\n    }}\n    return t * 2\n}}")
+        lines.append(f"fn pick{i}(int x) {{\n    if (x > {i}) {{ y = x - {i} }} else {{ y = {i} - x }}\n"
+                     f"    if (y % 2 == 0) {{ print(y) }}\n    return y\n}}")
+        lines.append(f"plain{i}({i + 4})\nr{i} = leave{i}({i + 6}) + pick{i}({i * 3})")
+    return "\n".join(lines)
+
+
+class GuardMachine(ArgumentMachine):
+    """
+    Doesn't show the __break__ and __continue__ flags of the loops either, the loops whose blocks can't set them don't
+    reset them anymore.
+    """
+
+    def visible(self):
+        return {k: v for (k, v) in super().visible().items() if not (isinstance(k, str) and FLAG.fullmatch(k))}
+
+
+class KeepGuards(GuardEliminator):
+    # builds the programs the way they were built before
+    def eliminate(self, files, roots) -> int:
+        return 0
+
+
+def build(code: str):
+    reset_builtins()
+    radon.transpiler.GuardEliminator = KeepGuards
+    try:
+        return Transpiler(*parse_str(code), pack_namespace=NAMESPACE)
+    finally:
+        radon.transpiler.GuardEliminator = GuardEliminator
+
+
+def main():
+    fn_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    programs = list(examples()) + [generate(fn_count), generate_blocks(fn_count // 4)]
+    (removed, failures, took) = (0, 0, 0.0)
+    totals = [0, 0, 0, 0]
+    for code in programs:
+        try:
+            transpiler = build(code)
+        except (RadonError, RecursionError):
+            # some of the examples are only parts of a program, or don't build yet
+            continue
+        files = transpiler.files
+        after = {name: list(cmds) for (name, cmds) in files.items()}
+        roots = {"__load__", "tick"} | set(f.file_name for f in transpiler.functions)
+        start = perf_counter()
+        removed += GuardEliminator(NAMESPACE).eliminate(after, roots | transpiler._referenced_files(False))
+        took += perf_counter() - start
+        # the functions that take arguments only run when they are called
+        called = set(f.file_name for f in transpiler.functions if len(f.arguments) > 0)
+        res = check(files, after, runs, "removing the flag checks", GuardMachine, called)
+        failures += res[0]
+        for i in range(4):
+            totals[i] += res[i + 1]
+    print(f"Input: {len(programs)} programs")
+    print(f"Removed: {removed} commands in {took:.4f}s")
+    print(f"Commands run: {totals[0]} -> {totals[1]}, function calls: {totals[2]} -> {totals[3]}")
+    print(f"Equivalence: {failures} functions differ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Measures how long watch mode takes to rebuild a project of many modules after one of them or the main file is edited,
+# transpiling every module again and reusing the modules imported before the edit, and checks that both give the same
+# datapack. The modules use the functions, variables and classes of the ones imported before them, import a shared
+# module and a function file, and the main file runs code between the imports.
+# Usage: python benchmarks/incremental_bench.py [modules] [edits]
+import gc
+import os
+import random
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from radon.cache import ModuleCache, ParseCache  # noqa: E402
+from radon.transpiler import Transpiler, reset_builtins  # noqa: E402
+
+NAMESPACE = "bench"
+
+
+def module(i: int, version: int) -> str:
+    lines = ['import "common.rn"']
+    if i % 5 == 0:
+        lines.append(f'import "tp.mcfunction" as tp{i}')
+        lines.append(f"class P{i} {{\n    x = 0\n    y = {i}\n    shift(int d) {{\n        this.x += d\n    }}\n}}")
+        lines.append(f"p{i} = P{i}()\np{i}.shift({i + version})\ntp{i}()")
+    lines.append(f"g{i} = {i * 3 + version}")
+    for j in range(10):
+        calls = f"m{i - 1}_f{j}(x) + " if i > 0 else ""
+        lines.append(f"fn m{i}_f{j}(int x) {{\n    if (x > {j + version}) {{ return {calls}x * {j + 2} }}\n"
+                     f"    for (k = 0; k < 3; k++) {{ x += g{i} }}\n    return x + common({j})\n}}")
+    lines.append(f'print("module {i}", g{i})')
+    return "\n".join(lines)
+
+
+def main_file(module_count: int, version: int) -> str:
+    lines = []
+    for i in range(module_count):
+        lines.append(f'import "lib/m{i}.rn"')
+        lines.append(f"r{i} = m{i}_f{i % 10}({i + version if i == module_count // 2 else i})")
+    lines.append("fn tick {\n    r0 += 1\n}")
+    return "\n".join(lines)
+
+
+def generate(root: str, module_count: int):
+    os.makedirs(os.path.join(root, "lib"))
+    for i in range(module_count):
+        with open(os.path.join(root, "lib", f"m{i}.rn"), "w") as file:
+            file.write(module(i, 0))
+    with open(os.path.join(root, "lib", "common.rn"), "w") as file:
+        file.write("fn common(int v) {\n    return v * 7 % 5\n}")
+    with open(os.path.join(root, "lib", "tp.mcfunction"), "w") as file:
+        file.write("tp @s ~ ~1 ~")
+    with open(os.path.join(root, "main.rn"), "w") as file:
+        file.write(main_file(module_count, 0))
+
+
+def build(root: str, parse_cache: ParseCache, module_cache: ModuleCache | None):
+    reset_builtins()
+    main = os.path.join(root, "main.rn")
+    with open(main, "r") as file:
+        code = file.read()
+    if module_cache is not None:
+        module_cache.begin_build()
+    parse_cache.begin_build()
+    # the garbage of the previous build would be collected during this one
+    gc.collect()
+    start = perf_counter()
+    (statements, macros) = parse_cache.parse(code)
+    transpiler = Transpiler(statements, macros, pack_namespace=NAMESPACE, main_dir=root + "/", main_file_path=main,
+                            parse_cache=parse_cache, module_cache=module_cache)
+    files = transpiler.get_datapack_files()
+    return files, perf_counter() - start
+
+
+def main():
+    module_count = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    edits = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as root:
+        generate(root, module_count)
+        parse_cache = ParseCache(os.path.join(root, ".radon-cache"))
+        module_cache = ModuleCache()
+        build(root, parse_cache, module_cache)
+        print(f"Input: {module_count} modules, {module_count * 10} functions, {edits} edits")
+        (full, incremental, reused, failures) = ([], [], 0, 0)
+        for edit in range(edits):
+            # an edit of the main file, in the middle of it, or of a module
+            if edit % 4 == 0:
+                (pt, code) = ("main.rn", main_file(module_count, edit + 1))
+            else:
+                i = rng.randrange(module_count)
+                (pt, code) = (f"lib/m{i}.rn", module(i, edit + 1))
+            with open(os.path.join(root, pt), "w") as file:
+                file.write(code)
+            (after, took) = build(root, parse_cache, module_cache)
+            incremental.append(took)
+            reused += module_cache.hits
+            (before, took) = build(root, parse_cache, None)
+            full.append(took)
+            if after != before:
+                failures += 1
+                print(f"Different output after editing {pt}")
+        full.sort()
+        incremental.sort()
+        print(f"Every module transpiled: {full[len(full) // 2]:.4f}s median")
+        print(f"Modules before the edit reused: {incremental[len(incremental) // 2]:.4f}s median, "
+              f"{reused / edits:.1f} modules reused per build")
+        print(f"Equivalence: {failures} builds differ")
+
+
+if __name__ == "__main__":
+    main()
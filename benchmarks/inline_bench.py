@@ -0,0 +1,156 @@
+# Measures how many commands and function calls the programs run before and after inlining (-O), on the examples of the
+# guide and on generated programs full of small helper functions, and checks that the programs still do the same thing:
+# the load function and every other function that isn't generated is run after the load function, before and after
+# inlining, and before and after all the optimizations of -O, by the interpreter of constants_bench.py.
+# Usage: python benchmarks/inline_bench.py [functions] [runs]
+import os
+import random
+import re
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from constants_bench import StorageMachine  # noqa: E402
+from peephole_bench import examples, generate  # noqa: E402
+from registers_bench import TEMP  # noqa: E402
+from radon.dp_ast import parse_str  # noqa: E402
+from radon.error import RadonError  # noqa: E402
+from radon.constants import ConstantPropagator  # noqa: E402
+from radon.inliner import Inliner  # noqa: E402
+from radon.ir import Execute, ScoreCondition  # noqa: E402
+from radon.optimizer import PeepholeOptimizer  # noqa: E402
+from radon.registers import RegisterAllocator, SlotAllocator  # noqa: E402
+from radon.transpiler import MERGEABLE_FOLDERS, Transpiler, reset_builtins  # noqa: E402
+
+NAMESPACE = "mypack"
+# the temporary storage paths, which are renamed by the slot allocation
+TEMP_STORAGE = "storage " + NAMESPACE + ":radon.temp "
+SLOT = re.compile(r"(?<![\w.(])(?:_\d+|s\d+)(?!\w)")
+
+
+def generate_helpers(fn_count: int) -> str:
+    # small functions called from bigger ones
+    lines = []
+    for i in range(fn_count):
+        lines.append(f"fn wrap{i}(int v) {{\n    return v % {i + 7}\n}}")
+        lines.append(f"fn mid{i}(int a, int b) {{\n    return a + (b - a) / 2\n}}")
+        lines.append(f"fn step{i}(int x) {{\n    s = wrap{i}(x)\n    s += mid{i}(x, {i})\n    print(s)\n"
+                     f"    return s + wrap{i}(s)\n}}")
+        lines.append(f"r{i} = step{i}({i}) + mid{i}({f'r{i - 1}' if i > 0 else 1}, 3)")
+    return "\n".join(lines)
+
+
+class CountingMachine(StorageMachine):
+    """
+    Counts the function calls, and doesn't show the temporary scores, the temporary paths and the __returned__ flag,
+    whose names and values the optimizations change. The commands that mention them record their values instead.
+    """
+
+    def __init__(self, files, scores) -> None:
+        super().__init__(files, scores)
+        self.calls = 0
+
+    def visible(self):
+        res = {k: v for (k, v) in self.scores.items()
+               if not (k.endswith(" __temp__") and (TEMP.match(k) or k.startswith("__returned__ ")))}
+        res.update({("storage", k): v for (k, v) in self.storage.items() if not k.startswith(TEMP_STORAGE)})
+        return res
+
+    def event(self, cmd) -> int:
+        if isinstance(cmd, Execute):
+            text = " ".join(str(c) for c in cmd.clauses if not isinstance(c, ScoreCondition)) + f" run {cmd.run}"
+        else:
+            text = str(cmd)
+        values = [self.get(f"{name} __temp__") for name in TEMP.findall(text)]
+        values += [self.read(TEMP_STORAGE + name) for name in SLOT.findall(text)]
+        key = SLOT.sub("#", TEMP.sub("_", text))
+        self.trace.append((key, values, self.visible()))
+        return random.Random(key).randint(-1000, 1000)
+
+    def call(self, name: str):
+        self.calls += 1
+        return super().call(name)
+
+
+def run_program(files, name, scores, machine_type=CountingMachine):
+    machine = machine_type(files, scores)
+    try:
+        machine.call("__load__")
+        if name != "__load__":
+            machine.call(name)
+    except RecursionError:
+        # inlining changes how many commands run before it stops
+        return None, machine.steps, machine.calls
+    return machine.trace + [("end", [], machine.visible())], machine.steps, machine.calls
+
+
+def check(before, after, runs: int, stage: str, machine_type=CountingMachine, skip=()) -> (int, int, int, int, int):
+    # returns the functions that differ and the commands and calls the runs made before and after
+    (failures, steps, calls) = (0, [0, 0], [0, 0])
+    for name in sorted(before):
+        if name not in after or name.startswith(MERGEABLE_FOLDERS) or name in skip:
+            continue
+        scores = set()
+        for cmd in before[name]:
+            scores.update(cmd.score_reads() | cmd.score_writes())
+        for seed in range(runs):
+            rnd = random.Random(seed)
+            start = {score: rnd.randint(-1000, 1000) for score in sorted(scores)}
+            (trace_before, steps_before, calls_before) = run_program(before, name, start, machine_type)
+            (trace_after, steps_after, calls_after) = run_program(after, name, start, machine_type)
+            if trace_before is None or trace_after is None:
+                continue
+            if trace_before != trace_after:
+                print(f"Not equivalent after {stage}: {name}")
+                failures += 1
+                break
+            if seed == 0:
+                steps[0] += steps_before
+                steps[1] += steps_after
+                calls[0] += calls_before
+                calls[1] += calls_after
+    return failures, steps[0], steps[1], calls[0], calls[1]
+
+
+def main():
+    fn_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    programs = list(examples()) + [generate(fn_count), generate_helpers(fn_count // 4)]
+    (inlined, failures, took) = (0, 0, 0.0)
+    totals = [0, 0, 0, 0]
+    for code in programs:
+        try:
+            reset_builtins()
+            transpiler = Transpiler(*parse_str(code), pack_namespace=NAMESPACE)
+        except (RadonError, RecursionError):
+            # some of the examples are only parts of a program, or don't build yet
+            continue
+        files = transpiler.files
+        # the functions are the files the transpiler found the declarations of
+        functions = {f.file_name: (f.name, f.inline) for f in transpiler.functions
+                     if f.type == "radon" and f.file_name in files}
+        after = {name: list(cmds) for (name, cmds) in files.items()}
+        inliner = Inliner(NAMESPACE)
+        start = perf_counter()
+        inlined += inliner.inline(after, functions)
+        took += perf_counter() - start
+        res = check(files, after, runs, "inlining")
+        failures += res[0]
+        for i in range(4):
+            totals[i] += res[i + 1]
+        # the rest of the passes of -O
+        optimized = {name: list(cmds) for (name, cmds) in after.items()}
+        ConstantPropagator(NAMESPACE, MERGEABLE_FOLDERS).propagate(optimized)
+        PeepholeOptimizer().optimize(optimized)
+        RegisterAllocator(NAMESPACE).allocate(optimized)
+        SlotAllocator(NAMESPACE).allocate(optimized)
+        failures += check(files, optimized, runs, "-O")[0]
+    print(f"Input: {len(programs)} programs")
+    print(f"Inlined: {inlined} calls in {took:.4f}s")
+    print(f"Commands run: {totals[0]} -> {totals[1]}, function calls: {totals[2]} -> {totals[3]}")
+    print(f"Equivalence: {failures} functions differ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+# Measures #define expansion with many macros over a large token stream.
+# Usage: python benchmarks/macro_bench.py [macros] [tokens]
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from radon.tokenizer import _tokenize, apply_macros  # noqa: E402
+
+
+def generate(macro_count: int, token_count: int) -> str:
+    header = "".join(f"#define CONST_{i} {i}\n" for i in range(macro_count))
+    # every line is "x = CONST_i + y\n", 6 tokens
+    body = "".join(f"x = CONST_{i % macro_count} + y\n" for i in range(token_count // 6))
+    return header + body
+
+
+def main():
+    macro_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    token_count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    tokens, macros = _tokenize(generate(macro_count, token_count))
+    print(f"Input: {len(macros)} macros, {len(tokens)} tokens")
+    best = None
+    for _ in range(3):
+        start = perf_counter()
+        result = apply_macros(tokens, macros)
+        took = perf_counter() - start
+        best = took if best is None else min(best, took)
+    print(f"apply_macros: {len(result)} tokens in {best:.4f}s ({len(tokens) / best:,.0f} tokens/s)")
+
+
+if __name__ == "__main__":
+    main()
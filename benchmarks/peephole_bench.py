@@ -0,0 +1,197 @@
+# Measures how many commands the peephole optimizer (-O) removes from the examples of the guide and from a generated
+# program, and checks that the optimized functions are equivalent: every function file is run before and after
+# optimizing by a small scoreboard interpreter, from the same random scores, and has to leave the same scores behind and
+# reach its other commands with the same scores.
+# Usage: python benchmarks/peephole_bench.py [functions] [runs]
+import glob
+import os
+import random
+import re
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from radon.dp_ast import parse_str  # noqa: E402
+from radon.error import RadonError  # noqa: E402
+from radon.ir import (DataGet, Execute, Return, ScoreCondition, ScoreGet, ScoreLiteral, ScoreOperation,  # noqa: E402
+                      Store)
+from radon.optimizer import PeepholeOptimizer, is_temp  # noqa: E402
+from radon.transpiler import Transpiler, reset_builtins  # noqa: E402
+
+DOCS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "docs", "guide")
+INT_MIN = -2 ** 31
+
+OPS = {
+    "+=": lambda a, b: a + b,
+    "-=": lambda a, b: a - b,
+    "*=": lambda a, b: a * b,
+    # scoreboard division and modulo round towards negative infinity, and leave the score alone when dividing by 0
+    "/=": lambda a, b: a if b == 0 else a // b,
+    "%=": lambda a, b: a if b == 0 else a % b,
+    "<": min,
+    ">": max,
+}
+COMPARE = {
+    "<": lambda a, b: a < b, "<=": lambda a, b: a <= b, "=": lambda a, b: a == b,
+    ">=": lambda a, b: a >= b, ">": lambda a, b: a > b,
+}
+
+
+def wrap(v: int) -> int:
+    return (v - INT_MIN) % 2 ** 32 + INT_MIN
+
+
+def generate(fn_count: int) -> str:
+    lines = []
+    for i in range(fn_count):
+        lines.append(f"fn f{i}(int x) {{\n    y = x * {i + 2} + {i}\n    z = (y - x) % 7 + y / 3\n"
+                     f"    if (z > {i}) {{ return z - y }}\n    return z + x * 2\n}}")
+        lines.append(f"r{i} = f{i}({i}) + f{i}({f'r{i - 1}' if i > 0 else i} * 3)")
+    return "\n".join(lines)
+
+
+def examples():
+    for pt in sorted(glob.glob(os.path.join(DOCS, "*.md"))):
+        with open(pt) as file:
+            for code in re.findall(r"```js(?: \[Radon])?\n(.*?)```", file.read(), re.S):
+                yield code
+
+
+class Machine:
+    """
+    Runs the score commands of a function. The other commands are events: the scores that other functions and the
+    player can see are recorded when one of them is reached, and their scores are made up.
+    """
+
+    def __init__(self, scores, hidden) -> None:
+        self.scores = dict(scores)
+        self.data = {}
+        self.hidden = hidden
+        self.trace = []
+
+    def get(self, score: str) -> int:
+        if score not in self.scores:
+            # the same made up value in both runs
+            self.scores[score] = random.Random(score).randint(-1000, 1000)
+        return self.scores[score]
+
+    def visible(self):
+        return {k: v for (k, v) in self.scores.items() if k not in self.hidden}
+
+    def event(self, cmd) -> int:
+        self.trace.append((str(cmd), self.visible()))
+        return random.Random(str(cmd)).randint(-1000, 1000)
+
+    def run(self, cmd) -> bool:
+        # returns False when the function returns
+        if isinstance(cmd, ScoreLiteral):
+            v = self.get(cmd.target) if cmd.op != "set" else 0
+            self.scores[cmd.target] = wrap(v + cmd.value if cmd.op != "remove" else v - cmd.value)
+        elif isinstance(cmd, ScoreOperation):
+            if cmd.op == "=":
+                self.scores[cmd.target] = self.get(cmd.source)
+            elif cmd.op == "><":
+                (self.scores[cmd.target], self.scores[cmd.source]) = (self.get(cmd.source), self.get(cmd.target))
+            else:
+                self.scores[cmd.target] = wrap(OPS[cmd.op](self.get(cmd.target), self.get(cmd.source)))
+        elif isinstance(cmd, ScoreGet):
+            return self.get(cmd.source)
+        elif isinstance(cmd, DataGet):
+            if cmd.source in self.data and cmd.scale is None:
+                return self.data[cmd.source]
+            return random.Random(str(cmd)).randint(-1000, 1000)
+        elif isinstance(cmd, Return):
+            if cmd.run is not None:
+                self.run(cmd.run)
+            return False
+        elif isinstance(cmd, Execute):
+            return self.execute(cmd)
+        else:
+            self.data.clear()
+            return self.event(cmd)
+        return True
+
+    def execute(self, cmd: Execute):
+        for clause in cmd.clauses:
+            if isinstance(clause, ScoreCondition):
+                v = self.get(clause.target)
+                if clause.op == "matches":
+                    (low, _, high) = clause.value.partition("..")
+                    ok = (low == "" or v >= int(low)) and (high == "" or v <= int(high)) if ".." in clause.value \
+                        else v == int(clause.value)
+                else:
+                    ok = COMPARE[clause.op](v, self.get(clause.value))
+                if ok == clause.negate:
+                    return True
+            elif not isinstance(clause, Store):
+                self.event(cmd)
+                return True
+        res = self.run(cmd.run) if cmd.run is not None else True
+        if res is False:
+            return False
+        for clause in cmd.stores:
+            value = int(res) if clause.mode == "result" else 1
+            if clause.is_score:
+                self.scores[clause.target] = value
+            else:
+                self.data[clause.target] = value
+        return True
+
+
+def run_file(cmds, scores, hidden):
+    machine = Machine(scores, hidden)
+    for cmd in cmds:
+        if machine.run(cmd) is False:
+            break
+    return machine.trace + [("end", machine.visible())]
+
+
+def check(before, after, users, runs: int) -> int:
+    failures = 0
+    for name in before:
+        hidden = set(score for (score, files) in users.items() if files == {name} and is_temp(score))
+        scores = set()
+        for cmd in before[name]:
+            scores.update(cmd.score_reads() | cmd.score_writes())
+        for seed in range(runs):
+            rnd = random.Random(seed)
+            start = {score: rnd.randint(-1000, 1000) for score in sorted(scores)}
+            if run_file(before[name], start, hidden) != run_file(after[name], start, hidden):
+                print(f"Not equivalent: {name}")
+                failures += 1
+                break
+    return failures
+
+
+def main():
+    fn_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    programs = list(examples()) + [generate(fn_count)]
+    (before_count, after_count, failures, took) = (0, 0, 0, 0.0)
+    counts = {}
+    for code in programs:
+        try:
+            reset_builtins()
+            before = Transpiler(*parse_str(code)).files
+        except (RadonError, RecursionError):
+            # some of the examples are only parts of a program, or don't build yet
+            continue
+        after = {name: list(cmds) for (name, cmds) in before.items()}
+        optimizer = PeepholeOptimizer()
+        start = perf_counter()
+        optimizer.optimize(after)
+        took += perf_counter() - start
+        for (name, count) in optimizer.counts.items():
+            counts[name] = counts.get(name, 0) + count
+        before_count += sum(len(cmds) for cmds in before.values())
+        after_count += sum(len(cmds) for cmds in after.values())
+        failures += check(before, after, optimizer.users, runs)
+    print(f"Input: {len(programs)} programs, {before_count} commands")
+    print(f"Optimized: {after_count} commands ({before_count - after_count} removed) in {took:.4f}s")
+    print("Rewrites: " + ", ".join(f"{name} {count}" for (name, count) in counts.items()))
+    print(f"Equivalence: {failures} functions differ")
+
+
+if __name__ == "__main__":
+    main()
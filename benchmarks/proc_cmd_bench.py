@@ -0,0 +1,56 @@
+# Measures processing raw commands, most of them without any interpolation, like the execute and tellraw lines of a
+# hand written pack.
+# Usage: python benchmarks/proc_cmd_bench.py [commands]
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from radon.dp_ast import parse_str  # noqa: E402
+from radon.tokenizer import Token, TokenType  # noqa: E402
+from radon.transpiler import Transpiler, TranspilerContext  # noqa: E402
+
+
+def generate(cmd_count: int):
+    cmds = []
+    for i in range(cmd_count):
+        if i % 20 == 0:
+            cmds.append(f"tellraw @a [\"Score {i}: \",$str(a)]")
+        elif i % 20 == 10:
+            cmds.append(f"scoreboard players set @s points $dstr(a + {i})")
+        elif i % 2 == 0:
+            cmds.append(
+                f"execute as @a[tag=player_{i},scores={{points=1..}}] at @s positioned ~ ~1 ~ "
+                f"if block ~ ~-1 ~ minecraft:stone run summon minecraft:armor_stand ~ ~ ~ {{Tags:[\"m{i}\"]}}"
+            )
+        else:
+            cmds.append(
+                f"tellraw @a [{{\"text\":\"Line {i} \",\"color\":\"gold\"}},"
+                f"{{\"selector\":\"@s\",\"color\":\"aqua\",\"bold\":true}}]"
+            )
+    return cmds
+
+
+def main():
+    cmd_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    cmds = generate(cmd_count)
+    transpiler = Transpiler(*parse_str("a = 5"))
+    ctx = TranspilerContext(
+        transpiler=transpiler,
+        file_name="__main__",
+        file=[],
+        radon_path="main.rn",
+        function=None,
+        loop=None
+    )
+    print(f"Input: {cmd_count} commands")
+    start = perf_counter()
+    for cmd in cmds:
+        transpiler.proc_cmd(ctx, cmd, Token(cmd, TokenType.POINTER, 0, len(cmd)))
+    took = perf_counter() - start
+    print(f"proc_cmd: {took:.4f}s")
+
+
+if __name__ == "__main__":
+    main()
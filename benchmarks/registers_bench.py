@@ -0,0 +1,206 @@
+# Measures how many distinct temporary scores and radon.temp storage paths the register and slot allocations (-O)
+# leave in the examples of the guide and in generated programs, and checks that the programs still do the same thing:
+# every function file is run before and after the allocations by the scoreboard interpreter of peephole_bench.py,
+# following the function calls, and has to reach its other commands with the same values.
+# Usage: python benchmarks/registers_bench.py [functions] [runs]
+import os
+import random
+import re
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from peephole_bench import Machine, examples, generate  # noqa: E402
+from radon.dp_ast import parse_str  # noqa: E402
+from radon.error import RadonError  # noqa: E402
+from radon.ir import DataGet, DataModify, DataRemove, Execute, FunctionCall, Return  # noqa: E402
+from radon.optimizer import PeepholeOptimizer  # noqa: E402
+from radon.registers import RegisterAllocator, SlotAllocator  # noqa: E402
+from radon.transpiler import Transpiler, reset_builtins  # noqa: E402
+
+NAMESPACE = "mypack"
+COMPOUND = "temps"
+# the temporary scores and the registers, the names the allocation changes
+TEMP = re.compile(r"(?<![\w.])(?:(?:int|float)_\d+|r\d+)(?!\w)")
+# the temporary paths and the slots
+SLOT = re.compile(r"(?<![\w.(])(?:_\d+|(?:" + COMPOUND + r"\.)?s\d+)(?!\w)")
+SLOT_LOCATION = re.compile(r"storage " + NAMESPACE + r":radon\.temp (_\d+|(?:" + COMPOUND + r"\.)?s\d+)(?!\w)")
+MAX_STEPS = 20000
+
+
+def generate_calls(fn_count: int) -> str:
+    # functions that keep temporary scores while calling each other
+    lines = ["fn h0(int x) {\n    return x * 3 + 1\n}"]
+    for i in range(1, fn_count):
+        lines.append(f"fn h{i}(int x) {{\n    a = x * 2 + h{i - 1}(x + {i}) * 3\n"
+                     f"    return (x + {i}) * (a - h{i - 1}(a % 5)) + x * 4\n}}")
+    lines.append(f"print(h{fn_count - 1}(2) + h{fn_count // 2}(3) * 2)")
+    return "\n".join(lines)
+
+
+def generate_slots(fn_count: int) -> str:
+    # functions that keep temporary storage paths while calling each other
+    lines = [f"arr = [{', '.join(str(i) for i in range(fn_count * 4))}]", 's = "hello world"',
+             "fn p0(int x) {\n    return arr.pop() + x\n}"]
+    for i in range(1, fn_count):
+        lines.append(f"fn p{i}(int x) {{\n    a = arr.pop() + x\n    b = arr.pop() + p{i - 1}(a)\n"
+                     f"    t = s.substr({i % 5}, {i % 5 + 3})\n    print(t)\n    return a + b\n}}")
+    lines.append(f"print(p{fn_count - 1}(2) + p{fn_count // 2}(3))")
+    return "\n".join(lines)
+
+
+class ProgramMachine(Machine):
+    """
+    Runs the calls of the functions of the pack too. The temporary scores and paths aren't visible, the commands that
+    read them record their values instead of their names. The values of the paths are the commands that made them.
+    """
+
+    def __init__(self, files, scores) -> None:
+        super().__init__(scores, set())
+        self.files = files
+        self.steps = 0
+        # slot -> value
+        self.slots = {}
+
+    def visible(self):
+        return {k: v for (k, v) in self.scores.items() if not TEMP.match(k) or not k.endswith(" __temp__")}
+
+    def event(self, cmd) -> int:
+        text = str(cmd)
+        values = [self.get(f"{name} __temp__") for name in TEMP.findall(text)]
+        values += [self.slots.get(name, ("unset", name)) for name in SLOT.findall(text)]
+        key = SLOT.sub("#", TEMP.sub("_", text))
+        self.trace.append((key, values, self.visible()))
+        return random.Random(key).randint(-1000, 1000)
+
+    def value(self, location: str):
+        match = SLOT_LOCATION.match(location)
+        if match is None:
+            # the other data can change when the other commands run
+            return "data", location, len(self.trace)
+        value = self.slots.get(match.group(1), ("unset", match.group(1)))
+        return value if match.end() == len(location) else (value, location[match.end():])
+
+    def run(self, cmd):
+        if isinstance(cmd, FunctionCall) and cmd.source is None and cmd.name.startswith(NAMESPACE + ":"):
+            return self.call(cmd.name[len(NAMESPACE) + 1:])
+        if isinstance(cmd, DataGet) and SLOT_LOCATION.match(cmd.source):
+            value = self.value(cmd.source)
+            return value if isinstance(value, int) and cmd.scale is None \
+                else random.Random(repr((value, cmd.scale))).randint(-1000, 1000)
+        if isinstance(cmd, DataRemove) and cmd.target == f"storage {NAMESPACE}:radon.temp {COMPOUND}":
+            self.slots = {k: v for (k, v) in self.slots.items() if not k.startswith(COMPOUND + ".")}
+            return True
+        if isinstance(cmd, (DataModify, DataRemove)) and SLOT_LOCATION.match(cmd.target):
+            match = SLOT_LOCATION.match(cmd.target)
+            (slot, path) = (match.group(1), cmd.target[match.end():])
+            if isinstance(cmd, DataRemove):
+                if path == "":
+                    self.slots.pop(slot, None)
+                else:
+                    self.slots[slot] = (self.slots.get(slot, ("unset", slot)), "remove", path)
+                return True
+            source = cmd.source if cmd.kind == "value" else self.value(cmd.source)
+            if path == "" and cmd.mode == "set":
+                self.slots[slot] = (cmd.kind, source, cmd.bounds)
+            else:
+                self.slots[slot] = (self.slots.get(slot, ("unset", slot)), cmd.mode, path, cmd.kind, source,
+                                    cmd.bounds)
+            return True
+        res = super().run(cmd)
+        if isinstance(cmd, Execute):
+            # the values stored to the paths
+            for clause in cmd.stores:
+                match = SLOT_LOCATION.fullmatch(clause.target)
+                if match is not None and clause.target in self.data:
+                    self.slots[match.group(1)] = self.data.pop(clause.target)
+        return res
+
+    def call(self, name: str):
+        if name not in self.files:
+            return self.event(name)
+        for cmd in self.files[name]:
+            self.steps += 1
+            if self.steps > MAX_STEPS:
+                raise RecursionError
+            if isinstance(cmd, Return):
+                if cmd.run is not None:
+                    return self.run(cmd.run)
+                return cmd.value
+            if self.run(cmd) is False:
+                # a return behind an execute
+                break
+        return 0
+
+
+def run_program(files, name, scores):
+    machine = ProgramMachine(files, scores)
+    try:
+        machine.call(name)
+    except RecursionError:
+        # both runs stop after the same number of commands
+        machine.trace.append(("stopped", [], {}))
+    return machine.trace + [("end", [], machine.visible())]
+
+
+def check(before, after, runs: int) -> int:
+    failures = 0
+    for name in before:
+        scores = set()
+        for cmd in before[name]:
+            scores.update(cmd.score_reads() | cmd.score_writes())
+        for seed in range(runs):
+            rnd = random.Random(seed)
+            start = {score: rnd.randint(-1000, 1000) for score in sorted(scores)}
+            if run_program(before, name, start) != run_program(after, name, start):
+                print(f"Not equivalent: {name}")
+                failures += 1
+                break
+    return failures
+
+
+def main():
+    fn_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    programs = list(examples()) + [generate(fn_count), generate_calls(fn_count // 20), generate_slots(fn_count // 20)]
+    # [distinct names before, after, the most used by a call tree, seconds] for the scores and the paths
+    stats = {"scores": [0, 0, 0, 0.0], "paths": [0, 0, 0, 0.0]}
+    (removes, failures) = (0, 0)
+    for code in programs:
+        try:
+            reset_builtins()
+            files = Transpiler(*parse_str(code), pack_namespace=NAMESPACE).files
+        except (RadonError, RecursionError):
+            # some of the examples are only parts of a program, or don't build yet
+            continue
+        PeepholeOptimizer().optimize(files)
+        for (kind, allocator) in (("scores", RegisterAllocator(NAMESPACE)), ("paths", SlotAllocator(NAMESPACE)),
+                                  (None, SlotAllocator(NAMESPACE, COMPOUND))):
+            after = {name: list(cmds) for (name, cmds) in files.items()}
+            start = perf_counter()
+            (count_before, count_after) = allocator.allocate(after)
+            took = perf_counter() - start
+            failures += check(files, after, runs)
+            if kind is None:
+                continue
+            stat = stats[kind]
+            stat[0] += count_before
+            stat[1] += count_after
+            stat[2] = max([stat[2]] + [len(c) for c in allocator.clobbers.values()])
+            stat[3] += took
+            if kind == "paths":
+                removes += allocator.removes
+            else:
+                # the slots are allocated after the registers
+                files = after
+    print(f"Input: {len(programs)} programs")
+    for (kind, stat) in stats.items():
+        print(f"Temporary {kind}: {stat[0]} -> {stat[1]} distinct names, at most {stat[2]} per call tree, "
+              f"in {stat[3]:.4f}s")
+    print(f"Slot removes added: {removes}")
+    print(f"Equivalence: {failures} functions differ")
+
+
+if __name__ == "__main__":
+    main()
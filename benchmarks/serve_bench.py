@@ -0,0 +1,94 @@
+# Measures the rebuild latency of a project through the build server, compared to running the build command.
+# Usage: python benchmarks/serve_bench.py [modules] [rebuilds]
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+from time import perf_counter, sleep
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+
+def module(i: int, version: int) -> str:
+    return "\n".join(
+        f"fn m{i}_f{j}(int x) {{\n    if (x > {j}) {{ return x * {j + version} }}\n    return x + {j}\n}}"
+        for j in range(20)
+    )
+
+
+def generate(root: str, module_count: int):
+    os.makedirs(os.path.join(root, "src", "lib"))
+    os.makedirs(os.path.join(root, "out"))
+    main = []
+    for i in range(module_count):
+        with open(os.path.join(root, "src", "lib", f"m{i}.rn"), "w") as file:
+            file.write(module(i, 0))
+        main.append(f'import "lib/m{i}.rn"')
+        main.append(f"r{i} = m{i}_f0({i})")
+    with open(os.path.join(root, "src", "main.rn"), "w") as file:
+        file.write("\n".join(main))
+    with open(os.path.join(root, "radon.json"), "w") as file:
+        file.write(json.dumps({
+            "namespace": "bench", "description": "", "format": "1.21", "main": "src/main.rn",
+            "outFolder": "out", "removeBeforeBuild": None
+        }))
+
+
+def request(sock_path: str, obj) -> dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(sock_path)
+        file = sock.makefile("rwb")
+        file.write((json.dumps(obj) + "\n").encode())
+        file.flush()
+        return json.loads(file.readline())
+
+
+def timed_request(sock_path: str, obj) -> float:
+    start = perf_counter()
+    res = request(sock_path, obj)
+    if not res["ok"]:
+        raise RuntimeError(res["error"])
+    return perf_counter() - start
+
+
+def main():
+    module_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    rebuilds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    env = dict(os.environ, PYTHONPATH=SRC)
+    with tempfile.TemporaryDirectory() as root:
+        project = os.path.join(root, "project")
+        generate(project, module_count)
+        print(f"Input: {module_count} modules, {module_count * 20} functions")
+
+        start = perf_counter()
+        subprocess.run([sys.executable, "-m", "radon", "build", "-d", project], env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        print(f"radon build: {perf_counter() - start:.4f}s")
+
+        sock_path = os.path.join(root, "radon.sock")
+        server = subprocess.Popen([sys.executable, "-m", "radon", "serve", "--socket", sock_path], env=env,
+                                  stdout=subprocess.DEVNULL)
+        try:
+            while not os.path.exists(sock_path):
+                sleep(0.01)
+            print(f"serve, first build: {timed_request(sock_path, {'project': project}):.4f}s")
+            times = sorted(timed_request(sock_path, {"project": project}) for _ in range(rebuilds))
+            print(f"serve, unchanged: {times[len(times) // 2]:.4f}s median of {rebuilds}")
+            times = []
+            leaf = os.path.join(project, "src", "lib", "m0.rn")
+            for i in range(rebuilds):
+                # changes a function's body, the generated file names stay the same
+                with open(leaf, "w") as file:
+                    file.write(module(0, i + 1))
+                times.append(timed_request(sock_path, {"project": project}))
+            times.sort()
+            print(f"serve, one module edited: {times[len(times) // 2]:.4f}s median of {rebuilds}")
+            request(sock_path, {"command": "shutdown"})
+        finally:
+            server.wait(10)
+
+
+if __name__ == "__main__":
+    main()
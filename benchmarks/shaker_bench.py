@@ -0,0 +1,71 @@
+# Measures how many function files, and how many bytes of them, the removal of the unused functions (-O) leaves out of
+# the examples of the guide and of generated programs that define more functions than they use, and checks that the
+# programs still do the same thing: the load function and every function that is kept are run after the load function,
+# before and after, by the interpreter of inline_bench.py.
+# Usage: python benchmarks/shaker_bench.py [functions] [runs]
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from inline_bench import check  # noqa: E402
+from peephole_bench import examples, generate  # noqa: E402
+from radon.dp_ast import parse_str  # noqa: E402
+from radon.error import RadonError  # noqa: E402
+from radon.ir import render  # noqa: E402
+from radon.shaker import TreeShaker  # noqa: E402
+from radon.transpiler import Transpiler, reset_builtins  # noqa: E402
+
+NAMESPACE = "mypack"
+
+
+def generate_library(fn_count: int) -> str:
+    # a library of functions of which a few are used, one is exported and some only call each other
+    lines = []
+    for i in range(fn_count):
+        lines.append(f"fn lib{i}(int x) {{\n    y = x * {i + 2}\n    print(y)\n    return y + Math.sqrt(x)\n}}")
+    for i in range(fn_count):
+        lines.append(f"fn chain{i}(int x) {{\n    return lib{i}(x) + lib{(i + 1) % fn_count}(x)\n}}")
+    lines.append("@export\nfn api() {\n    print(chain0(1))\n}")
+    lines.append("Listener.on(\"die\", () => {\n    print(lib1(3))\n})")
+    lines.append(f"r = lib0(5) + lib{fn_count // 2}(6)")
+    return "\n".join(lines)
+
+
+def size(files) -> int:
+    return sum(len(render(cmds).encode()) for cmds in files.values())
+
+
+def main():
+    fn_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    programs = list(examples()) + [generate(fn_count), generate_library(fn_count)]
+    (failures, took) = (0, 0.0)
+    totals = [0, 0, 0, 0]
+    for code in programs:
+        try:
+            reset_builtins()
+            transpiler = Transpiler(*parse_str(code), pack_namespace=NAMESPACE)
+        except (RadonError, RecursionError):
+            # some of the examples are only parts of a program, or don't build yet
+            continue
+        files = transpiler.files
+        after = {name: list(cmds) for (name, cmds) in files.items()}
+        roots = {"__load__", "tick"} | set(f.file_name for f in transpiler.functions if f.export)
+        start = perf_counter()
+        TreeShaker(NAMESPACE).shake(after, roots | transpiler._referenced_files())
+        took += perf_counter() - start
+        failures += check(files, after, runs, "removing the unused functions")[0]
+        totals[0] += len(files)
+        totals[1] += len(after)
+        totals[2] += size(files)
+        totals[3] += size(after)
+    print(f"Input: {len(programs)} programs")
+    print(f"Function files: {totals[0]} -> {totals[1]} in {took:.4f}s")
+    print(f"Bytes: {totals[2]} -> {totals[3]}")
+    print(f"Equivalence: {failures} functions differ")
+
+
+if __name__ == "__main__":
+    main()
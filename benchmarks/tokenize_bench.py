@@ -0,0 +1,65 @@
+# Measures the lexer throughput and peak memory on large generated .rn files.
+# Usage: python benchmarks/tokenize_bench.py [lines] [nesting]
+import os
+import sys
+import tracemalloc
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from radon.tokenizer import _tokenize, tokenize  # noqa: E402
+
+SAMPLE = """fn add_{i}(int a, int b): int {{
+    return a + b * {i}
+}}
+// comment {i}
+value_{i} = add_{i}(-{i}, 3.5) is not 2 and @a
+score:@s += value_{i}
+if (value_{i} >= 10 && value_{i} <= 20) {{ print("value is " + value_{i}) }}
+execute as @a at @s run say hello $(value_{i})
+"""
+
+
+def generate(lines: int) -> str:
+    chunk_lines = SAMPLE.count("\n")
+    return "".join(SAMPLE.format(i=i) for i in range(max(1, lines // chunk_lines)))
+
+
+def generate_nested(lines: int, nesting: int) -> str:
+    body = generate(lines)
+    return "if (1) {\n" * nesting + body + "}\n" * nesting
+
+
+def bench(fn, code: str, repeat: int = 3):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        fn(code)
+        took = perf_counter() - start
+        best = took if best is None else min(best, took)
+    return best
+
+
+def peak_memory(fn, code: str):
+    tracemalloc.start()
+    result = fn(code)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    nesting = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    for label, code in (("flat", generate(lines)), (f"nested x{nesting}", generate_nested(lines, nesting))):
+        count = len(_tokenize(code)[0])
+        print(f"Input ({label}): {code.count(chr(10))} lines, {len(code)} characters, {count} tokens")
+        for name, fn in (("_tokenize", _tokenize), ("tokenize", tokenize)):
+            took = bench(fn, code)
+            peak = peak_memory(fn, code) / 1024 / 1024
+            print(f"{name:>10}: {count} tokens in {took:.4f}s ({count / took:,.0f} tokens/s), peak {peak:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# Measures how many commands and function calls the programs run before and after their for loops are unrolled, on
+# the examples of the guide and on generated programs full of loops that run a known number of times, and checks that
+# the programs still do the same thing: the load function and every other function is run after the load function,
+# before and after the loops are unrolled with the unroll hint, and before and after all the optimizations of -O, which
+# decide which loops to unroll by themselves, by the interpreter of inline_bench.py.
+# Usage: python benchmarks/unroll_bench.py [functions] [runs]
+import os
+import re
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from arguments_bench import ArgumentMachine  # noqa: E402
+from inline_bench import check  # noqa: E402
+from peephole_bench import examples, generate  # noqa: E402
+from radon.dp_ast import parse_str  # noqa: E402
+from radon.error import RadonError  # noqa: E402
+from radon.ir import Raw  # noqa: E402
+from radon.transpiler import Transpiler, reset_builtins  # noqa: E402
+
+NAMESPACE = "mypack"
+FOR_LOOP = re.compile(r"\bfor\s*\(")
+# the flags of the loops, and the ones of the listeners, which are numbered differently by the first build
+FLAG = re.compile(r"__(?:break|continue)__\d+ __temp__|__event__\w+ __temp__")
+SCORE_TEXT = re.compile(r'\{"score":\{"name":"([^"]+)","objective":"([^"]+)"}}')
+
+
+def generate_loops(fn_count: int) -> str:
+    # loops with literal bounds: small ones, nested ones, ones that call functions and large ones, the functions are
+    # exported instead of all being called by the load function, which would run too many commands
+    lines = ["k = 0"]
+    for i in range(fn_count):
+        lines.append(f"fn weight{i}(int x) {{\n    return x * {i + 2} + k\n}}")
+        lines.append(f"@export\nfn sum{i}() {{\n    s = 0\n    for (k = 0; k < 6; k++) {{\n        s += k * k\n"
+                     f"        if (k % 2 == 0) {{ s += weight{i}(k) }}\n    }}\n    print(s)\n    return s\n}}")
+        lines.append(f"@export\nfn grid{i}(int n) {{\n    g = 0\n    for (a = 0; a < 3; a++) {{\n"
+                     f"        for (b = a; b <= 4; b += 2) {{\n            g += a * 10 + b + n\n        }}\n    }}\n"
+                     f"    print(g)\n}}")
+        lines.append(f"@export\nfn count{i}() {{\n    t = 0\n    for (j = 100; j > 0; j -= 3) {{\n        t += j % 7\n"
+                     f"        t *= 2\n        t %= 1000\n    }}\n    print(t)\n}}")
+        # the loops that can't be unrolled, a function they call or a command they run changes the variable
+        lines.append(f"fn bump{i}() {{\n    m = {i + 100}\n}}")
+        lines.append(f"@export\nfn early{i}() {{\n    for (m = 0; m < 5; m++) {{\n        print(m)\n"
+                     f"        bump{i}()\n    }}\n    for (m = 0; m < 3; m++) {{\n"
+                     f"        scoreboard players add m {NAMESPACE}.global {i + 2}\n        print(m)\n    }}\n}}")
+    lines.append("r = sum0()\ngrid0(r)\ncount0()")
+    return "\n".join(lines)
+
+
+class LoopMachine(ArgumentMachine):
+    """
+    Doesn't show the __break__ and __continue__ flags of the loops either, the loops that are unrolled don't have them,
+    and records the text a tellraw shows, a score that is known once the loop is unrolled is printed as a text. The
+    scores are only compared at the end, the variable of an unrolled loop only gets its last value.
+    """
+
+    def visible(self):
+        return {k: v for (k, v) in super().visible().items() if not (isinstance(k, str) and FLAG.fullmatch(k))}
+
+    def event(self, cmd) -> int:
+        text = str(cmd)
+        if text.startswith("tellraw "):
+            cmd = Raw(SCORE_TEXT.sub(lambda m: '{"text":"%d"}' % self.get(f"{m.group(1)} {m.group(2)}"), text))
+        res = super().event(cmd)
+        self.trace[-1] = self.trace[-1][:2]
+        return res
+
+
+def build(code: str, optimize: bool = False):
+    reset_builtins()
+    return Transpiler(*parse_str(code), pack_namespace=NAMESPACE, optimize=optimize)
+
+
+def main():
+    fn_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    programs = list(examples()) + [generate(fn_count), generate_loops(fn_count // 4)]
+    (unrolled, failures, took) = (0, 0, 0.0)
+    totals = [0, 0, 0, 0]
+    for code in programs:
+        try:
+            files = build(code).files
+            start = perf_counter()
+            transpiler = build(FOR_LOOP.sub("for unroll (", code))
+            took += perf_counter() - start
+            optimized = build(code, True).files
+        except (RadonError, RecursionError):
+            # some of the examples are only parts of a program, or don't build yet
+            continue
+        unrolled += transpiler.unrolled_loops
+        # the functions that take arguments only run when they are called
+        called = set(f.file_name for f in transpiler.functions if len(f.arguments) > 0)
+        res = check(files, transpiler.files, runs, "unrolling the loops", LoopMachine, called)
+        failures += res[0]
+        for i in range(4):
+            totals[i] += res[i + 1]
+        failures += check(files, optimized, runs, "-O", LoopMachine, called)[0]
+    print(f"Input: {len(programs)} programs")
+    print(f"Unrolled: {unrolled} loops, built in {took:.4f}s")
+    print(f"Commands run: {totals[0]} -> {totals[1]}, function calls: {totals[2]} -> {totals[3]}")
+    print(f"Equivalence: {failures} functions differ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Measures the CPU time watch mode spends while nothing changes, on a tree with many files.
+# Usage: python benchmarks/watch_idle_bench.py [files] [seconds]
+import os
+import sys
+import tempfile
+from time import process_time, sleep, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from radon.watcher import InotifyWatcher, PollingWatcher  # noqa: E402
+
+
+def generate(root: str, file_count: int):
+    for i in range(file_count):
+        folder = os.path.join(root, "src", "data", f"assets_{i // 100}")
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"file_{i}.json"), "w") as file:
+            file.write("{}")
+    with open(os.path.join(root, "radon.json"), "w") as file:
+        file.write("{}")
+
+
+def os_walk_polling(root: str, seconds: float):
+    # the previous watch_snapshot() loop
+    end = time() + seconds
+    while time() < end:
+        sleep(0.3)
+        files = []
+        for r, _, fs in os.walk(os.path.join(root, "src")):
+            for f in fs:
+                files.append(os.path.realpath(r + "/" + f))
+        _ = {f: os.path.getmtime(f) for f in files + [os.path.join(root, "radon.json")]}
+
+
+def measure(name: str, fn):
+    start = process_time()
+    fn()
+    took = process_time() - start
+    print(f"{name}: {took:.4f}s CPU")
+
+
+def main():
+    file_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    with tempfile.TemporaryDirectory() as root:
+        generate(root, file_count)
+        print(f"Input: {file_count} files, {seconds}s idle")
+        folders = [os.path.join(root, "src")]
+        files = [os.path.join(root, "radon.json")]
+        measure("os.walk polling", lambda: os_walk_polling(root, seconds))
+        polling = PollingWatcher(folders, files, [])
+        measure("scandir polling", lambda: polling.wait(seconds))
+        if sys.platform.startswith("linux"):
+            inotify = InotifyWatcher(folders, files, [])
+            measure("inotify", lambda: inotify.wait(seconds))
+            inotify.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,25 @@
+import io
 import json
 import os
 import platform
 import shutil
+import socket
 import sys
+import traceback
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
 from os import path
-from time import sleep, time
-from typing import Any
+from time import time
+from typing import Any, Dict, List
 
+from .cache import CACHE_FOLDER, CACHE_SIZE, BuildGraph, ModuleCache, ParseCache
 from .dp_ast import parse_str
 from .error import RadonError
-from .transpiler import Transpiler
-from .utils import VERSION_RADON, get_pack_format
+from .output import ManifestCache, data_folder_files, manifest_path, sync_output, write_zip
+from .transpiler import Transpiler, reset_builtins
+from .utils import VERSION_RADON, get_pack_format, reset_expr_id
+from .watcher import create_watcher
 
 BLACK = "\x1b[30m"
 RED = "\x1b[31m"
@@ -25,15 +33,27 @@ RESET = "\x1b[0m"
 GRAY = "\x1b[90m"
 
 
-# Usage: radon [build|watch|version] (-d="cwd") (-b)
+# Usage: radon [build|watch|serve|version] (-d="cwd") (-b) (-O) (-j=1) (--full) (--debounce=100) (--zip) (--socket=path)
 
 class RadonArgumentParser(ArgumentParser):
     def __init__(self):
         super().__init__()
-        self.add_argument("command", nargs="?", default="build", choices=["build", "watch", "version"],
-                          help="The command to run (build or watch)")
+        self.add_argument("command", nargs="?", default="build", choices=["build", "watch", "serve", "version"],
+                          help="The command to run (build, watch or serve)")
         self.add_argument("-d", default=os.getcwd(), type=str, help="sets the working directory")
         self.add_argument("-b", action="store_true", help="toggles debug mode")
+        self.add_argument("-O", action="store_true",
+                          help="unrolls small loops, inlines small functions, passes arguments in scores, propagates "
+                               "constants, removes unused functions, runs the peephole optimizer and reuses the "
+                               "temporary scores and storage paths")
+        self.add_argument("-j", default=1, type=int,
+                          help="number of projects to build in parallel with the build command, 0 for one per CPU")
+        self.add_argument("--full", action="store_true", help="always rebuilds everything in watch mode")
+        self.add_argument("--debounce", default=100, type=int,
+                          help="milliseconds to wait for more changes before rebuilding in watch mode")
+        self.add_argument("--zip", action="store_true", help="builds the datapack as a zip file")
+        self.add_argument("--socket", default=None, type=str,
+                          help="path of the Unix socket the serve command listens on")
         self.prog = "radon"
 
     def error(self, message):
@@ -48,6 +68,13 @@ parser = RadonArgumentParser()
 args = parser.parse_args()
 cwd_list = args.d.split("|")
 original_cwd = os.getcwd()
+# project directory -> the files its last build used, and its output
+build_graphs: Dict[str, BuildGraph] = {}
+# project folder -> its parse cache, kept between the builds of watch mode to reuse the modules parsed in memory
+parse_caches: Dict[str, ParseCache] = {}
+# project folder -> what its modules changed in the transpiler in the last build of watch mode or the build server
+module_caches: Dict[str, ModuleCache] = {}
+manifests = ManifestCache()
 
 
 # real path
@@ -75,15 +102,17 @@ def read_config():
         res = json.loads(file.read())
         if "useLock" not in res:
             res["useLock"] = False
+        if "cacheFolder" not in res:
+            res["cacheFolder"] = CACHE_FOLDER
+        if "cacheSize" not in res:
+            res["cacheSize"] = CACHE_SIZE
+        if "outFormat" not in res:
+            res["outFormat"] = "folder"
+        if "tempCompound" not in res:
+            res["tempCompound"] = None
         return res
 
 
-def listdir_recursive(pt):
-    for root, _, files in os.walk(pt):
-        for file in files:
-            yield pathr(root + "/" + file)
-
-
 def empty_dir_recursive(pt):
     if path.exists(pt) and path.isdir(pt):
         for f in os.listdir(pt):
@@ -93,7 +122,7 @@ def empty_dir_recursive(pt):
             empty_dir_recursive(pathr(pt + "/../"))
 
 
-def build_dir():
+def build_dir(changed: List[str] | None = None):
     init_dir()
 
     config = read_config()
@@ -101,26 +130,97 @@ def build_dir():
     if not path.exists(config["main"]):
         return "The main file does not exist: " + config["main"] + ", cwd: " + os.getcwd()
 
-    with open(pathr(config["main"]), "r") as file:
-        code = file.read()
-
-    try:
-        (statements, macros) = parse_str(code)
-        transpiler = Transpiler(
-            statements=statements,
-            macros=macros,
-            pack_namespace=config["namespace"],
-            pack_description=config["description"],
-            pack_format=get_pack_format(config["format"]),
-            main_dir=config["main"] + "/../",
-            main_file_path=config["main"],
-            debug_mode=args.b)
-    except RadonError as e:
-        return str(e)
-    except Exception as e:
-        raise e
-
-    dp_files = transpiler.get_datapack_files()
+    out_format = "zip" if args.zip else config["outFormat"]
+    if out_format not in ["folder", "zip"]:
+        return "Invalid output format: " + str(out_format) + ", expected 'folder' or 'zip'"
+
+    graph = build_graphs.setdefault(pathr("."), BuildGraph())
+    dp_files = None
+
+    settings = (config, args.b, args.O)
+
+    # the output is reused when no file of the build has changed, otherwise the transpiler reuses the modules imported
+    # before the first change, see ModuleCache
+    if changed is not None and not args.full and graph.dp_files is not None and graph.settings == settings:
+        affected = graph.affected(changed)
+        if len(affected) == 0:
+            dp_files = graph.dp_files
+        if args.b:
+            print(f"{GRAY}Files affected by the change: {len(affected)}{RESET}")
+
+    data_files = data_folder_files(config["data"]) if "data" in config else {}
+
+    if dp_files is None:
+        with open(pathr(config["main"]), "r") as file:
+            code = file.read()
+
+        parse_cache = None
+        if config["cacheFolder"] is not None:
+            parse_cache = parse_caches.get(pathr("."))
+            if (parse_cache is None or parse_cache.folder != pathr(config["cacheFolder"])
+                    or parse_cache.max_size != config["cacheSize"] * 1024 * 1024):
+                parse_cache = ParseCache(config["cacheFolder"], config["cacheSize"] * 1024 * 1024)
+                parse_caches[pathr(".")] = parse_cache
+            parse_cache.begin_build()
+
+        module_cache = None
+        if args.command in ["watch", "serve"] and not args.full:
+            module_cache = module_caches.setdefault(pathr("."), ModuleCache())
+            module_cache.begin_build()
+
+        try:
+            if parse_cache is not None:
+                (statements, macros) = parse_cache.parse(code)
+            else:
+                (statements, macros) = parse_str(code)
+            transpiler = Transpiler(
+                statements=statements,
+                macros=macros,
+                pack_namespace=config["namespace"],
+                pack_description=config["description"],
+                pack_format=get_pack_format(config["format"]),
+                main_dir=config["main"] + "/../",
+                main_file_path=config["main"],
+                debug_mode=args.b,
+                parse_cache=parse_cache,
+                optimize=args.O,
+                temp_compound=config["tempCompound"],
+                data_files=data_files,
+                module_cache=module_cache)
+        except RadonError as e:
+            return str(e)
+        except Exception as e:
+            raise e
+
+        if args.b and parse_cache is not None:
+            print(f"{GRAY}Parse cache: {parse_cache.hits} hits, {parse_cache.misses} misses{RESET}")
+        if args.b and module_cache is not None:
+            print(f"{GRAY}Modules reused: {module_cache.hits}, transpiled: {module_cache.misses}{RESET}")
+
+        # the unroll hint and the removal of the flag checks don't need -O
+        if args.O or transpiler.unrolled_loops > 0:
+            print(f"{GRAY}Loops unrolled: {transpiler.unrolled_loops}{RESET}")
+        if args.O or transpiler.guards_removed > 0:
+            print(f"{GRAY}Flag checks removed: {transpiler.guards_removed}{RESET}")
+        if args.O:
+            print(f"{GRAY}Calls inlined: {transpiler.inlined_calls}{RESET}")
+            if args.b:
+                for (name, decision) in transpiler.inline_decisions:
+                    print(f"{GRAY}  {name}: {decision}{RESET}")
+            print(f"{GRAY}Arguments passed in scores: {transpiler.score_arguments}{RESET}")
+            print(f"{GRAY}Constants folded: {transpiler.constants_folded}{RESET}")
+            print(f"{GRAY}Unused functions removed: {len(transpiler.removed_files)}{RESET}")
+            if args.b:
+                for name in transpiler.removed_files:
+                    print(f"{GRAY}  {name}{RESET}")
+            rewrites = ", ".join(f"{name} {count}" for (name, count) in transpiler.peephole_counts.items() if count > 0)
+            print(f"{GRAY}Peephole rewrites: {rewrites or 'none'}{RESET}")
+            print(f"{GRAY}Temporary scores: {transpiler.temp_names[0]} -> {transpiler.temp_names[1]}{RESET}")
+        if args.O or config["tempCompound"] is not None:
+            print(f"{GRAY}Temporary storage paths: {transpiler.temp_paths[0]} -> {transpiler.temp_paths[1]}{RESET}")
+
+        dp_files = transpiler.get_datapack_files()
+        graph.update(transpiler.dependencies, dp_files, settings)
 
     out_folders = (
         config["outFolder"]
@@ -128,6 +228,15 @@ def build_dir():
         else [config["outFolder"]]
     )
 
+    if out_format == "zip":
+        for out_folder in out_folders:
+            pt = f"{out_folder}/{config['namespace']}.zip"
+            if write_zip(pt, dp_files, data_files):
+                print(f"{GRAY}Archive written: {pathr(pt)}{RESET}")
+            else:
+                print(f"{GRAY}Archive unchanged: {pathr(pt)}{RESET}")
+        return
+
     lock = ""
 
     if config["useLock"] and path.exists(f"./radon.lock"):
@@ -136,47 +245,54 @@ def build_dir():
 
     rm_files = lock.split("\n") if lock else []
 
+    written = unchanged = deleted = 0
+
     for out_folder in out_folders:
-        bef = os.getcwd()
-        os.chdir(out_folder)
-        if config["useLock"]:
-            for f in rm_files:
-                if not path.exists(f):
-                    continue
-                if path.isfile(f):
-                    os.remove(f)
-                dr = path.dirname(f)
-                empty_dir_recursive(dr)
-        elif config["removeBeforeBuild"] is not None:
-            for f in config["removeBeforeBuild"]:
-                if path.exists(f):
+        manifest_pt = None
+        manifest = None
+        if config["cacheFolder"] is not None:
+            manifest_pt = manifest_path(config["cacheFolder"], out_folder)
+            manifest = manifests.load(manifest_pt)
+        # without a manifest of the previous build, its files can't be told apart from the stale ones
+        if manifest is None:
+            bef = os.getcwd()
+            os.chdir(out_folder)
+            if config["useLock"]:
+                for f in rm_files:
+                    if not path.exists(f):
+                        continue
                     if path.isfile(f):
                         os.remove(f)
-                    else:
-                        shutil.rmtree(f, ignore_errors=True)
-        else:
-            shutil.rmtree("data", ignore_errors=True)
-            if path.exists("pack.mcmeta"):
-                os.remove("pack.mcmeta")
-            os.makedirs("data", exist_ok=True)
-        os.chdir(bef)
-
-    for out_folder in out_folders:
-        if "data" in config and path.exists(config["data"]) and path.isdir(config["data"]):
-            shutil.copytree(config["data"], out_folder + "/data", dirs_exist_ok=True)
-        for pt in dp_files:
-            file_name = pt
-            pt = f"{out_folder}/{pt}"
-            os.makedirs(pathr(pt + "/../"), exist_ok=True)
-            with open(pt, "w") as file:
-                file.write(dp_files[file_name])
+                    dr = path.dirname(f)
+                    empty_dir_recursive(dr)
+            elif config["removeBeforeBuild"] is not None:
+                for f in config["removeBeforeBuild"]:
+                    if path.exists(f):
+                        if path.isfile(f):
+                            os.remove(f)
+                        else:
+                            shutil.rmtree(f, ignore_errors=True)
+            else:
+                shutil.rmtree("data", ignore_errors=True)
+                if path.exists("pack.mcmeta"):
+                    os.remove("pack.mcmeta")
+                os.makedirs("data", exist_ok=True)
+            os.chdir(bef)
+        (manifest, w, u, d) = sync_output(out_folder, dp_files, data_files, manifest)
+        written += w
+        unchanged += u
+        deleted += d
+        if manifest_pt is not None:
+            manifests.save(manifest_pt, manifest)
+
+    print(f"{GRAY}Files written: {written}, unchanged: {unchanged}, deleted: {deleted}{RESET}")
 
     if config["useLock"]:
         with open(f"./radon.lock", "w") as file:
             file.write("\n".join(dp_files.keys()))
 
 
-def build():
+def build(changed: List[str] | None = None):
     res = []
     for cwd in cwd_list:
         os.chdir(original_cwd)
@@ -184,12 +300,72 @@ def build():
             print(f"{RED}Directory {cwd} does not exist!{RESET}")
             exit(1)
         os.chdir(cwd)
-        s = build_dir()
+        reset_builtins()
+        s = build_dir(changed)
         if isinstance(s, str):
             res.append(s)
     return "\n".join(res) if len(res) > 0 else None
 
 
+def build_project(cwd):
+    # runs in a worker process, which might have built another project before
+    os.chdir(original_cwd)
+    if not path.exists(cwd):
+        return f"Directory {cwd} does not exist!", 0.0, ""
+    os.chdir(cwd)
+    reset_builtins()
+    reset_expr_id()
+    start = time()
+    output = io.StringIO()
+    with redirect_stdout(output):
+        try:
+            s = build_dir()
+        except Exception:
+            s = traceback.format_exc()
+    return s if isinstance(s, str) else None, time() - start, output.getvalue()
+
+
+def build_parallel(jobs: int):
+    res = []
+    with ProcessPoolExecutor(max_workers=jobs if jobs > 0 else None) as executor:
+        for (cwd, (error, took, output)) in zip(cwd_list, executor.map(build_project, cwd_list)):
+            print(output, end="")
+            if error is None:
+                print(f"{GREEN}Built {cwd}{GRAY} ({took:.5f}s){RESET}")
+            else:
+                print(f"{RED}Failed to build {cwd}{GRAY} ({took:.5f}s){RESET}")
+                res.append(f"{cwd}: {error}")
+    return "\n".join(res) if len(res) > 0 else None
+
+
+def serve_build(request: Dict[str, Any]) -> Dict[str, Any]:
+    # runs in the worker process of the request's project, see server.py
+    project = request["project"]
+    if not path.exists(path.join(project, "radon.json")):
+        return {"ok": False, "error": f"No radon.json found in {project}", "output": "", "took": 0.0}
+    args.b = bool(request.get("debug", False))
+    args.full = bool(request.get("full", False))
+    args.zip = bool(request.get("zip", False))
+    args.O = bool(request.get("optimize", False))
+    changed = request.get("changed")
+    os.chdir(project)
+    graph = build_graphs.get(pathr("."))
+    if changed is None and graph is not None:
+        # the client doesn't know what changed, the files of the last build are checked instead
+        changed = list(graph.hashes.keys())
+    reset_builtins()
+    reset_expr_id()
+    start = time()
+    output = io.StringIO()
+    with redirect_stdout(output):
+        try:
+            s = build_dir(changed)
+        except Exception:
+            s = traceback.format_exc()
+    error = s if isinstance(s, str) else None
+    return {"ok": error is None, "error": error, "output": output.getvalue(), "took": time() - start}
+
+
 def init_dir():
     if path.exists(f"./radon.json"):
         return
@@ -225,7 +401,8 @@ def init_dir():
                     "data": pack_data,
                     "outFolder": pack_output_folder,
                     "useLock": False,
-                    "removeBeforeBuild": None
+                    "removeBeforeBuild": None,
+                    "cacheFolder": CACHE_FOLDER
                 },
                 indent=2,
             )
@@ -253,18 +430,27 @@ def init():
         init_dir()
 
 
-def watch_snapshot():
+def create_project_watcher():
+    folders = []
     files = []
-    files += map(
-        lambda x: path.join("./", x),
-        list(listdir_recursive("./src")) + ["radon.json"]
-    )
-    return {f: path.getmtime(f) for f in files}
-
-
-def build_for_watch():
+    ignore = []
+    for cwd in cwd_list:
+        os.chdir(original_cwd)
+        os.chdir(cwd)
+        config = read_config()
+        folders.append(pathr("./src"))
+        files.append(pathr("./radon.json"))
+        out_folders = config["outFolder"] if isinstance(config["outFolder"], list) else [config["outFolder"]]
+        ignore.extend(pathr(f) for f in out_folders)
+        if config["cacheFolder"] is not None:
+            ignore.append(pathr(config["cacheFolder"]))
+    os.chdir(original_cwd)
+    return create_watcher(folders, files, ignore, args.debounce / 1000)
+
+
+def build_for_watch(changed: List[str] | None = None):
     start = time()
-    built = build()
+    built = build(changed)
     if isinstance(built, str):
         print(RED + built + RESET)
     else:
@@ -272,36 +458,53 @@ def build_for_watch():
         print(f"{GREEN}Datapack has been built!{GRAY} ({took:.5f}s){RESET}")
 
 
-files_snapshot: Any = None
+watcher: Any = None
 
 
 def check_for_changes():
-    global files_snapshot
-    new_snapshot = watch_snapshot()
-    old_snapshot = files_snapshot
+    global watcher
+    changes = watcher.wait()
 
-    if new_snapshot == old_snapshot:
+    if changes is None:
+        print(f"{GRAY}Too many changes at once, rebuilding everything{RESET}")
+        build_for_watch()
         return
 
-    for file in new_snapshot:
-        if file not in old_snapshot:
-            print(f"{GRAY}File created: {path.realpath(file)}{RESET}")
-        elif new_snapshot[file] != old_snapshot[file]:
-            print(f"{GRAY}File modified: {path.realpath(file)}{RESET}")
+    if len(changes) == 0:
+        return
 
-    for file in old_snapshot:
-        if file not in new_snapshot:
-            print(f"{GRAY}File deleted: {path.realpath(file)}{RESET}")
+    for file in changes:
+        print(f"{GRAY}File {changes[file]}: {file}{RESET}")
 
-    build_for_watch()
+    if any(path.basename(file) == "radon.json" for file in changes):
+        # the output folders might have changed
+        watcher.close()
+        watcher = create_project_watcher()
 
-    files_snapshot = new_snapshot
+    build_for_watch(list(changes.keys()))
 
 
 def main():
-    global files_snapshot
+    global watcher
     print(f"{YELLOW}Radon v{VERSION_RADON}{RESET}")
     print("")
+
+    if args.command == "serve":
+        if not hasattr(socket, "AF_UNIX"):
+            print(f"{RED}The serve command needs Unix sockets, which aren't supported on this platform{RESET}")
+            sys.exit(1)
+        # UnixStreamServer is only defined where there are Unix sockets
+        from .server import default_socket_path, serve
+        socket_path = args.socket or default_socket_path()
+        try:
+            serve(socket_path, serve_build, lambda: print(f"{GREEN}Listening on {socket_path}{RESET}", flush=True))
+        except OSError as e:
+            print(f"{RED}{e}{RESET}")
+            sys.exit(1)
+        except KeyboardInterrupt:
+            print(f"{RED}Stopped serving{RESET}")
+        sys.exit(0)
+
     print(f"{CYAN}Current Directory | {' | '.join(cwd_list)}{RESET}")
     print("")
 
@@ -309,7 +512,7 @@ def main():
 
     if args.command == "build":
         start = time()
-        built = build()
+        built = build() if args.j == 1 or len(cwd_list) == 1 else build_parallel(args.j)
         if isinstance(built, str):
             print(RED + built + RESET)
             sys.exit(1)
@@ -323,14 +526,13 @@ def main():
         print(f"{YELLOW}Radon v{VERSION_RADON}{RESET}")
         sys.exit(0)
 
-    files_snapshot = watch_snapshot()
+    watcher = create_project_watcher()
 
     print(f"{GREEN}Watching files...{RESET}")
     print(f"{CYAN}Press CTRL + C to stop watching{RESET}")
     build_for_watch()
     try:
         while True:
-            sleep(0.3)
             check_for_changes()
     except KeyboardInterrupt:
         print(f"{RED}Stopped watching{RESET}")
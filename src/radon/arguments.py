@@ -0,0 +1,211 @@
+import math
+import re
+from typing import Dict, List, Set, Tuple
+
+from .constants import DATA_LITERAL
+from .ir import Command, DataGet, DataModify, DataRemove, Execute, ScoreGet, ScoreLiteral, \
+    ScoreOperation, Store
+from .optimizer import callees
+
+ARG_PATH = re.compile(r"_fn_args\.(\d+)(?!\d)")
+# the data types a score can be stored as without being cut
+NUMBER_TYPES = ("int", "long", "float", "double")
+
+
+def reachable(graph: Dict[str, Set[str | None]], start: str) -> Set[str | None]:
+    # the files start can run through any chain of calls, None if one of them can't be followed
+    seen = set()
+    queue = list(graph.get(start, ()))
+    while len(queue) > 0:
+        node = queue.pop()
+        if node in seen:
+            continue
+        seen.add(node)
+        if node is not None:
+            queue.extend(graph.get(node, ()))
+    return seen
+
+
+class ArgumentAllocator:
+    """
+    Passes the int and float arguments of the functions that can't be called again before they end in scores,
+    arg_<id> __temp__, instead of appending them to a list in the storage, reading them back and removing them after
+    the call. A function can be called again before it ends if it calls itself through any chain of calls, or calls a
+    function that can't be followed. The other functions keep their arguments in the storage, and so does an argument
+    that is used in any other way than being read into a score or set, like being printed.
+
+    A score keeps the value of the argument in the scale it's read with, so a float argument is exact, without the
+    float the storage rounds it to.
+    """
+
+    def __init__(self, namespace: str) -> None:
+        self.namespace = namespace
+        self.prefix = f"storage {namespace}:radon.temp _fn_args."
+
+    def allocate(self, files: Dict[str, List[Command]], functions: Dict[str, List[str]]) -> int:
+        """
+        Rewrites the files in place and returns the number of arguments that are passed in scores now. The functions
+        are the files of the Radon functions and the storage locations of their arguments, macro functions excluded.
+        """
+        graph = {name: set(c for cmd in cmds for c in callees(cmd, files, self.namespace))
+                 for (name, cmds) in files.items()}
+        reach = {name: reachable(graph, name) for name in files}
+        # location -> the file of the function it's an argument of
+        owners: Dict[str, str] = {}
+        for (name, locations) in functions.items():
+            if name in reach and name not in reach[name] and None not in reach[name]:
+                owners.update((location, name) for location in locations)
+        # location -> (file, index, use) of every command that mentions it
+        mentions: Dict[str, List[Tuple[str, int, tuple]]] = {}
+        for (name, cmds) in files.items():
+            for (index, cmd) in enumerate(cmds):
+                text = str(cmd)
+                if "_fn_args." not in text:
+                    continue
+                locations = [self.prefix + n for n in ARG_PATH.findall(text)]
+                for (location, use) in self._uses(cmd, locations).items():
+                    if location in owners:
+                        mentions.setdefault(location, []).append((name, index, use))
+        eligible = set(owners)
+        self._check_calls(files, owners, eligible, reach)
+        while True:
+            scales = {location: self._scale(mentions.get(location, [])) for location in eligible}
+            bad = set(location for location in eligible if not self._fits(mentions.get(location, []), scales,
+                                                                            location, eligible))
+            if len(bad) == 0:
+                break
+            eligible -= bad
+        # file -> index -> the uses to rewrite, the stores before the loads of the same command
+        rewrites: Dict[str, Dict[int, List[Tuple[str, tuple]]]] = {}
+        for location in eligible:
+            for (name, index, use) in mentions.get(location, []):
+                rewrites.setdefault(name, {}).setdefault(index, []).append((location, use))
+        for (name, changes) in rewrites.items():
+            res = []
+            for (index, cmd) in enumerate(files[name]):
+                for (location, use) in sorted(changes.get(index, []), key=lambda x: x[1][0] != "store"):
+                    cmd = self._rewrite(cmd, location, use, scales, eligible)
+                    if cmd is None:
+                        break
+                if cmd is None:
+                    continue
+                if len(res) > 0 and isinstance(res[-1], ScoreLiteral) and res[-1].op == "set" \
+                        and self._overwrites(cmd, res[-1].target):
+                    # the value appended before the argument is stored
+                    res.pop()
+                res.append(cmd)
+            files[name] = res
+        return len(eligible)
+
+    def register(self, location: str) -> str:
+        return f"arg_{location[len(self.prefix):]} __temp__"
+
+    def _overwrites(self, cmd: Command, register: str) -> bool:
+        return (
+                isinstance(cmd, Execute)
+                and len(cmd.clauses) == 1
+                and isinstance(cmd.clauses[0], Store)
+                and cmd.clauses[0].mode == "result"
+                and cmd.clauses[0].target == register
+                and register not in cmd.run.score_reads()
+        )
+
+    def _uses(self, cmd: Command, locations: List[str]) -> Dict[str, tuple]:
+        # location -> how the command uses it, ("other",) when it can't be rewritten
+        res = {location: ("other",) for location in locations}
+        single = set(location for location in locations if locations.count(location) == 1)
+        if isinstance(cmd, DataModify):
+            target = None
+            if cmd.mode == "append" and cmd.target in single:
+                target = cmd.target
+            elif cmd.mode == "set" and cmd.target.endswith("[-1]") and cmd.target[:-4] in single:
+                target = cmd.target[:-4]
+            source = cmd.source[:-4] if cmd.kind == "from" and cmd.source.endswith("[-1]") else None
+            if target is not None:
+                if cmd.kind == "value" and DATA_LITERAL.fullmatch(cmd.source):
+                    res[target] = ("literal", cmd.source)
+                elif cmd.kind == "from":
+                    res[target] = ("copy", cmd.source)
+            if source in single and source != target:
+                res[source] = ("pass", target)
+        elif isinstance(cmd, DataRemove):
+            if cmd.target.endswith("[-1]") and cmd.target[:-4] in single:
+                res[cmd.target[:-4]] = ("pop",)
+        elif isinstance(cmd, Execute):
+            if isinstance(cmd.run, DataGet) and cmd.run.source.endswith("[-1]") and cmd.run.source[:-4] in single:
+                res[cmd.run.source[:-4]] = ("load", cmd.run.scale)
+            for clause in cmd.stores:
+                if not clause.is_score and clause.target.endswith("[-1]") and clause.target[:-4] in single \
+                        and clause.data_type in NUMBER_TYPES:
+                    res[clause.target[:-4]] = ("store", clause.scale)
+        return res
+
+    def _check_calls(self, files: Dict[str, List[Command]], owners: Dict[str, str], eligible: Set[str],
+                     reach: Dict[str, Set[str | None]]) -> None:
+        # an argument that is set before the call can't be overwritten by a call in between
+        for cmds in files.values():
+            pending: Set[str] = set()
+            for cmd in cmds:
+                if isinstance(cmd, DataModify) and cmd.mode == "append" and cmd.target in owners:
+                    pending.add(owners[cmd.target])
+                    continue
+                if isinstance(cmd, DataRemove) and cmd.target[:-4] in owners:
+                    # the end of a call, or of the commands of a function that was inlined
+                    pending.discard(owners[cmd.target[:-4]])
+                    continue
+                if len(pending) == 0:
+                    continue
+                for callee in callees(cmd, files, self.namespace):
+                    if callee in pending:
+                        pending.discard(callee)
+                        continue
+                    for owner in pending:
+                        if callee is None or owner in reach.get(callee, ()):
+                            eligible.difference_update(k for (k, v) in owners.items() if v == owner)
+
+    def _scale(self, uses: List[Tuple[str, int, tuple]]) -> str | None:
+        # the scale the argument is read with, which the score keeps it in
+        scales = set(use[1] for (_, _, use) in uses if use[0] == "load")
+        return scales.pop() if len(scales) == 1 else None
+
+    def _fits(self, uses: List[Tuple[str, int, tuple]], scales: Dict[str, str | None], location: str,
+              eligible: Set[str]) -> bool:
+        scale = scales[location]
+        factor = 1.0 if scale is None else float(scale)
+        for (_, _, use) in uses:
+            if use[0] == "other":
+                return False
+            if use[0] == "load" and use[1] != scale:
+                return False
+            if use[0] == "store" and float(use[1]) * factor != 1.0:
+                return False
+            if use[0] == "pass" and (use[1] not in eligible or scales.get(use[1], scale) != scale):
+                return False
+        return True
+
+    def _rewrite(self, cmd: Command, location: str, use: tuple, scales: Dict[str, str | None],
+                 eligible: Set[str]) -> Command | None:
+        # returns the command that replaces cmd, None to remove it
+        register = self.register(location)
+        scale = scales[location]
+        if use[0] == "pop":
+            return None
+        if use[0] == "pass":
+            # rewritten with the argument it's passed to
+            return cmd
+        if use[0] == "literal":
+            value = float(use[1].rstrip("bsLfd"))
+            return ScoreLiteral("set", register, math.floor(value * (1.0 if scale is None else float(scale))))
+        if use[0] == "copy":
+            if use[1].endswith("[-1]") and use[1][:-4] in eligible:
+                return ScoreOperation(register, "=", self.register(use[1][:-4]))
+            return Execute([Store("result", register)], DataGet(use[1], scale))
+        if use[0] == "load":
+            if len(cmd.clauses) == 1 and len(cmd.stores) == 1 and cmd.clauses[0].is_score \
+                    and cmd.clauses[0].mode == "result":
+                return ScoreOperation(cmd.clauses[0].target, "=", register)
+            return Execute(cmd.clauses, ScoreGet(register))
+        # a store
+        clauses = [Store(c.mode, register) if isinstance(c, Store) and c.target == location + "[-1]" else c
+                   for c in cmd.clauses]
+        return Execute(clauses, cmd.run)
@@ -0,0 +1,242 @@
+import gc
+import hashlib
+import os
+import pickle
+from typing import Any, Dict, List, Set, Tuple
+
+from .dp_ast import Statement, parse
+from .tokenizer import tokenize
+from .utils import VERSION_RADON
+
+CACHE_FOLDER = ".radon-cache"
+CACHE_SIZE = 64  # in MiB
+
+
+class ParseCache:
+    """
+    Keeps the parsed statements of Radon files on the disk, so unchanged files don't have to be tokenized and
+    parsed again on the next build. Entries are keyed by the file's content, the Radon version and the class names
+    known to the parser. The least recently used entries are removed when the folder gets bigger than max_size.
+    The pickled entries used by the current build are also kept in memory, so watch mode can reuse them on the next
+    build without reading the disk.
+    """
+
+    def __init__(self, folder: str = CACHE_FOLDER, max_size: int = CACHE_SIZE * 1024 * 1024) -> None:
+        self.folder = os.path.realpath(folder)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # key -> pickled entry, for the entries of the previous and the current build
+        self.memory: Dict[str, bytes] = {}
+        self.used: Set[str] = set()
+
+    def begin_build(self) -> None:
+        # forget the modules the previous build didn't use, like the ones that were edited since
+        self.memory = {key: self.memory[key] for key in self.used if key in self.memory}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, code: str, class_names: List[str]) -> str:
+        h = hashlib.sha256()
+        h.update(VERSION_RADON.encode())
+        h.update(b"\0")
+        h.update(",".join(class_names).encode())
+        h.update(b"\0")
+        h.update(code.encode())
+        return h.hexdigest()
+
+    def parse(self, code: str, class_names: List[str] = None) -> Tuple[List[Statement], List]:
+        if class_names is None:
+            class_names = []
+        key = self.key(code, class_names)
+        self.used.add(key)
+        pt = os.path.join(self.folder, key + ".pickle")
+        loaded = self._load(key, pt)
+        if loaded is not None:
+            self.hits += 1
+            return loaded
+        self.misses += 1
+        (tokens, macros) = tokenize(code)
+        statements = parse(tokens, macros, class_names)
+        self._store(key, pt, (statements, macros))
+        return statements, macros
+
+    def _load(self, key: str, pt: str):
+        # the trees may be changed while transpiling, so even the in-memory entries are kept pickled
+        data = self.memory.get(key)
+        if data is None:
+            try:
+                with open(pt, "rb") as file:
+                    data = file.read()
+            except OSError:
+                return None
+        # the trees are made of a lot of small objects, collecting while loading them takes longer than the load
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            res = pickle.loads(data)
+        except Exception:
+            # corrupt or written by an incompatible build
+            self.memory.pop(key, None)
+            self._remove(pt)
+            return None
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if key not in self.memory:
+            self.memory[key] = data
+            try:
+                os.utime(pt)
+            except OSError:
+                pass
+        return res
+
+    def _store(self, key: str, pt: str, value) -> None:
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            # too deeply nested to be pickled, it'll just be parsed every time
+            return
+        self.memory[key] = data
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            tmp = f"{pt}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as file:
+                file.write(data)
+            os.replace(tmp, pt)
+        except OSError:
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.folder) as it:
+                for entry in it:
+                    if not entry.name.endswith(".pickle"):
+                        continue
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+        except OSError:
+            return
+        if total <= self.max_size:
+            return
+        entries.sort()
+        for (_, size, pt) in entries:
+            if total <= self.max_size:
+                break
+            self._remove(pt)
+            total -= size
+
+    def _remove(self, pt: str) -> None:
+        try:
+            os.remove(pt)
+        except OSError:
+            pass
+
+
+def file_hash(pt: str) -> str | None:
+    try:
+        with open(pt, "rb") as file:
+            return hashlib.sha256(file.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class BuildGraph:
+    """
+    Remembers which files the last build read, what they import and their content hashes, along with the build's
+    output. Watch mode uses it to find the files a change affects and reuses the output when there are none. When there
+    are some, the transpiler reuses the modules imported before the first change from the ModuleCache.
+    """
+
+    def __init__(self) -> None:
+        self.hashes: Dict[str, str | None] = {}
+        self.importers: Dict[str, Set[str]] = {}
+        self.dp_files: Dict[str, str] | None = None
+        # the config and options of the build, the output can only be reused by a build with the same ones
+        self.settings: Any = None
+
+    def update(self, dependencies: Dict[str, List[str]], dp_files: Dict[str, str], settings: Any = None) -> None:
+        self.hashes = {pt: file_hash(pt) for pt in dependencies}
+        self.importers = {pt: set() for pt in dependencies}
+        for pt in dependencies:
+            for imported in dependencies[pt]:
+                self.importers[imported].add(pt)
+        self.dp_files = dp_files
+        self.settings = settings
+
+    def affected(self, changed: List[str]) -> Set[str]:
+        res = set()
+        for pt in changed:
+            pt = os.path.realpath(pt)
+            # files that aren't a part of the build, or were saved without changing
+            if pt not in self.hashes or file_hash(pt) == self.hashes[pt]:
+                continue
+            res.add(pt)
+        stack = list(res)
+        while len(stack) > 0:
+            for importer in self.importers[stack.pop()]:
+                if importer not in res:
+                    res.add(importer)
+                    stack.append(importer)
+        return res
+
+
+def module_key(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class ModuleEntry:
+    def __init__(self, files: List[Tuple[str, str | None]], changes: Dict[str, Any], expr_id: int,
+                 key_after: str) -> None:
+        # the files transpiling the module read, the module first, with their content hashes
+        self.files = files
+        # attribute of the transpiler -> what the module changed in it
+        self.changes = changes
+        # the id counter and the key of the state after the module
+        self.expr_id = expr_id
+        self.key_after = key_after
+
+
+class ModuleCache:
+    """
+    Keeps what transpiling each imported module changed in the transpiler: the files, functions, variables and the
+    rest of its state. A module's entry is keyed by everything that was transpiled before it: the settings, the text of
+    the importing files up to the import statement and the files of the modules imported before. When the key and the
+    files the module read are the same, the next build of watch mode applies the changes instead of transpiling the
+    module again. Only the entries the previous build used or added are kept, in memory.
+    """
+
+    def __init__(self) -> None:
+        self.entries: Dict[str, ModuleEntry] = {}
+        self.current: Dict[str, ModuleEntry] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def begin_build(self) -> None:
+        # a build that failed before its first import keeps the entries of the one before
+        if len(self.current) > 0:
+            self.entries = self.current
+        self.current = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> ModuleEntry | None:
+        entry = self.entries.get(key)
+        if entry is None or any(file_hash(pt) != h for (pt, h) in entry.files):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.current[key] = entry
+        return entry
+
+    def put(self, key: str, entry: ModuleEntry) -> None:
+        self.current[key] = entry
@@ -0,0 +1,473 @@
+import math
+import re
+from functools import lru_cache
+from typing import Dict, List, Sequence, Set, Tuple
+
+from .ir import (Command, Condition, DataGet, DataModify, DataRemove, Execute, FunctionCall, Modifier, Return,
+                 ScoreCondition, ScoreGet, ScoreLiteral, ScoreOperation, ScoreReset, data_overlaps)
+from .optimizer import callees
+
+INT_MIN = -2 ** 31
+# the commands that aren't understood but can't change any scores or data
+READ_ONLY = ("tellraw ", "say ", "title ", "me ", "particle ", "playsound ", "scoreboard objectives add ")
+# the data values that are kept, and the ones that can be read into a score
+DATA_LITERAL = re.compile(r"-?\d+(?:\.\d+)?[bsLfd]?")
+INT_LITERAL = re.compile(r"(-?\d+)[bsL]?")
+BASE_PATH = re.compile(r"[^\[{]*")
+COMPARE = {
+    "<": lambda a, b: a < b, "<=": lambda a, b: a <= b, "=": lambda a, b: a == b,
+    ">=": lambda a, b: a >= b, ">": lambda a, b: a > b,
+}
+
+
+def wrap(value: int) -> int:
+    # the scores are 32-bit integers
+    return (value - INT_MIN) % 2 ** 32 + INT_MIN
+
+
+def compute(op: str, a: int, b: int) -> int | None:
+    if op == "+=":
+        return wrap(a + b)
+    if op == "-=":
+        return wrap(a - b)
+    if op == "*=":
+        return wrap(a * b)
+    if op in ("/=", "%="):
+        # dividing by zero fails the command
+        if b == 0:
+            return None
+        # rounded towards negative infinity, like Python does
+        return wrap(a // b) if op == "/=" else a % b
+    if op == "<":
+        return min(a, b)
+    if op == ">":
+        return max(a, b)
+    return None
+
+
+def in_range(value: int, text: str) -> bool | None:
+    try:
+        if ".." not in text:
+            return value == int(text)
+        (low, high) = text.split("..")
+        return (low == "" or value >= int(low)) and (high == "" or value <= int(high))
+    except ValueError:
+        return None
+
+
+def is_trackable(score: str) -> bool:
+    # the scores of a selector can be any holder's, and the macro lines can be any score
+    return score[0] not in "@*" and "$" not in score
+
+
+def read_only(cmd: Command) -> bool:
+    while isinstance(cmd, (Execute, Return)) and cmd.run is not None:
+        cmd = cmd.run
+    return str(cmd).startswith(READ_ONLY)
+
+
+@lru_cache(maxsize=None)
+def base_path(location: str) -> str:
+    # the location without the indices and the filters, a[0] and a[-1] can be the same tag
+    return BASE_PATH.match(location).group()
+
+
+def data_aliases(a: str, b: str) -> bool:
+    return data_overlaps(base_path(a), base_path(b))
+
+
+class Writes:
+    """
+    The scores and data that a function can change, directly or through the functions it calls.
+    """
+
+    def __init__(self) -> None:
+        self.scores: Set[str] = set()
+        # the objectives of the selectors whose scores it changes, like @s
+        self.objectives: Set[str] = set()
+        self.data: Set[str] = set()
+        # whether it can change anything, like a macro line does
+        self.everything = False
+
+    def add(self, cmd: Command) -> None:
+        if cmd.opaque and not read_only(cmd):
+            self.everything = True
+        for score in cmd.score_writes():
+            if is_trackable(score):
+                self.scores.add(score)
+            else:
+                self.objectives.add(score.rsplit(" ", 1)[1])
+        self.data.update(cmd.data_writes())
+
+    def update(self, other: "Writes") -> bool:
+        # returns whether anything was added
+        size = (len(self.scores), len(self.objectives), len(self.data), self.everything)
+        self.scores.update(other.scores)
+        self.objectives.update(other.objectives)
+        self.data.update(other.data)
+        self.everything = self.everything or other.everything
+        return size != (len(self.scores), len(self.objectives), len(self.data), self.everything)
+
+
+class Known:
+    """
+    The values that the scores and the data of the storages are known to have at a point of a function.
+    """
+
+    def __init__(self, constants: Dict[str, int] = None) -> None:
+        self.scores: Dict[str, int] = {}
+        # location -> the value as it's written in a command
+        self.data: Dict[str, str] = {}
+        # the scores that no function changes after the load function has set them
+        self.constants = constants or {}
+
+    def copy(self) -> "Known":
+        res = Known(self.constants)
+        res.scores = dict(self.scores)
+        res.data = dict(self.data)
+        return res
+
+    def get(self, score: str) -> int | None:
+        value = self.scores.get(score)
+        return self.constants.get(score) if value is None else value
+
+    def set(self, score: str, value: int) -> None:
+        self.forget_score(score)
+        if is_trackable(score):
+            self.scores[score] = value
+
+    def forget_score(self, score: str) -> None:
+        if is_trackable(score):
+            self.scores.pop(score, None)
+        else:
+            objective = " " + score.rsplit(" ", 1)[1]
+            self.scores = {k: v for (k, v) in self.scores.items() if not k.endswith(objective)}
+
+    def set_data(self, location: str, value: str) -> None:
+        self.forget_data(location)
+        if location.startswith("storage ") and "$" not in location and DATA_LITERAL.fullmatch(value):
+            self.data[location] = value
+
+    def forget_data(self, location: str) -> None:
+        if len(self.data) > 0:
+            self.data = {k: v for (k, v) in self.data.items() if not data_aliases(k, location)}
+
+    def forget(self, writes: Writes) -> None:
+        if writes.everything:
+            self.scores.clear()
+            self.data.clear()
+            return
+        for score in writes.scores:
+            self.scores.pop(score, None)
+        for objective in writes.objectives:
+            self.forget_score("@s " + objective)
+        for location in writes.data:
+            self.forget_data(location)
+
+    def forget_command(self, cmd: Command) -> None:
+        # the changes of a command whose values aren't known
+        writes = Writes()
+        writes.add(cmd)
+        self.forget(writes)
+
+    def meet(self, other: "Known") -> None:
+        # keeps the values that are the same in both
+        self.scores = {k: v for (k, v) in self.scores.items() if other.scores.get(k) == v}
+        self.data = {k: v for (k, v) in self.data.items() if other.data.get(k) == v}
+
+
+class ConstantPropagator:
+    """
+    Follows the values of the scores and the storage data that are known at compile time through the commands of
+    every function, and replaces the operations on them with the values: a = 5 followed by b = a * 3 + 2 sets b to 17.
+    The conditions whose results are known are removed, and so are the commands behind the ones that never pass.
+
+    Nothing is known when a function starts, except the scores that the load function sets before doing anything else
+    and that nothing changes after, and, for the generated files that are only called from one place, the values known
+    at that place. Calling a function forgets the values it can change, and the commands that run as other entities,
+    or aren't understood, forget the ones they can change.
+    """
+
+    def __init__(self, namespace: str, internal: Tuple[str, ...] = ()) -> None:
+        self.namespace = namespace
+        # the folders of the files that only the generated code calls
+        self.internal = internal
+        self.folded = 0
+        # file -> what it can change, with the functions it calls
+        self.writes: Dict[str, Writes] = {}
+        self.constants: Dict[str, int] = {}
+        # file -> (file, index) of the only command that calls it
+        self.single_callers: Dict[str, Tuple[str, int]] = {}
+        # (file, index) -> the values known when the command calls the function
+        self.call_states: Dict[Tuple[str, int], Known] = {}
+        # the files that start with the values known where they are called
+        self.entered: Set[str] = set()
+
+    def propagate(self, files: Dict[str, List[Command]], referenced: Set[str] = frozenset(),
+                  external: Sequence[str] = ()) -> int:
+        """
+        Rewrites the files in place, and returns the number of commands that were changed or removed. The referenced
+        files are the ones that something other than the functions can run, like a function tag, and external is the
+        text of the function files that aren't transpiled, like the ones of the data folder, which can change any score
+        they mention.
+        """
+        calls = {name: [callees(cmd, files, self.namespace) for cmd in cmds] for (name, cmds) in files.items()}
+        self._summarize(files, calls)
+        self.constants = self._load_constants(files, external)
+        # every mention of a file counts, like the schedules and the click events of a text
+        fn_ref = re.compile(re.escape(self.namespace) + r":([a-z0-9_./-]+)")
+        references: Dict[str, List[Tuple[str, int]]] = {}
+        for (name, cmds) in files.items():
+            for (index, cmd) in enumerate(cmds):
+                for target in fn_ref.findall(str(cmd)):
+                    references.setdefault(target, []).append((name, index))
+        for (name, places) in references.items():
+            if len(places) == 1 and name.startswith(self.internal) and name not in referenced:
+                self.single_callers[name] = places[0]
+        done: Set[str] = set()
+        for name in list(files):
+            self._visit(name, files, calls, done)
+        return self.folded
+
+    def _summarize(self, files: Dict[str, List[Command]], calls: Dict[str, List[List[str | None]]]) -> None:
+        for (name, cmds) in files.items():
+            writes = Writes()
+            for cmd in cmds:
+                writes.add(cmd)
+            if any(callee is None for cmd_callees in calls[name] for callee in cmd_callees):
+                writes.everything = True
+            self.writes[name] = writes
+        graph = {name: set(c for cmd_callees in calls[name] for c in cmd_callees if c is not None) for name in files}
+        changed = True
+        while changed:
+            changed = False
+            for (name, targets) in graph.items():
+                for target in targets:
+                    if target != name and self.writes[name].update(self.writes[target]):
+                        changed = True
+
+    def _load_constants(self, files: Dict[str, List[Command]], external: Sequence[str]) -> Dict[str, int]:
+        # the scores the load function sets before it calls anything, and that nothing else changes
+        load = files.get("__load__")
+        if load is None:
+            return {}
+        writes: Dict[str, int] = {}
+        objectives: Set[str] = set()
+        opaque = list(external)
+        for cmds in files.values():
+            for cmd in cmds:
+                for score in cmd.score_writes():
+                    writes[score] = writes.get(score, 0) + 1
+                    if not is_trackable(score):
+                        objectives.add(score.rsplit(" ", 1)[1])
+                if cmd.opaque and not read_only(cmd):
+                    opaque.append(str(cmd))
+        res = {}
+        for cmd in load:
+            if len(cmd.calls()) > 0 or (cmd.opaque and not read_only(cmd)) or "function" in str(cmd):
+                break
+            if not (isinstance(cmd, ScoreLiteral) and cmd.op == "set" and isinstance(cmd.value, int)):
+                continue
+            (holder, objective) = cmd.target.rsplit(" ", 1)
+            mention = re.compile(r"(?<![\w.])" + re.escape(holder) + r"(?![\w.])")
+            if (is_trackable(cmd.target) and writes.get(cmd.target) == 1 and objective not in objectives
+                    and not any(objective in text and mention.search(text) for text in opaque)):
+                res[cmd.target] = cmd.value
+        return res
+
+    def _visit(self, name: str, files: Dict[str, List[Command]], calls: Dict[str, List[List[str | None]]],
+               done: Set[str]) -> None:
+        if name in done:
+            return
+        done.add(name)
+        caller = self.single_callers.get(name)
+        if caller is not None:
+            # the values known where it's called
+            self._visit(caller[0], files, calls, done)
+        entry = None if caller is None else self.call_states.get(caller)
+        if entry is not None:
+            self.entered.add(name)
+        known = entry.copy() if entry is not None else Known(None if name == "__load__" else self.constants)
+        res = []
+        for (index, cmd) in enumerate(files[name]):
+            new = self._step(cmd, known, (name, index), calls[name][index])
+            if new is not cmd:
+                self.folded += 1
+            if new is None:
+                continue
+            res.append(new)
+            if isinstance(new, Return):
+                # the rest of the file can't be reached
+                self.folded += len(files[name]) - index - 1
+                break
+        files[name] = res
+
+    def _step(self, cmd: Command, known: Known, place: Tuple[str, int], cmd_callees: List[str | None]) \
+            -> Command | None:
+        # returns the command that replaces it, None if it can be removed
+        if isinstance(cmd, ScoreLiteral):
+            return self._literal(cmd, known)
+        if isinstance(cmd, ScoreOperation):
+            return self._operation(cmd, known)
+        if isinstance(cmd, DataModify):
+            return self._modify(cmd, known)
+        if isinstance(cmd, (ScoreReset, DataRemove)):
+            known.forget_command(cmd)
+            return cmd
+        if isinstance(cmd, (ScoreGet, DataGet)):
+            return cmd
+        if isinstance(cmd, Execute):
+            return self._execute(cmd, known, place, cmd_callees)
+        if isinstance(cmd, Return):
+            value = None if cmd.run is None else self._result(cmd.run, known)
+            return cmd if value is None else Return(value)
+        if isinstance(cmd, FunctionCall) and cmd.source is None and cmd.arguments is None:
+            self.call_states[place] = known.copy()
+        self._forget_calls(cmd, known, cmd_callees)
+        return cmd
+
+    def _forget_calls(self, cmd: Command, known: Known, cmd_callees: List[str | None]) -> None:
+        known.forget_command(cmd)
+        for callee in cmd_callees:
+            if callee is None:
+                known.scores.clear()
+                known.data.clear()
+            else:
+                known.forget(self.writes[callee])
+
+    def _literal(self, cmd: ScoreLiteral, known: Known) -> Command:
+        if not isinstance(cmd.value, int):
+            known.forget_score(cmd.target)
+            return cmd
+        if cmd.op == "set":
+            known.set(cmd.target, wrap(cmd.value))
+            return cmd
+        value = known.get(cmd.target)
+        if value is None:
+            known.forget_score(cmd.target)
+            return cmd
+        value = wrap(value + cmd.value if cmd.op == "add" else value - cmd.value)
+        known.set(cmd.target, value)
+        return ScoreLiteral("set", cmd.target, value)
+
+    def _operation(self, cmd: ScoreOperation, known: Known) -> Command:
+        (a, b) = (known.get(cmd.target), known.get(cmd.source))
+        if cmd.op == "><":
+            known.forget_score(cmd.target)
+            known.forget_score(cmd.source)
+            if b is not None:
+                known.set(cmd.target, b)
+            if a is not None:
+                known.set(cmd.source, a)
+            return cmd
+        if cmd.op == "=":
+            if cmd.target == cmd.source:
+                return cmd
+            if b is None:
+                known.forget_score(cmd.target)
+                return cmd
+            known.set(cmd.target, b)
+            return ScoreLiteral("set", cmd.target, b)
+        value = None if a is None or b is None else compute(cmd.op, a, b)
+        if value is not None:
+            known.set(cmd.target, value)
+            return ScoreLiteral("set", cmd.target, value)
+        if a is not None and b == 0 and cmd.op in ("/=", "%="):
+            # the command fails and the score stays the same
+            return cmd
+        known.forget_score(cmd.target)
+        if b is not None and cmd.op in ("+=", "-=") and cmd.target != cmd.source and b != INT_MIN:
+            # the other score isn't needed anymore
+            add = b if cmd.op == "+=" else -b
+            return ScoreLiteral("add", cmd.target, add) if add >= 0 else ScoreLiteral("remove", cmd.target, -add)
+        return cmd
+
+    def _modify(self, cmd: DataModify, known: Known) -> Command:
+        if cmd.kind == "from" and cmd.source in known.data:
+            cmd = DataModify(cmd.target, cmd.mode, "value", known.data[cmd.source], cmd.bounds)
+        if cmd.mode == "set" and cmd.kind == "value":
+            known.set_data(cmd.target, cmd.source)
+        else:
+            known.forget_data(cmd.target)
+        return cmd
+
+    def _result(self, cmd: Command, known: Known) -> int | None:
+        # the result of a command that only gets a value
+        if isinstance(cmd, ScoreGet):
+            return known.get(cmd.source)
+        if isinstance(cmd, DataGet) and cmd.source in known.data:
+            match = INT_LITERAL.fullmatch(known.data[cmd.source])
+            if match is None:
+                return None
+            try:
+                scale = 1.0 if cmd.scale is None else float(cmd.scale)
+            except ValueError:
+                return None
+            return wrap(math.floor(int(match.group(1)) * scale))
+        return None
+
+    def _execute(self, cmd: Execute, known: Known, place: Tuple[str, int], cmd_callees: List[str | None]) \
+            -> Command | None:
+        if any(isinstance(c, Condition) and c.args[1] == "function" for c in cmd.clauses):
+            # the function runs before the rest of the command
+            self._forget_calls(cmd, known, cmd_callees)
+            return cmd
+        stores = cmd.stores
+        clauses = []
+        for clause in cmd.clauses:
+            if isinstance(clause, ScoreCondition):
+                passes = self._test(clause, known)
+                if passes is False and len(stores) == 0:
+                    return None
+                if passes is True and cmd.run is not None:
+                    continue
+            clauses.append(clause)
+        if len(clauses) == 0:
+            return self._step(cmd.run, known, place, cmd_callees)
+        if any(isinstance(c, Modifier) for c in clauses):
+            # it can run any number of times
+            self._forget_calls(cmd, known, cmd_callees)
+            return cmd if len(clauses) == len(cmd.clauses) else Execute(clauses, cmd.run)
+        conditional = len(clauses) > len(stores)
+        state = known.copy() if conditional else known
+        run = cmd.run
+        value = None if run is None else self._result(run, state)
+        if len(stores) > 0:
+            for store in stores:
+                state.forget_score(store.target) if store.is_score else state.forget_data(store.target)
+            if value is not None:
+                for store in stores:
+                    if store.is_score:
+                        state.set(store.target, value if store.mode == "result" else 1)
+                    elif store.mode == "result" and store.data_type == "int" and store.scale == "1":
+                        state.set_data(store.target, str(value))
+                if not conditional and len(stores) == 1:
+                    store = stores[0]
+                    if store.is_score:
+                        return ScoreLiteral("set", store.target, value if store.mode == "result" else 1)
+                    if store.mode == "result" and store.data_type == "int" and store.scale == "1":
+                        return DataModify(store.target, "set", "value", str(value))
+            elif run is not None:
+                self._forget_calls(run, state, cmd_callees)
+        elif run is not None:
+            run = self._step(run, state, place, cmd_callees)
+            if run is None:
+                # the command behind it never runs
+                return None
+        if conditional and not isinstance(run, Return):
+            # a command that returns leaves the values of the other branch
+            known.meet(state)
+        if run is cmd.run and len(clauses) == len(cmd.clauses):
+            return cmd
+        return Execute(clauses, run)
+
+    def _test(self, clause: ScoreCondition, known: Known) -> bool | None:
+        value = known.get(clause.target)
+        if value is None:
+            return None
+        if clause.op == "matches":
+            res = in_range(value, clause.value)
+        else:
+            other = known.get(clause.value)
+            res = None if other is None or clause.op not in COMPARE else COMPARE[clause.op](value, other)
+        return None if res is None else res != clause.negate
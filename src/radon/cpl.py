@@ -4,6 +4,7 @@ from types import FunctionType
 from typing import Union, Any, List, Dict
 
 from .error import raise_syntax_error, raise_syntax_error_t
+from .ir import DataGet, DataModify, DataRemove, Execute, ScoreLiteral, ScoreOperation, Store, modify_with
 from .nbt_definitions import ENTITIES_OBJ
 from .tokenizer import Token, GroupToken
 from .utils import CplDef, get_uuid, FLOAT_PREC, basic_cmp, inv_cmp, CplDefArray, TokenType, FLOAT_TYPE, INT_TYPE, \
@@ -457,7 +458,7 @@ def num_eq_neq(self, ctx, cpl, is_eq):
         if score_t == "float":
             v = int(v * FLOAT_PREC)
         eid = f"int_{get_uuid()} __temp__"
-        ctx.file.append(f"scoreboard players set {eid} 0")
+        ctx.file.append(ScoreLiteral("set", eid, 0))
         ctx.file.append(f"execute if score {cpl.location} matches {v}..{v} "
                         f"run scoreboard players set {eid} 1")
         return CplScore(self.token, eid)
@@ -481,7 +482,7 @@ def num_cmp(self, ctx, cpl, op):
     if score_t == "float":
         v = int(v * FLOAT_PREC)
     eid = f"int_{get_uuid()} __temp__"
-    ctx.file.append(f"scoreboard players set {eid} 0")
+    ctx.file.append(ScoreLiteral("set", eid, 0))
     matcher = ""
     if inv_op == ">":
         matcher = f"{v + 1}.."
@@ -839,7 +840,7 @@ class CplNBT(Cpl):
             return None
         if not nbt_loc:
             nbt_loc = f"storage {ctx.transpiler.pack_namespace}:radon.temp _{get_uuid()}"
-        ctx.file.append(f"data modify {nbt_loc} set from {self.location}")
+        ctx.file.append(DataModify(nbt_loc, "set", "from", self.location))
         return val_nbt(self.token, nbt_loc, self.unique_type)
 
     def _set(self, ctx, cpl):
@@ -919,7 +920,7 @@ class CplArrayNBT(CplNBT):
     def _get_index(self, ctx, index: Cpl):
         if isinstance(index, CplString) and index.value == "length":
             eid = f"int_{get_uuid()} __temp__"
-            ctx.file.append(f"execute store result score {eid} run data get {self.location}")
+            ctx.file.append(Execute([Store("result", eid)], DataGet(self.location)))
             return CplScore(self.token, eid)
         if isinstance(index, CplInt) or isinstance(index, CplString):
             ind = str(index.value)
@@ -935,14 +936,14 @@ class CplArrayNBT(CplNBT):
             if len(arguments) != 0:
                 raise_syntax_error("Expected 0 arguments for <array>.pop()", self.token)
             eid = f"storage {ctx.transpiler.pack_namespace}:radon.temp _{get_uuid()}"
-            ctx.file.append(f"data modify {eid} set from {self.location}[-1]")
-            ctx.file.append(f"data remove {self.location}[-1]")
+            ctx.file.append(DataModify(eid, "set", "from", f"{self.location}[-1]"))
+            ctx.file.append(DataRemove(f"{self.location}[-1]"))
             return val_nbt(self.token, eid, self.unique_type.content)
         if index == "push":
             if len(arguments) == 0:
                 raise_syntax_error("Expected at least 1 argument for array.push()", self.token)
             for arg in arguments:
-                ctx.file.append(f"data modify {self.location} append {arg.get_data_str(ctx)}")
+                ctx.file.append(modify_with(self.location, "append", arg.get_data_str(ctx)))
             return self.get_index(ctx, CplString(self.token, "length"))
         if index == "insert":
             if len(arguments) != 2:
@@ -970,7 +971,7 @@ class CplArrayNBT(CplNBT):
                 raise_syntax_error("Expected an array as the first argument for array.insert()", self.token)
             if a0.unique_type != self.unique_type:
                 raise_syntax_error("Expected an array of the same type for array.merge()", self.token)
-            ctx.file.append(f"data modify {self.location} merge {a0.get_data_str(ctx)}")
+            ctx.file.append(modify_with(self.location, "merge", a0.get_data_str(ctx)))
             return self
         return None
 
@@ -995,9 +996,9 @@ class CplFloatNBT(CplNBT):
         if force == "score":
             t = "float" or force_t
             if t == "int":
-                ctx.file.append(f"execute store result score {score_loc} run data get {self.location}")
+                ctx.file.append(Execute([Store("result", score_loc)], DataGet(self.location)))
             else:
-                ctx.file.append(f"execute store result score {score_loc} run data get {self.location} {FLOAT_PREC}")
+                ctx.file.append(Execute([Store("result", score_loc)], DataGet(self.location, str(FLOAT_PREC))))
             return CplScore(self.token, score_loc, t)
         return super()._cache(ctx, score_loc, nbt_loc, force, force_t)
 
@@ -1017,10 +1018,10 @@ class CplIntNBT(CplNBT):
 
     def _cache(self, ctx, score_loc=None, nbt_loc=None, force=None, force_t=None):
         if force == "score":
-            ctx.file.append(f"execute store result score {score_loc} run data get {self.location}")
+            ctx.file.append(Execute([Store("result", score_loc)], DataGet(self.location)))
             t = "int"
             if force_t == "float":
-                ctx.file.append(f"scoreboard players operation {score_loc} *= FLOAT_PREC __temp__")
+                ctx.file.append(ScoreOperation(score_loc, "*=", "FLOAT_PREC __temp__"))
                 t = "float"
             return CplScore(self.token, score_loc, t)
         return super()._cache(ctx, score_loc, nbt_loc, force, force_t)
@@ -1089,7 +1090,7 @@ class CplStringNBT(CplNBT):
     def _get_index(self, ctx, index: Cpl):
         if isinstance(index, CplString) and index.value == "length":
             eid = f"int_{get_uuid()} __temp__"
-            ctx.file.append(f"execute store result score {eid} run data get {self.location}")
+            ctx.file.append(Execute([Store("result", eid)], DataGet(self.location)))
             return CplScore(self.token, eid)
         if isinstance(index, CplInt):
             temp = f"storage {ctx.transpiler.pack_namespace}:radon.temp _{get_uuid()}"
@@ -1307,29 +1308,29 @@ class CplScore(Cpl):
         if self.unique_type.type == "int":
             return self
         eid = score_loc or f"int_{get_uuid()} __temp__"
-        ctx.file.append(f"scoreboard players operation {eid} = {self.location}")
-        ctx.file.append(f"scoreboard players operation {eid} /= FLOAT_PREC __temp__")
+        ctx.file.append(ScoreOperation(eid, "=", self.location))
+        ctx.file.append(ScoreOperation(eid, "/=", "FLOAT_PREC __temp__"))
         return CplScore(self.token, eid)
 
     def as_float(self, ctx, score_loc=None):
         if self.unique_type.type == "float":
             return self
         eid = score_loc or f"float_{get_uuid()} __temp__"
-        ctx.file.append(f"scoreboard players operation {eid} = {self.location}")
-        ctx.file.append(f"scoreboard players operation {eid} *= FLOAT_PREC __temp__")
+        ctx.file.append(ScoreOperation(eid, "=", self.location))
+        ctx.file.append(ScoreOperation(eid, "*=", "FLOAT_PREC __temp__"))
         return CplScore(self.token, eid)
 
     def _force_float(self, ctx):  # ONLY USE THIS ON RECENTLY CACHED SCORES!
         if self.unique_type == FLOAT_TYPE:
             return
         self.unique_type = FLOAT_TYPE
-        ctx.file.append(f"scoreboard players operation {self.location} *= FLOAT_PREC __temp__")
+        ctx.file.append(ScoreOperation(self.location, "*=", "FLOAT_PREC __temp__"))
 
     def _force_int(self, ctx):  # ONLY USE THIS ON RECENTLY CACHED SCORES!
         if self.unique_type == INT_TYPE:
             return
         self.unique_type = INT_TYPE
-        ctx.file.append(f"scoreboard players operation {self.location} /= FLOAT_PREC __temp__")
+        ctx.file.append(ScoreOperation(self.location, "/=", "FLOAT_PREC __temp__"))
 
     def _force_type(self, ctx, type):  # ONLY USE THIS ON RECENTLY CACHED SCORES!
         if type == "int":
@@ -1348,9 +1349,7 @@ class CplScore(Cpl):
             return val_nbt(self.token, nbt_loc, force_t or self.unique_type)
         if not score_loc:
             score_loc = f"{self.unique_type.type}_{get_uuid()} __temp__"
-        ctx.file.append(
-            f"scoreboard players operation {score_loc} = {self.location}"
-        )
+        ctx.file.append(ScoreOperation(score_loc, "=", self.location))
         score = CplScore(self.token, score_loc, self.unique_type.type)
         if force_t:
             score._force_type(ctx, force_t)
@@ -1388,38 +1387,38 @@ class CplScore(Cpl):
     def _set(self, ctx, cpl):
         if isinstance(cpl, CplInt) or isinstance(cpl, CplFloat):
             v = self.__score_help(cpl)
-            ctx.file.append(f"scoreboard players set {self.location} {v}")
+            ctx.file.append(ScoreLiteral("set", self.location, v))
             return self
         t_want = self.unique_type.type
         t_have = cpl.unique_type.type
         if not isinstance(cpl, CplScore) and not isinstance(cpl, CplIntNBT) and not isinstance(cpl, CplFloatNBT):
             return None
         if isinstance(cpl, CplScore):
-            ctx.file.append(f"scoreboard players operation {self.location} = {cpl.location}")
+            ctx.file.append(ScoreOperation(self.location, "=", cpl.location))
         else:
             if t_want == "int":
-                ctx.file.append(f"execute store result score {self.location} run data get {cpl.location}")
+                ctx.file.append(Execute([Store("result", self.location)], DataGet(cpl.location)))
             else:
-                ctx.file.append(f"execute store result score {self.location} run data get {cpl.location} {FLOAT_PREC}")
+                ctx.file.append(Execute([Store("result", self.location)], DataGet(cpl.location, str(FLOAT_PREC))))
             return self
         if t_want == "int" and t_have == "float":
-            ctx.file.append(f"scoreboard players operation {self.location} /= FLOAT_PREC __temp__")
+            ctx.file.append(ScoreOperation(self.location, "/=", "FLOAT_PREC __temp__"))
         if t_want == "float" and t_have == "int":
-            ctx.file.append(f"scoreboard players operation {self.location} *= FLOAT_PREC __temp__")
+            ctx.file.append(ScoreOperation(self.location, "*=", "FLOAT_PREC __temp__"))
         return self
 
     def _set_add(self, ctx, cpl):
         if cpl.is_lit_eq(0):
             return self
         if isinstance(cpl, CplInt) or isinstance(cpl, CplFloat):
-            ctx.file.append(f"scoreboard players add {self.location} {self.__score_help(cpl)}")
+            ctx.file.append(ScoreLiteral("add", self.location, self.__score_help(cpl)))
             return self
         if isinstance(cpl, CplScore):
             t_want = self.unique_type.type
             t_have = cpl.unique_type.type
             if t_want != t_have:
                 cpl = cpl.cache(ctx, force=t_want)
-            ctx.file.append(f"scoreboard players operation {self.location} += {cpl.location}")
+            ctx.file.append(ScoreOperation(self.location, "+=", cpl.location))
             return self
         if not isinstance(cpl, CplIntNBT) and not isinstance(cpl, CplFloatNBT):
             return None
@@ -1429,14 +1428,14 @@ class CplScore(Cpl):
         if cpl.is_lit_eq(0):
             return self
         if isinstance(cpl, CplInt) or isinstance(cpl, CplFloat):
-            ctx.file.append(f"scoreboard players remove {self.location} {self.__score_help(cpl)}")
+            ctx.file.append(ScoreLiteral("remove", self.location, self.__score_help(cpl)))
             return self
         if isinstance(cpl, CplScore):
             t_want = self.unique_type.type
             t_have = cpl.unique_type.type
             if t_want != t_have:
                 cpl = cpl.cache(ctx, force_t=t_want)
-            ctx.file.append(f"scoreboard players operation {self.location} -= {cpl.location}")
+            ctx.file.append(ScoreOperation(self.location, "-=", cpl.location))
             return self
         if not isinstance(cpl, CplIntNBT) and not isinstance(cpl, CplFloatNBT):
             return None
@@ -1448,9 +1447,9 @@ class CplScore(Cpl):
         if isinstance(cpl, CplInt) or isinstance(cpl, CplFloat):
             return self._set_mul(ctx, cpl.cache(ctx, force="score", force_t=self.unique_type.type))
         if isinstance(cpl, CplScore):
-            ctx.file.append(f"scoreboard players operation {self.location} *= {cpl.location}")
+            ctx.file.append(ScoreOperation(self.location, "*=", cpl.location))
             if cpl.unique_type.type == "float":
-                ctx.file.append(f"scoreboard players operation {self.location} /= FLOAT_PREC __temp__")
+                ctx.file.append(ScoreOperation(self.location, "/=", "FLOAT_PREC __temp__"))
             return self
         if not isinstance(cpl, CplIntNBT) and not isinstance(cpl, CplFloatNBT):
             return None
@@ -1465,8 +1464,8 @@ class CplScore(Cpl):
             return self._set_div(ctx, cpl.cache(ctx, force="score", force_t=self.unique_type.type))
         if isinstance(cpl, CplScore):
             if cpl.unique_type.type == "float":
-                ctx.file.append(f"scoreboard players operation {self.location} *= FLOAT_PREC __temp__")
-            ctx.file.append(f"scoreboard players operation {self.location} /= {cpl.location}")
+                ctx.file.append(ScoreOperation(self.location, "*=", "FLOAT_PREC __temp__"))
+            ctx.file.append(ScoreOperation(self.location, "/=", cpl.location))
             return self
         if not isinstance(cpl, CplIntNBT) and not isinstance(cpl, CplFloatNBT):
             return None
@@ -1484,7 +1483,7 @@ class CplScore(Cpl):
             t_have = cpl.unique_type.type
             if t_want != t_have:
                 cpl = cpl.cache(ctx, force_t=t_want)
-            ctx.file.append(f"scoreboard players operation {self.location} %= {cpl.location}")
+            ctx.file.append(ScoreOperation(self.location, "%=", cpl.location))
             return self
         if not isinstance(cpl, CplIntNBT) and not isinstance(cpl, CplFloatNBT):
             return None
@@ -1568,7 +1567,7 @@ class CplScore(Cpl):
                 cpl = cpl.cache(ctx, force_t=t_want)
             if op == "==" or op == "!=":
                 op = "="
-            ctx.file.append(f"scoreboard players set {eid} 0")
+            ctx.file.append(ScoreLiteral("set", eid, 0))
             ctx.file.append(f"execute {op_if} score {self.location} {op} {cpl.location} "
                             f"run scoreboard players set {eid} 1")
             return CplScore(self.token, eid)
@@ -1586,7 +1585,7 @@ class CplScore(Cpl):
         if isinstance(cpl, CplNBT):
             cpl = cpl.cache(ctx, force="score")
         eid = f"int_{get_uuid()} __temp__"
-        ctx.file.append(f"scoreboard players set {eid} 0")
+        ctx.file.append(ScoreLiteral("set", eid, 0))
         ctx.file.append(f"execute "
                         f"unless score {self.location} matches 0..0 "
                         f"unless score {cpl.location} matches 0..0 "
@@ -1605,7 +1604,7 @@ class CplScore(Cpl):
         if isinstance(cpl, CplNBT):
             cpl = cpl.cache(ctx, force="score")
         eid = f"int_{get_uuid()} __temp__"
-        ctx.file.append(f"scoreboard players set {eid} 0")
+        ctx.file.append(ScoreLiteral("set", eid, 0))
         ctx.file.append(f"execute "
                         f"unless score {self.location} matches 0..0 "
                         f"run scoreboard players set {eid} 1")
@@ -1662,7 +1661,7 @@ class CplSelector(Cpl):
         if isinstance(cpl, CplInt) or isinstance(cpl, CplFloat):
             return self if cpl.value != 0 else CplInt(self.token, 0)
         score_loc = f"int_{get_uuid()} __temp__"
-        ctx.file.append(f"scoreboard players set {score_loc} 0")
+        ctx.file.append(ScoreLiteral("set", score_loc, 0))
         if isinstance(cpl, CplSelector):
             ctx.file.append(f"execute "
                             f"if entity {self.value} "
@@ -1681,7 +1680,7 @@ class CplSelector(Cpl):
         if isinstance(cpl, CplInt) or isinstance(cpl, CplFloat):
             return self if cpl.value == 0 else CplInt(self.token, 1)
         score_loc = f"int_{get_uuid()} __temp__"
-        ctx.file.append(f"scoreboard players set {score_loc} 0")
+        ctx.file.append(ScoreLiteral("set", score_loc, 0))
         if isinstance(cpl, CplSelector):
             ctx.file.append(f"execute if entity {self.value} run scoreboard players add {score_loc} 1")
             ctx.file.append(f"execute if entity {cpl.value} run scoreboard players add {score_loc} 1")
@@ -1716,7 +1715,7 @@ class CplString(CplLiteral):
     def _cache(self, ctx, score_loc=None, nbt_loc=None, force=None, force_t=None):
         if force == "score":
             raise ValueError("Cannot store string as score")
-        ctx.file.append(f"data modify {nbt_loc} set {self.get_data_str(ctx)}")
+        ctx.file.append(modify_with(nbt_loc, "set", self.get_data_str(ctx)))
         return CplStringNBT(self.token, nbt_loc)
 
     def get_data_str(self, ctx):
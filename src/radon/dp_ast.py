@@ -9,7 +9,7 @@ from .tokenizer import (
     cpl_def_from_tokens,
     is_float,
     split_tokens,
-    tokenize, CMP_OP, CMP_COMBINE_OP,
+    tokenize, CMP_OP, CMP_COMBINE_OP, ANNOTATIONS,
 )
 from .utils import UniversalStrMixin
 
@@ -297,12 +297,18 @@ class IfFlowStatement(Statement):
 
 class LoopStatement(Statement):
     def __init__(
-            self, code: str, start: int, end: int, time: Token | None, body: List[Statement], step: List[Statement]
+            self, code: str, start: int, end: int, time: Token | None, body: List[Statement], step: List[Statement],
+            init: Statement | None = None, condition: List[Token] | None = None, unroll: int | None = None
     ):
         super().__init__(StatementType.LOOP, code, start, end)
         self.time = time
         self.body = body
         self.step = step
+        # the initializer and the condition of a for loop, the condition is also checked by the first statement
+        self.init = init
+        self.condition = condition
+        # the unroll hint, 0 to unroll the loop fully, otherwise how many iterations each call runs
+        self.unroll = unroll
 
 
 class IntroduceVariableStatement(Statement):
@@ -324,6 +330,8 @@ class DefineFunctionStatement(Statement):
             body: List[Statement],
             arguments: List[List[List[Token]]],
             returns: Union[List[Token], str],
+            inline: bool | None = None,
+            export: bool = False,
     ):
         super().__init__(StatementType.DEFINE_FUNCTION, code, start, end)
         self.name = name
@@ -332,6 +340,8 @@ class DefineFunctionStatement(Statement):
             arguments  # [ [ [TypeOfTheArgument...], [ NameOfTheArgument ] ] ]
         )
         self.returns = returns
+        self.inline = inline  # True for @inline, False for @noinline, None to let the optimizer decide
+        self.export = export  # @export, kept even if nothing in the pack calls it
 
 
 class ReturnStatement(Statement):
@@ -846,15 +856,28 @@ def parse_iterate(
         return True
     if t0.value == "for":
         # for <time> (<init>; <condition>; <iterator>) { <body> }
+        # for unroll [<factor>] (<init>; <condition>; <iterator>) { <body> }
         # for (<init>; <condition>; <iterator>) { <body> }
         t1 = next_token(tokens, index)
         if t1 is None:
             raise_syntax_error("Expected an expression", t0)
             return False
         tim = None
+        unroll = None
         if is_time(t1):
             tim = t1
             t1 = next_token(tokens, index)
+        elif t1.type == TokenType.FUNCTION_CALL and t1.func.value == "unroll":
+            # unroll(...) is grouped like a call
+            unroll = 0
+        elif t1.type == TokenType.IDENTIFIER and t1.value == "unroll":
+            unroll = 0
+            t1 = next_token(tokens, index)
+            if t1 is not None and t1.type == TokenType.INT_LITERAL:
+                unroll = int(t1.value)
+                if unroll < 1:
+                    raise_syntax_error("Expected a positive unroll factor", t1)
+                t1 = next_token(tokens, index)
         if not isinstance(t1, GroupToken) or t1.open.value != "(":
             raise_syntax_error(
                 "Expected an initializer, condition, and iterator inside the parentheses",
@@ -895,7 +918,10 @@ def parse_iterate(
             end=body.end,
             time=tim,
             body=loop_st_body,
-            step=it
+            step=it,
+            init=init,
+            condition=spl[1],
+            unroll=unroll
         )
 
         statements.append(loop_st)
@@ -1132,6 +1158,25 @@ def parse_iterate(
         index[0] = expr_ind
         return True
 
+    if t0.value == "@" and t0.type == TokenType.SYMBOL and peek_token(tokens, index) is not None \
+            and peek_token(tokens, index).value in ANNOTATIONS:
+        # @inline fn <name>...
+        # @noinline fn <name>...
+        # @export fn <name>...
+        t1 = next_token(tokens, index)
+        while peek_token(tokens, index) is not None and peek_token(tokens, index).type in ENDERS[:2]:
+            index[0] += 1
+        count = len(statements)
+        parse_iterate(statements, tokens, index, macros, class_names)
+        if len(statements) != count + 1 or not isinstance(statements[-1], DefineFunctionStatement):
+            raise_syntax_error("Expected a function definition after the annotation", t1)
+            return False
+        if t1.value == "export":
+            statements[-1].export = True
+        else:
+            statements[-1].inline = t1.value == "inline"
+        return True
+
     if t0.value == "fn":
         # fn <name>( <arguments> ) { <body> }
         # fn <name> { <body> }
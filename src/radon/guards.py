@@ -0,0 +1,132 @@
+import re
+from typing import Dict, List, Set, Tuple
+
+from .arguments import reachable
+from .ir import Command, Execute, Raw, Return, ScoreCondition, ScoreLiteral
+from .optimizer import callees
+
+# the flags a return, break or continue inside a block sets for the files that called the block
+FLAG = re.compile(r"__(?:returned__|break__\d+|continue__\d+) __temp__")
+RAW_GUARD = re.compile(r"\$execute if score (\S+ __temp__) matches 1\.\.1 run return ")
+
+
+class GuardEliminator:
+    """
+    Removes the commands that check the __returned__, __break__ and __continue__ flags after a block when the flag
+    can't be set there, and the commands that set a flag nothing checks anymore, like the ones that reset the flags of
+    a loop at the start of every iteration.
+
+    A flag can be set at a check if a command before it in the same file can set it, through any chain of calls, or if
+    it can be set where the file starts: in one of the places that call it, or anywhere when the file is run in another
+    way, like by a schedule or a function tag. A check that passes returns, so the flag isn't set after it.
+    """
+
+    def __init__(self, namespace: str) -> None:
+        self.namespace = namespace
+        self.fn_ref = re.compile(re.escape(namespace) + r":([a-z0-9_./-]+)")
+
+    def eliminate(self, files: Dict[str, List[Command]], roots: Set[str]) -> int:
+        """
+        Removes the commands in place and returns how many were removed. The roots are the files something other than
+        the functions can run, like the load and tick functions and the ones in function tags.
+        """
+        calls = {name: [callees(cmd, files, self.namespace) for cmd in cmds] for (name, cmds) in files.items()}
+        direct = {name: set(flag for cmd in cmds for flag in self._sets(cmd)) for (name, cmds) in files.items()}
+        # the flags that are set anywhere, the others are never set
+        every = set(flag for flags in direct.values() for flag in flags)
+        graph = {name: set(c for cmd_callees in calls[name] for c in cmd_callees) for name in files}
+        # file -> the flags it can set through any chain of calls
+        sets: Dict[str, Set[str]] = {}
+        for name in files:
+            reach = reachable(graph, name)
+            sets[name] = set(every) if None in reach else \
+                direct[name].union(*(direct[target] for target in reach if target is not None))
+        # file -> the flags that can be set when it starts
+        entry: Dict[str, Set[str]] = {name: set() for name in files}
+        for name in roots:
+            if name in files:
+                entry[name] = set(every)
+        for (name, cmds) in files.items():
+            for (index, cmd) in enumerate(cmds):
+                for target in self.fn_ref.findall(str(cmd)):
+                    if target in files and target not in calls[name][index]:
+                        # scheduled, or run in a way that isn't followed
+                        entry[target] = set(every)
+        queue = list(files)
+        while len(queue) > 0:
+            name = queue.pop()
+            for (target, state) in self._walk(files[name], calls[name], entry[name], sets)[1]:
+                if not state <= entry[target]:
+                    entry[target] |= state
+                    queue.append(target)
+        removed = 0
+        for (name, cmds) in files.items():
+            unneeded = self._walk(cmds, calls[name], entry[name], sets)[0]
+            if len(unneeded) > 0:
+                files[name] = [cmd for (index, cmd) in enumerate(cmds) if index not in unneeded]
+                removed += len(unneeded)
+        # the flags that are still checked, the commands that set the others do nothing
+        checked = set()
+        for cmds in files.values():
+            for cmd in cmds:
+                if not (isinstance(cmd, ScoreLiteral) and FLAG.fullmatch(cmd.target)):
+                    checked.update(FLAG.findall(str(cmd)))
+        for (name, cmds) in files.items():
+            kept = [cmd for cmd in cmds if not (isinstance(cmd, ScoreLiteral) and FLAG.fullmatch(cmd.target)
+                                                and cmd.target not in checked)]
+            removed += len(cmds) - len(kept)
+            files[name] = kept
+        return removed
+
+    def _guard(self, cmd: Command) -> str | None:
+        # the flag the command returns on, if it's a check after a block
+        if isinstance(cmd, Execute) and len(cmd.clauses) == 1 and isinstance(cmd.run, Return):
+            clause = cmd.clauses[0]
+            if isinstance(clause, ScoreCondition) and not clause.negate and clause.op == "matches" \
+                    and clause.value == "1..1" and FLAG.fullmatch(clause.target):
+                return clause.target
+        if isinstance(cmd, Raw):
+            match = RAW_GUARD.match(str(cmd))
+            if match is not None and FLAG.fullmatch(match.group(1)):
+                return match.group(1)
+        return None
+
+    def _sets(self, cmd: Command) -> Set[str]:
+        # the flags the command can set to anything other than 0
+        if self._guard(cmd) is not None:
+            return set()
+        if isinstance(cmd, ScoreLiteral) and cmd.op == "set" and cmd.value == 0:
+            return set()
+        return set(FLAG.findall(str(cmd)))
+
+    def _walk(self, cmds: List[Command], cmd_calls: List[List[str | None]], start: Set[str],
+              sets: Dict[str, Set[str]]) -> Tuple[Set[int], List[Tuple[str, Set[str]]]]:
+        # returns the checks that can't pass, and the files the commands call with the flags that can be set there
+        state = set(start)
+        unneeded = set()
+        calls = []
+        for (index, cmd) in enumerate(cmds):
+            flag = self._guard(cmd)
+            if flag is not None and flag not in state:
+                unneeded.add(index)
+                continue
+            if isinstance(cmd, ScoreLiteral) and FLAG.fullmatch(cmd.target) and cmd.op == "set" and cmd.value == 0:
+                state.discard(cmd.target)
+                continue
+            after = state | self._sets(cmd)
+            for target in cmd_calls[index]:
+                if target is None:
+                    continue
+                # a file that runs once for every entity starts with what the runs before it set too
+                repeats = isinstance(cmd, Raw) or isinstance(cmd, Execute) and cmd.changes_context
+                calls.append((target, state | sets[target] if repeats else state))
+                after |= sets[target]
+            if None in cmd_calls[index]:
+                after |= set().union(*sets.values())
+            state = after
+            if flag is not None:
+                # it returns when the flag is set
+                state.discard(flag)
+            if isinstance(cmd, Return):
+                break
+        return unneeded, calls
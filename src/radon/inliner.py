@@ -0,0 +1,250 @@
+import re
+from typing import Dict, List, Set, Tuple
+
+from .ir import Command, DataModify, DataGet, DataRemove, Execute, FunctionCall, Raw, Return, ScoreGet, ScoreLiteral, \
+    ScoreOperation
+from .optimizer import callees
+
+# the most commands a function can have to be inlined without @inline
+INLINE_THRESHOLD = 8
+RETURNED_RESET = ScoreLiteral("set", "__returned__ __temp__", 0)
+RETURN_REGEX = re.compile(r"(?:^|\brun )return\b")
+INT_LITERAL = re.compile(r"-?\d+")
+
+
+def is_arg_store(cmd: Command, location: str) -> bool:
+    # execute store result storage <location> int 1 run scoreboard players get <score>
+    return (
+            isinstance(cmd, Execute)
+            and len(cmd.clauses) == 1
+            and len(cmd.stores) == 1
+            and cmd.clauses[0].mode == "result"
+            and cmd.clauses[0].target == location
+            and cmd.clauses[0].data_type == "int"
+            and cmd.clauses[0].scale == "1"
+            and isinstance(cmd.run, ScoreGet)
+    )
+
+
+def is_arg_load(cmd: Command, location: str) -> bool:
+    # execute store result score <score> run data get storage <location>
+    return (
+            isinstance(cmd, Execute)
+            and len(cmd.clauses) == 1
+            and len(cmd.stores) == 1
+            and cmd.clauses[0].mode == "result"
+            and cmd.clauses[0].is_score
+            and isinstance(cmd.run, DataGet)
+            and cmd.run.source == location
+            and cmd.run.scale is None
+    )
+
+
+class Inliner:
+    """
+    Replaces the calls of the small functions with the commands of the functions, which saves the call, the arguments
+    going through the storage and the __returned__ flag. A function is inlined when it has at most a few commands, or
+    when it's marked with @inline, unless it's marked with @noinline, it calls itself through any chain of calls, it's
+    a macro function or it can return before its last command.
+
+    An argument that is a score or an int literal is read from the score or used as a literal by the inlined commands,
+    as long as only the function reads it, and the score doesn't change before it's read.
+    """
+
+    def __init__(self, namespace: str, threshold: int = INLINE_THRESHOLD) -> None:
+        self.namespace = namespace
+        self.threshold = threshold
+        # (function name, why its calls were or weren't inlined), in the order the functions were defined
+        self.decisions: List[Tuple[str, str]] = []
+        self.inlined = 0
+
+    def inline(self, files: Dict[str, List[Command]], functions: Dict[str, Tuple[str, bool | None]]) -> int:
+        """
+        Rewrites the files in place and returns the number of calls that were replaced. The functions are the files of
+        the Radon functions, with their names and whether they were marked with @inline (True) or @noinline (False).
+        """
+        graph = {name: set(c for cmd in cmds for c in callees(cmd, files, self.namespace) if c is not None)
+                 for (name, cmds) in files.items()}
+        # stack argument path -> the files that use it other than to pass it
+        readers: Dict[str, Set[str]] = {}
+        for (name, cmds) in files.items():
+            for cmd in cmds:
+                for path in re.findall(r"_fn_args\.\d+", str(cmd)):
+                    location = f"storage {self.namespace}:radon.temp {path}"
+                    if not self._passes(cmd, location):
+                        readers.setdefault(path, set()).add(name)
+        # file -> (whether it resets __returned__, the commands that replace its calls), None if it's not inlined
+        bodies: Dict[str, Tuple[bool, List[Command]] | None] = {}
+        reasons: Dict[str, str] = {}
+        counts: Dict[str, int] = {}
+        for name in self._order(graph):
+            files[name] = self._inline_calls(files[name], name, bodies, counts, readers)
+            if name in functions:
+                (bodies[name], reasons[name]) = self._body(name, files[name], functions[name][1], graph)
+        for (file, (fn_name, _)) in functions.items():
+            if file not in reasons:
+                continue
+            if bodies[file] is None:
+                self.decisions.append((fn_name, "not inlined, " + reasons[file]))
+            else:
+                self.decisions.append((fn_name, f"inlined into {counts.get(file, 0)} calls, " + reasons[file]))
+        return self.inlined
+
+    def _passes(self, cmd: Command, location: str) -> bool:
+        # the commands a call uses to pass a stack argument
+        return (
+                (isinstance(cmd, DataModify) and cmd.target == location and cmd.mode == "append")
+                or is_arg_store(cmd, location + "[-1]")
+                or (isinstance(cmd, DataRemove) and cmd.target == location + "[-1]")
+        )
+
+    def _order(self, graph: Dict[str, Set[str]]) -> List[str]:
+        # the called files come before the files that call them
+        order = []
+        seen = set()
+        for root in graph:
+            if root in seen:
+                continue
+            seen.add(root)
+            stack = [(root, iter(sorted(graph[root])))]
+            while len(stack) > 0:
+                (node, children) = stack[-1]
+                child = next((c for c in children if c not in seen and c in graph), None)
+                if child is None:
+                    stack.pop()
+                    order.append(node)
+                else:
+                    seen.add(child)
+                    stack.append((child, iter(sorted(graph[child]))))
+        return order
+
+    def _is_recursive(self, name: str, graph: Dict[str, Set[str]]) -> bool:
+        seen = set()
+        queue = list(graph[name])
+        while len(queue) > 0:
+            node = queue.pop()
+            if node == name:
+                return True
+            if node in seen or node not in graph:
+                continue
+            seen.add(node)
+            queue.extend(graph[node])
+        return False
+
+    def _body(self, name: str, cmds: List[Command], hint: bool | None, graph: Dict[str, Set[str]]) \
+            -> Tuple[Tuple[bool, List[Command]] | None, str]:
+        if hint is False:
+            return None, "marked with @noinline"
+        if self._is_recursive(name, graph):
+            return None, "recursive"
+        if any(isinstance(cmd, Raw) and str(cmd).startswith("$") for cmd in cmds):
+            return None, "macro function"
+        body = list(cmds)
+        reset = len(body) > 0 and body[0] == RETURNED_RESET
+        if reset:
+            body.pop(0)
+        if len(body) > 0 and isinstance(body[-1], Return):
+            last = body.pop()
+            if last.run is not None:
+                body.append(last.run)
+        if any(RETURN_REGEX.search(str(cmd)) for cmd in body):
+            return None, "returns early"
+        if hint:
+            return (reset, body), "marked with @inline"
+        if len(body) > self.threshold:
+            return None, f"{len(body)} commands"
+        return (reset, body), f"{len(body)} commands"
+
+    def _inline_calls(self, cmds: List[Command], name: str, bodies: Dict[str, Tuple[bool, List[Command]] | None],
+                      counts: Dict[str, int], readers: Dict[str, Set[str]]) -> List[Command]:
+        res = []
+        index = 0
+        while index < len(cmds):
+            cmd = cmds[index]
+            index += 1
+            target = None
+            if isinstance(cmd, FunctionCall) and cmd.source is None and cmd.arguments is None \
+                    and cmd.name.startswith(self.namespace + ":"):
+                target = cmd.name[len(self.namespace) + 1:]
+            if target is None or target == name or bodies.get(target) is None:
+                res.append(cmd)
+                continue
+            (reset, body) = bodies[target]
+            # the stack arguments are removed right after the call
+            pops = []
+            while index < len(cmds) and isinstance(cmds[index], DataRemove) and cmds[index].target.endswith("[-1]"):
+                pops.append(cmds[index].target[:-4])
+                index += 1
+            (body, kept) = self._substitute(res, body, pops, target, readers)
+            if reset and not (index < len(cmds) and cmds[index] == RETURNED_RESET):
+                # the caller doesn't reset the flag itself
+                res.append(RETURNED_RESET)
+            res.extend(body)
+            res.extend(DataRemove(location + "[-1]") for location in kept)
+            counts[target] = counts.get(target, 0) + 1
+            self.inlined += 1
+        return res
+
+    def _substitute(self, res: List[Command], body: List[Command], pops: List[str], target: str,
+                    readers: Dict[str, Set[str]]) -> Tuple[List[Command], List[str]]:
+        # the arguments are passed by the last commands before the call, in the order of the pops
+        setups = []
+        end = len(res)
+        for location in reversed(pops):
+            store = None
+            if end > 0 and is_arg_store(res[end - 1], location + "[-1]"):
+                store = res[end - 1]
+                end -= 1
+            if end == 0 or not (isinstance(res[end - 1], DataModify) and res[end - 1].target == location
+                                and res[end - 1].mode == "append"):
+                break
+            end -= 1
+            setups.append((location, end, store))
+        removed = set()
+        for (location, start, store) in setups:
+            append = res[start]
+            if readers.get(location.rsplit(" ", 1)[1], set()) - {target}:
+                # the files the function calls read it too
+                continue
+            if store is not None:
+                value = store.run
+            elif append.kind == "value" and INT_LITERAL.fullmatch(append.source):
+                value = int(append.source)
+            else:
+                continue
+            new_body = self._substitute_arg(body, location + "[-1]", value)
+            if new_body is not None:
+                body = new_body
+                removed.update((start, start + 1) if store is not None else (start,))
+        if len(removed) > 0:
+            res[:] = [cmd for (i, cmd) in enumerate(res) if i not in removed]
+        kept = [location for location in pops if not any(location == s[0] and s[1] in removed for s in setups)]
+        return body, kept
+
+    def _substitute_arg(self, body: List[Command], location: str, value: ScoreGet | int) -> List[Command] | None:
+        # returns None if the argument is used in any other way than being read into a score
+        path = location.rsplit(" ", 1)[1][:-4]
+        mention = re.compile(re.escape(path) + r"(?!\d)")
+        score = value.source if isinstance(value, ScoreGet) else None
+        objective = None if score is None else " " + score.rsplit(" ", 1)[1]
+        changed = False
+        res = []
+        for cmd in body:
+            if mention.search(str(cmd)):
+                if is_arg_load(cmd, location) and (score is None or not changed):
+                    target = cmd.clauses[0].target
+                    res.append(ScoreLiteral("set", target, value) if score is None
+                               else ScoreOperation(target, "=", score))
+                    continue
+                if score is None and isinstance(cmd, DataModify) and cmd.kind == "from" and cmd.source == location \
+                        and not mention.search(cmd.target):
+                    res.append(DataModify(cmd.target, cmd.mode, "value", str(value), cmd.bounds))
+                    continue
+                return None
+            res.append(cmd)
+            if score is not None and (
+                    cmd.opaque or len(cmd.calls()) > 0
+                    or any(s == score or (s[0] in "@*" and s.endswith(objective)) for s in cmd.score_writes())
+            ):
+                changed = True
+        return res
@@ -0,0 +1,666 @@
+import re
+from functools import lru_cache
+from typing import Callable, List, Sequence, Set, Tuple, Union
+
+# score locations are "<holder> <objective>" and data locations are "storage <id> <path>", "entity <selector> <path>" or
+# "block <x> <y> <z> <path>", the same strings Cpl.location holds
+
+DATA_KINDS = {"storage": 2, "entity": 2, "block": 4}
+TELLRAW_SCORE = re.compile(r'"score":\s*\{\s*"name":\s*"([^"]*)",\s*"objective":\s*"([^"]*)"\s*}')
+
+
+class Command:
+    """
+    A command of a generated function file. The files are lists of commands and of plain strings, which are lifted
+    into commands by lift() when a pass needs to look into them. str() gives the command's text. Commands are never
+    changed after they are made, passes replace them instead.
+    """
+    __slots__ = ("_text",)
+
+    # whether the command can read or write anything, like the commands that aren't understood by the parser
+    opaque = False
+
+    def _to_str(self) -> str:
+        raise NotImplementedError
+
+    def __str__(self) -> str:
+        # _text is only set once the text is needed
+        try:
+            return self._text
+        except AttributeError:
+            self._text = self._to_str()
+            return self._text
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({str(self)!r})"
+
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other) and str(self) == str(other)
+
+    def __hash__(self) -> int:
+        return hash(str(self))
+
+    def score_reads(self) -> Set[str]:
+        return set()
+
+    def score_writes(self) -> Set[str]:
+        return set()
+
+    def data_reads(self) -> Set[str]:
+        return set()
+
+    def data_writes(self) -> Set[str]:
+        return set()
+
+    def calls(self) -> List[str]:
+        # the functions this command runs, as namespace:name
+        return []
+
+
+class ScoreLiteral(Command):
+    """
+    scoreboard players set|add|remove <target> <value>
+    """
+    __slots__ = ("op", "target", "value")
+
+    def __init__(self, op: str, target: str, value: Union[int, str]) -> None:
+        self.op = op
+        self.target = target
+        self.value = int(value)
+
+    def _to_str(self) -> str:
+        return f"scoreboard players {self.op} {self.target} {self.value}"
+
+    def score_reads(self) -> Set[str]:
+        return set() if self.op == "set" else {self.target}
+
+    def score_writes(self) -> Set[str]:
+        return {self.target}
+
+
+class ScoreOperation(Command):
+    """
+    scoreboard players operation <target> <op> <source>
+    """
+    __slots__ = ("target", "op", "source")
+
+    def __init__(self, target: str, op: str, source: str) -> None:
+        self.target = target
+        self.op = op
+        self.source = source
+
+    def _to_str(self) -> str:
+        return f"scoreboard players operation {self.target} {self.op} {self.source}"
+
+    def score_reads(self) -> Set[str]:
+        return {self.source} if self.op == "=" else {self.target, self.source}
+
+    def score_writes(self) -> Set[str]:
+        return {self.target, self.source} if self.op == "><" else {self.target}
+
+
+class ScoreGet(Command):
+    __slots__ = ("source",)
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+
+    def _to_str(self) -> str:
+        return f"scoreboard players get {self.source}"
+
+    def score_reads(self) -> Set[str]:
+        return {self.source}
+
+
+class ScoreReset(Command):
+    __slots__ = ("target",)
+
+    def __init__(self, target: str) -> None:
+        self.target = target
+
+    def _to_str(self) -> str:
+        return f"scoreboard players reset {self.target}"
+
+    def score_writes(self) -> Set[str]:
+        return {self.target}
+
+
+class DataModify(Command):
+    """
+    data modify <target> <mode> value <value>
+    data modify <target> <mode> from <source>
+    data modify <target> <mode> string <source> [<start>] [<end>]
+    The mode is set, append, prepend, merge or "insert <index>".
+    """
+    __slots__ = ("target", "mode", "kind", "source", "bounds")
+
+    def __init__(self, target: str, mode: str, kind: str, source: str, bounds: str = "") -> None:
+        self.target = target
+        self.mode = mode
+        self.kind = kind
+        self.source = source
+        self.bounds = bounds
+
+    def _to_str(self) -> str:
+        return f"data modify {self.target} {self.mode} {self.kind} {self.source}" + (
+            " " + self.bounds if self.bounds else "")
+
+    def data_reads(self) -> Set[str]:
+        res = set() if self.kind == "value" else {self.source}
+        if self.mode != "set":
+            res.add(self.target)
+        return res
+
+    def data_writes(self) -> Set[str]:
+        return {self.target}
+
+
+def modify_with(target: str, mode: str, data: str) -> DataModify:
+    # data is "value <value>" or "from <source>", as Cpl.get_data_str() gives it
+    (kind, source) = data.split(" ", 1)
+    return DataModify(target, mode, kind, source)
+
+
+class DataGet(Command):
+    __slots__ = ("source", "scale")
+
+    def __init__(self, source: str, scale: str | None = None) -> None:
+        self.source = source
+        self.scale = scale
+
+    def _to_str(self) -> str:
+        return f"data get {self.source}" + ("" if self.scale is None else " " + self.scale)
+
+    def data_reads(self) -> Set[str]:
+        return {self.source}
+
+
+class DataRemove(Command):
+    __slots__ = ("target",)
+
+    def __init__(self, target: str) -> None:
+        self.target = target
+
+    def _to_str(self) -> str:
+        return f"data remove {self.target}"
+
+    def data_writes(self) -> Set[str]:
+        return {self.target}
+
+
+class FunctionCall(Command):
+    """
+    function <name> [with <source>]
+    function <name> <arguments compound>
+    """
+    __slots__ = ("name", "source", "arguments")
+
+    def __init__(self, name: str, source: str | None = None, arguments: str | None = None) -> None:
+        self.name = name
+        self.source = source
+        self.arguments = arguments
+
+    def _to_str(self) -> str:
+        if self.arguments is not None:
+            return f"function {self.name} {self.arguments}"
+        return f"function {self.name}" + ("" if self.source is None else " with " + self.source)
+
+    def data_reads(self) -> Set[str]:
+        return set() if self.source is None else {self.source}
+
+    def calls(self) -> List[str]:
+        return [self.name]
+
+
+class Schedule(Command):
+    """
+    schedule function <name> <time> [append|replace]
+    """
+    __slots__ = ("name", "time", "mode")
+
+    def __init__(self, name: str, time: str, mode: str | None = None) -> None:
+        self.name = name
+        self.time = time
+        self.mode = mode
+
+    def _to_str(self) -> str:
+        return f"schedule function {self.name} {self.time}" + ("" if self.mode is None else " " + self.mode)
+
+    def calls(self) -> List[str]:
+        return [self.name]
+
+
+class Return(Command):
+    """
+    return <value>, return fail or return run <command>
+    """
+    __slots__ = ("value", "run")
+
+    def __init__(self, value: Union[int, str, None] = 0, run: Command | None = None) -> None:
+        self.value = None if run is not None else str(value)
+        self.run = run
+
+    def _to_str(self) -> str:
+        return "return run " + str(self.run) if self.run is not None else "return " + self.value
+
+    @property
+    def opaque(self) -> bool:
+        return self.run is not None and self.run.opaque
+
+    def score_reads(self) -> Set[str]:
+        return set() if self.run is None else self.run.score_reads()
+
+    def score_writes(self) -> Set[str]:
+        return set() if self.run is None else self.run.score_writes()
+
+    def data_reads(self) -> Set[str]:
+        return set() if self.run is None else self.run.data_reads()
+
+    def data_writes(self) -> Set[str]:
+        return set() if self.run is None else self.run.data_writes()
+
+    def calls(self) -> List[str]:
+        return [] if self.run is None else self.run.calls()
+
+
+class Clause:
+    """
+    A subcommand of an execute command.
+    """
+    __slots__ = ("args",)
+
+    def __init__(self, args: Sequence[str]) -> None:
+        # tuples of strings aren't tracked by the garbage collector, the lists are
+        self.args = tuple(args)
+
+    def __str__(self) -> str:
+        return " ".join(self.args)
+
+    def score_reads(self) -> Set[str]:
+        return set()
+
+    def data_reads(self) -> Set[str]:
+        return set()
+
+
+class Store(Clause):
+    """
+    store result|success score <target>
+    store result|success <data target> <type> <scale>
+    """
+    __slots__ = ("mode", "target", "data_type", "scale")
+
+    def __init__(self, mode: str, target: str, data_type: str | None = None, scale: str | None = None) -> None:
+        self.mode = mode
+        self.target = target
+        self.data_type = data_type
+        self.scale = scale
+        if data_type is None:
+            super().__init__(("store", mode, "score", target))
+        else:
+            super().__init__(("store", mode, target, data_type, scale))
+
+    @property
+    def is_score(self) -> bool:
+        return self.data_type is None
+
+
+class ScoreCondition(Clause):
+    """
+    if|unless score <target> matches <range>
+    if|unless score <target> <op> <source>
+    """
+    __slots__ = ("negate", "target", "op", "value")
+
+    def __init__(self, negate: bool, target: str, op: str, value: str) -> None:
+        self.negate = negate
+        self.target = target
+        self.op = op
+        self.value = value
+        super().__init__(("unless" if negate else "if", "score", target, op, value))
+
+    def score_reads(self) -> Set[str]:
+        return {self.target} if self.op == "matches" else {self.target, self.value}
+
+
+class DataCondition(Clause):
+    __slots__ = ("negate", "source")
+
+    def __init__(self, negate: bool, source: str) -> None:
+        self.negate = negate
+        self.source = source
+        super().__init__(("unless" if negate else "if", "data", source))
+
+    def data_reads(self) -> Set[str]:
+        return {self.source}
+
+
+class Condition(Clause):
+    """
+    Any other if or unless subcommand, like if entity.
+    """
+    __slots__ = ("negate",)
+
+    def __init__(self, args: Sequence[str]) -> None:
+        self.negate = args[0] == "unless"
+        super().__init__(args)
+
+
+class Modifier(Clause):
+    """
+    A subcommand that changes the context of the command, like as, at or positioned.
+    """
+    __slots__ = ()
+
+
+class Execute(Command):
+    __slots__ = ("clauses", "run")
+
+    def __init__(self, clauses: Sequence[Clause], run: Command | None = None) -> None:
+        self.clauses = tuple(clauses)
+        self.run = run
+
+    def _to_str(self) -> str:
+        return "execute " + " ".join(str(c) for c in self.clauses) + (
+            "" if self.run is None else " run " + str(self.run))
+
+    @property
+    def opaque(self) -> bool:
+        return self.run is not None and self.run.opaque
+
+    @property
+    def stores(self) -> List[Store]:
+        return [c for c in self.clauses if isinstance(c, Store)]
+
+    @property
+    def is_conditional(self) -> bool:
+        return any(isinstance(c, (ScoreCondition, DataCondition, Condition)) for c in self.clauses)
+
+    @property
+    def changes_context(self) -> bool:
+        return any(isinstance(c, Modifier) for c in self.clauses)
+
+    def score_reads(self) -> Set[str]:
+        res = set()
+        for c in self.clauses:
+            res.update(c.score_reads())
+        if self.run is not None:
+            res.update(self.run.score_reads())
+        return res
+
+    def score_writes(self) -> Set[str]:
+        res = set(c.target for c in self.stores if c.is_score)
+        if self.run is not None:
+            res.update(self.run.score_writes())
+        return res
+
+    def data_reads(self) -> Set[str]:
+        res = set()
+        for c in self.clauses:
+            res.update(c.data_reads())
+        if self.run is not None:
+            res.update(self.run.data_reads())
+        return res
+
+    def data_writes(self) -> Set[str]:
+        res = set(c.target for c in self.stores if not c.is_score)
+        if self.run is not None:
+            res.update(self.run.data_writes())
+        return res
+
+    def calls(self) -> List[str]:
+        # execute if function runs the function as well
+        res = [c.args[2] for c in self.clauses if isinstance(c, Condition) and c.args[1] == "function"]
+        return res if self.run is None else res + self.run.calls()
+
+
+class Raw(Command):
+    """
+    A command that isn't modeled, including the macro lines. The scores it reads in tellraw components are known, but
+    it's opaque to the passes otherwise.
+    """
+    __slots__ = ()
+    opaque = True
+
+    def __init__(self, text: str) -> None:
+        self._text = text
+
+    def _to_str(self) -> str:
+        return self._text
+
+    def score_reads(self) -> Set[str]:
+        return set(f"{name} {objective}" for (name, objective) in TELLRAW_SCORE.findall(self._text))
+
+
+# only the characters split_args cares about, the rest of the text is skipped
+SPLIT_SPECIAL = re.compile(r"""["'\\\[\]{}() ]""")
+SPLIT_QUOTED = re.compile(r"""["']""")
+
+
+def data_overlaps(a: str, b: str) -> bool:
+    # whether two data locations can refer to the same tag, a path includes the paths inside of it
+    if len(a) > len(b):
+        (a, b) = (b, a)
+    return b.startswith(a) and (len(a) == len(b) or b[len(a)] in ".[{")
+
+
+def mentions_score(cmd: Command, location: str) -> bool:
+    if location in cmd.score_reads() or location in cmd.score_writes():
+        return True
+    return cmd.opaque and location in str(cmd)
+
+
+def mentions_data(cmd: Command, location: str) -> bool:
+    if any(data_overlaps(location, loc) for loc in cmd.data_reads() | cmd.data_writes()):
+        return True
+    return cmd.opaque and location in str(cmd)
+
+
+def split_args(text: str) -> Tuple[List[str], List[int]]:
+    # splits at the spaces outside of brackets and quotes, returns the arguments and where each of them starts
+    if SPLIT_QUOTED.search(text) is None:
+        # without quotes, the spaces can be split at and the pieces inside brackets joined back
+        res = []
+        starts = []
+        start = 0
+        depth = 0
+        for piece in text.split(" "):
+            if depth > 0:
+                res[-1] += " " + piece
+            elif piece != "":
+                res.append(piece)
+                starts.append(start)
+            if "[" in piece or "]" in piece or "{" in piece or "}" in piece or "(" in piece or ")" in piece:
+                depth += piece.count("[") + piece.count("{") + piece.count("(") - piece.count("]") \
+                         - piece.count("}") - piece.count(")")
+            start += len(piece) + 1
+        return res, starts
+    res = []
+    starts = []
+    depth = 0
+    quote = None
+    start = 0
+    escaped = -1
+    for m in SPLIT_SPECIAL.finditer(text):
+        i = m.start()
+        if i == escaped:
+            continue
+        c = m.group(0)
+        if quote is not None:
+            if c == "\\":
+                escaped = i + 1
+            elif c == quote:
+                quote = None
+        elif c == '"' or c == "'":
+            quote = c
+        elif c in "[{(":
+            depth += 1
+        elif c in "]})":
+            depth -= 1
+        elif c == " " and depth == 0:
+            if i != start:
+                res.append(text[start:i])
+                starts.append(start)
+            start = i + 1
+    if start < len(text):
+        res.append(text[start:])
+        starts.append(start)
+    return res, starts
+
+
+def take_data_location(args: List[str], i: int) -> int:
+    # returns the index after the data location starting at i
+    count = DATA_KINDS.get(args[i]) if i < len(args) else None
+    if count is None or i + count >= len(args):
+        raise ValueError("Invalid data location")
+    return i + count + 1
+
+
+EXECUTE_ARITIES = {"as": 1, "at": 1, "in": 1, "on": 1, "summon": 1, "align": 1, "anchored": 1, "rotated": 2}
+CONDITION_ARITIES = {"entity": 1, "block": 4, "biome": 4, "dimension": 1, "function": 1, "loaded": 3,
+                     "predicate": 1, "blocks": 10}
+
+
+def parse_execute(args: List[str], rest: Callable[[int], str]) -> Command:
+    clauses: List[Clause] = []
+    i = 1
+    while i < len(args):
+        sub = args[i]
+        if sub == "run":
+            return Execute(clauses, parse_run(args, rest, i + 1))
+        if sub in EXECUTE_ARITIES:
+            end = i + 1 + EXECUTE_ARITIES[sub]
+            clauses.append(Modifier(args[i:end]))
+        elif sub == "positioned":
+            end = i + (3 if args[i + 1] in {"as", "over"} else 4)
+            clauses.append(Modifier(args[i:end]))
+        elif sub == "facing":
+            # facing <x> <y> <z> or facing entity <selector> <anchor>
+            end = i + 4
+            clauses.append(Modifier(args[i:end]))
+        elif sub == "store":
+            if args[i + 2] == "score":
+                end = i + 5
+                clauses.append(Store(args[i + 1], " ".join(args[i + 3:end])))
+            elif args[i + 2] == "bossbar":
+                end = i + 5
+                clauses.append(Modifier(args[i:end]))
+            else:
+                loc_end = take_data_location(args, i + 2)
+                end = loc_end + 2
+                clauses.append(Store(args[i + 1], " ".join(args[i + 2:loc_end]), args[loc_end], args[loc_end + 1]))
+        elif sub in {"if", "unless"}:
+            negate = sub == "unless"
+            test = args[i + 1]
+            if test == "score":
+                end = i + 6 if args[i + 4] == "matches" else i + 7
+                clauses.append(ScoreCondition(negate, " ".join(args[i + 2:i + 4]), args[i + 4],
+                                              " ".join(args[i + 5:end])))
+            elif test == "data":
+                end = take_data_location(args, i + 2)
+                clauses.append(DataCondition(negate, " ".join(args[i + 2:end])))
+            elif test in CONDITION_ARITIES:
+                end = i + 2 + CONDITION_ARITIES[test]
+                clauses.append(Condition(args[i:end]))
+            else:
+                raise ValueError("Unknown condition")
+        else:
+            raise ValueError("Unknown subcommand")
+        if end > len(args):
+            raise ValueError("Incomplete subcommand")
+        i = end
+    return Execute(clauses)
+
+
+def parse_run(args: List[str], rest: Callable[[int], str], i: int) -> Command:
+    # the command after run is parsed from its own text, so it keeps its spacing and can be a Raw command
+    if i >= len(args):
+        raise ValueError("Expected a command after run")
+    return parse_command(rest(i))
+
+
+def parse_args(args: List[str], rest: Callable[[int], str]) -> Command:
+    # rest(i) is the text of the command from the argument at i
+    cmd = args[0]
+    if cmd == "scoreboard" and args[1] == "players":
+        op = args[2]
+        if op in {"set", "add", "remove"} and len(args) == 6:
+            return ScoreLiteral(op, args[3] + " " + args[4], args[5])
+        if op == "operation" and len(args) == 8:
+            return ScoreOperation(args[3] + " " + args[4], args[5], args[6] + " " + args[7])
+        if op == "get" and len(args) == 5:
+            return ScoreGet(args[3] + " " + args[4])
+        if op == "reset" and len(args) == 5:
+            return ScoreReset(args[3] + " " + args[4])
+    elif cmd == "data":
+        if args[1] == "modify":
+            end = take_data_location(args, 2)
+            mode = args[end]
+            if mode == "insert":
+                mode += " " + args[end + 1]
+                end += 1
+            kind = args[end + 1]
+            if kind == "value":
+                return DataModify(" ".join(args[2:end]), mode, kind, " ".join(args[end + 2:]))
+            if kind in {"from", "string"}:
+                src_end = take_data_location(args, end + 2)
+                if kind == "from" and src_end != len(args):
+                    raise ValueError("Unexpected arguments")
+                return DataModify(" ".join(args[2:end]), mode, kind, " ".join(args[end + 2:src_end]),
+                                  " ".join(args[src_end:]))
+        elif args[1] == "get":
+            end = take_data_location(args, 2)
+            if end >= len(args) - 1:
+                return DataGet(" ".join(args[2:end]), args[end] if end < len(args) else None)
+        elif args[1] == "remove":
+            end = take_data_location(args, 2)
+            if end == len(args):
+                return DataRemove(" ".join(args[2:end]))
+    elif cmd == "function":
+        if len(args) == 2:
+            return FunctionCall(args[1])
+        if args[2] == "with" and len(args) > 4:
+            return FunctionCall(args[1], " ".join(args[3:]))
+        if len(args) == 3 and args[2][:1] == "{":
+            return FunctionCall(args[1], arguments=args[2])
+    elif cmd == "schedule":
+        if args[1] == "function" and len(args) in {4, 5}:
+            return Schedule(args[2], args[3], args[4] if len(args) == 5 else None)
+    elif cmd == "execute":
+        return parse_execute(args, rest)
+    elif cmd == "return":
+        if args[1] == "run":
+            return Return(run=parse_run(args, rest, 2))
+        if len(args) == 2:
+            return Return(args[1])
+    raise ValueError("Unknown command")
+
+
+@lru_cache(maxsize=65536)
+def parse_command(text: str) -> Command:
+    """
+    Parses a command's text into a command object, which is a Raw command if it isn't understood. The text of the
+    result is always the same as the given one.
+    """
+    if text[:1] in {"", "$", "#"} or "\n" in text:
+        return Raw(text)
+    (args, starts) = split_args(text)
+    try:
+        res = parse_args(args, lambda i: text[starts[i]:])
+    except (ValueError, IndexError):
+        return Raw(text)
+    if str(res) != text:
+        return Raw(text)
+    return res
+
+
+def lift(line: Union[str, Command]) -> Command:
+    return line if isinstance(line, Command) else parse_command(line)
+
+
+def lift_all(lines: List[Union[str, Command]]) -> List[Command]:
+    return [line if isinstance(line, Command) else parse_command(line) for line in lines]
+
+
+def render(lines: List[Union[str, Command]]) -> str:
+    return "\n".join(map(str, lines))
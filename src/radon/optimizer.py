@@ -0,0 +1,299 @@
+import re
+from typing import Callable, Dict, List, Set
+
+from .ir import (Command, DataGet, Execute, Return, Schedule, ScoreGet, ScoreLiteral, ScoreOperation, Store,
+                 mentions_score)
+
+# the scores the transpiler makes for the intermediate values of expressions
+TEMP_SCORE = re.compile(r"(?:int|float)_\d+ __temp__")
+# their names, as they appear in the commands that aren't understood, like "name":"int_1" in text components
+TEMP_NAME = re.compile(r"(?<![\w.])(?:int|float)_\d+(?!\w)")
+# the data types that can hold any score without losing precision
+EXACT_DATA_TYPES = ("int", "long", "double")
+# the function names in the commands, including the ones in macro lines and text components
+CALL_REGEX = re.compile(r"function\s+(\S+)")
+
+
+def is_temp(score: str) -> bool:
+    return TEMP_SCORE.fullmatch(score) is not None
+
+
+def is_always_set(score: str) -> bool:
+    # the transpiler sets every score of the __temp__ objective before reading it
+    return score.endswith(" __temp__")
+
+
+def reads_score(cmd: Command, score: str) -> bool:
+    # the commands that aren't understood read every temporary score whose name they mention
+    return score in cmd.score_reads() or (cmd.opaque and score.split(" ")[0] in TEMP_NAME.findall(str(cmd)))
+
+
+def temps_read(cmd: Command) -> Set[str]:
+    if cmd.opaque:
+        return cmd.score_reads() | set(f"{name} __temp__" for name in TEMP_NAME.findall(str(cmd)))
+    return cmd.score_reads()
+
+
+def only_stores(cmd: Execute) -> bool:
+    # an execute command that runs exactly once, so its stores always happen
+    return len(cmd.clauses) > 0 and all(isinstance(c, Store) for c in cmd.clauses)
+
+
+def defines(cmd: Command, score: str) -> bool:
+    """
+    Whether the command sets the score without reading it, and writes nothing else.
+    """
+    if isinstance(cmd, ScoreLiteral):
+        return cmd.op == "set" and cmd.target == score
+    if isinstance(cmd, ScoreOperation):
+        return cmd.op == "=" and cmd.target == score and cmd.source != score
+    if isinstance(cmd, Execute):
+        return (len(cmd.clauses) == 1 and only_stores(cmd) and cmd.clauses[0].is_score
+                and cmd.clauses[0].target == score and cmd.run is not None
+                and not mentions_score(cmd.run, score) and len(cmd.run.calls()) == 0)
+    return False
+
+
+def overwrites(cmd: Command, score: str) -> bool:
+    # whether the command always writes the score, the value it had before doesn't matter after it
+    if isinstance(cmd, Execute) and only_stores(cmd):
+        return any(c.is_score and c.target == score for c in cmd.clauses)
+    return defines(cmd, score) or (isinstance(cmd, ScoreLiteral) and cmd.op == "set" and cmd.target == score)
+
+
+def retarget(cmd: Command, score: str, target: str) -> Command:
+    # the same command, writing to target instead of score
+    if isinstance(cmd, ScoreLiteral):
+        return ScoreLiteral(cmd.op, target, cmd.value)
+    if isinstance(cmd, ScoreOperation):
+        return ScoreOperation(target, cmd.op, cmd.source)
+    clauses = [Store(c.mode, target) if c.is_score and c.target == score else c for c in cmd.clauses]
+    return Execute(clauses, cmd.run)
+
+
+def updates(cmd: Command, score: str, other: str) -> bool:
+    # whether the command changes the score based on its own value and something that isn't the other score
+    if isinstance(cmd, ScoreLiteral):
+        return cmd.op != "set" and cmd.target == score
+    if isinstance(cmd, ScoreOperation):
+        return cmd.target == score and cmd.op not in ("=", "><") and cmd.source not in (score, other)
+    return False
+
+
+def may_alias(a: str, b: str) -> bool:
+    # a selector like @s can be the same holder as any other name
+    (holder_a, objective_a) = a.rsplit(" ", 1)
+    (holder_b, objective_b) = b.rsplit(" ", 1)
+    return objective_a == objective_b and (holder_a == holder_b or holder_a[0] == "@" or holder_b[0] == "@")
+
+
+def independent(cmd: Command, *scores: str) -> bool:
+    # whether the command can be moved past the writes of the scores
+    if cmd.opaque or isinstance(cmd, Return) or len(cmd.calls()) > 0:
+        return False
+    return not any(may_alias(used, score) for used in cmd.score_reads() | cmd.score_writes() for score in scores)
+
+
+def callees(cmd: Command, files: Dict[str, List[Command]], namespace: str) -> List[str | None]:
+    # the files the command can run right away, None for the ones that can't be followed
+    if isinstance(cmd, Schedule):
+        return []
+    text = str(cmd)
+    if "function" not in text and not (cmd.opaque and "advancement" in text):
+        return []
+    res = []
+    if cmd.opaque and "advancement" in text:
+        # the reward functions of the advancements it grants
+        res.append(None)
+    for target in CALL_REGEX.findall(text):
+        if text.startswith("schedule ") or "schedule function " + target in text:
+            continue
+        (name, _, path) = target.partition(":")
+        if name != namespace or path not in files or "$" in target:
+            res.append(None)
+        else:
+            res.append(path)
+    return res
+
+
+class PeepholeRule:
+    """
+    A rewrite of size commands in a row. rewrite(optimizer, commands, index) returns the commands that replace
+    commands[index:index + size], or None if the rule doesn't apply there.
+    """
+
+    def __init__(self, name: str, size: int,
+                 rewrite: Callable[["PeepholeOptimizer", List[Command], int], List[Command] | None]) -> None:
+        self.name = name
+        self.size = size
+        self.rewrite = rewrite
+
+
+def rule_add_zero(opt: "PeepholeOptimizer", cmds: List[Command], i: int):
+    # scoreboard players add|remove X 0, it only changes a score that isn't set yet
+    cmd = cmds[i]
+    if isinstance(cmd, ScoreLiteral) and cmd.op != "set" and cmd.value == 0 and is_always_set(cmd.target):
+        return []
+
+
+def rule_self_copy(opt: "PeepholeOptimizer", cmds: List[Command], i: int):
+    # scoreboard players operation X = X
+    cmd = cmds[i]
+    if isinstance(cmd, ScoreOperation) and cmd.op == "=" and cmd.source == cmd.target:
+        return []
+
+
+def rule_copy_forward(opt: "PeepholeOptimizer", cmds: List[Command], i: int):
+    # A = <value>, C = A where A isn't used again -> C = <value>
+    (first, copy) = (cmds[i], cmds[i + 1])
+    if not isinstance(copy, ScoreOperation) or copy.op != "=" or copy.source == copy.target:
+        return None
+    (score, target) = (copy.source, copy.target)
+    if defines(first, score) and opt.is_dead(cmds, i + 2, score):
+        return [retarget(first, score, target)]
+
+
+def rule_sink_copy(opt: "PeepholeOptimizer", cmds: List[Command], i: int):
+    # moves C = A up, towards the definition of A that copy_forward merges it into:
+    # A += B, C = A -> C = A, C += B and X, C = A -> C = A, X if X doesn't use A or C
+    (cmd, copy) = (cmds[i], cmds[i + 1])
+    if not isinstance(copy, ScoreOperation) or copy.op != "=" or copy.source == copy.target:
+        return None
+    (score, target) = (copy.source, copy.target)
+    if updates(cmd, score, target):
+        moved = retarget(cmd, score, target)
+    elif independent(cmd, score, target):
+        moved = cmd
+    else:
+        return None
+    if not opt.is_dead(cmds, i + 2, score):
+        return None
+    # only move it if it gets to the definition, it would just be moving around otherwise
+    for j in range(i - 1, -1, -1):
+        if defines(cmds[j], score):
+            return [copy, moved]
+        if not updates(cmds[j], score, target) and not independent(cmds[j], score, target):
+            return None
+    return None
+
+
+def rule_store_load(opt: "PeepholeOptimizer", cmds: List[Command], i: int):
+    # execute store result <data> int 1 run scoreboard players get X,
+    # execute store result score Y run data get <data> -> the second one is Y = X
+    (store, load) = (cmds[i], cmds[i + 1])
+    if not (isinstance(store, Execute) and isinstance(store.run, ScoreGet) and len(store.clauses) == 1
+            and isinstance(load, Execute) and isinstance(load.run, DataGet) and len(load.clauses) == 1):
+        return None
+    (stored, loaded) = (store.clauses[0], load.clauses[0])
+    if (isinstance(stored, Store) and stored.mode == "result" and not stored.is_score
+            and stored.data_type in EXACT_DATA_TYPES and stored.scale == "1"
+            and isinstance(loaded, Store) and loaded.mode == "result" and loaded.is_score
+            and load.run.source == stored.target and load.run.scale in (None, "1")
+            and is_always_set(store.run.source)):
+        return [store, ScoreOperation(loaded.target, "=", store.run.source)]
+
+
+def rule_dead_store(opt: "PeepholeOptimizer", cmds: List[Command], i: int):
+    # a temporary score that is set and never read
+    cmd = cmds[i]
+    if isinstance(cmd, (ScoreLiteral, ScoreOperation)) and cmd.op != "><":
+        score = cmd.target
+    elif (isinstance(cmd, Execute) and len(cmd.clauses) == 1 and only_stores(cmd) and cmd.clauses[0].is_score
+          and isinstance(cmd.run, (ScoreGet, DataGet))):
+        # the other commands it could run might have side effects
+        score = cmd.clauses[0].target
+    else:
+        return None
+    if opt.is_dead(cmds, i + 1, score):
+        return []
+
+
+PEEPHOLE_RULES = [
+    PeepholeRule("add_zero", 1, rule_add_zero),
+    PeepholeRule("self_copy", 1, rule_self_copy),
+    PeepholeRule("copy_forward", 2, rule_copy_forward),
+    PeepholeRule("sink_copy", 2, rule_sink_copy),
+    PeepholeRule("store_load", 2, rule_store_load),
+    PeepholeRule("dead_store", 1, rule_dead_store),
+]
+
+
+class PeepholeOptimizer:
+    """
+    Slides a window over the commands of every function file and applies the first rule that matches at each
+    position, until none of them do. The temporary scores are the only ones that are removed or renamed, and only the
+    ones that a single file uses, so the functions calling each other don't have to be analyzed.
+    """
+
+    def __init__(self, rules: List[PeepholeRule] = None) -> None:
+        self.rules = PEEPHOLE_RULES if rules is None else rules
+        self.counts: Dict[str, int] = {rule.name: 0 for rule in self.rules}
+        # temporary score -> the files mentioning it
+        self.users: Dict[str, Set[str]] = {}
+        self.file = None
+        # the temporary scores the current file can read before setting them
+        self.live_in: Set[str] = set()
+
+    def optimize(self, files: Dict[str, List[Command]]) -> Dict[str, int]:
+        for (name, cmds) in files.items():
+            for cmd in cmds:
+                scores = cmd.score_reads() | cmd.score_writes()
+                if cmd.opaque:
+                    scores.update(f"{n} __temp__" for n in TEMP_NAME.findall(str(cmd)))
+                for score in scores:
+                    if is_temp(score):
+                        self.users.setdefault(score, set()).add(name)
+        for name in files:
+            self.file = name
+            files[name] = self.optimize_file(files[name])
+        return self.counts
+
+    def optimize_file(self, cmds: List[Command]) -> List[Command]:
+        cmds = list(cmds)
+        # the rules never move a read of a score before its first write, so this doesn't change while rewriting
+        self.live_in = set()
+        written = set()
+        for cmd in cmds:
+            self.live_in.update(score for score in temps_read(cmd) if score not in written)
+            written.update(score for score in cmd.score_writes() if overwrites(cmd, score))
+        back = max(rule.size for rule in self.rules) - 1
+        i = 0
+        while i < len(cmds):
+            for rule in self.rules:
+                if i + rule.size > len(cmds):
+                    continue
+                res = rule.rewrite(self, cmds, i)
+                if res is not None:
+                    cmds[i:i + rule.size] = res
+                    self.counts[rule.name] += 1
+                    # the commands before can match now
+                    i = max(0, i - back)
+                    break
+            else:
+                i += 1
+        return cmds
+
+    def is_dead(self, cmds: List[Command], start: int, score: str) -> bool:
+        """
+        Whether the value the score has before cmds[start] is never read. The score has to be a temporary one that
+        only this file uses, and that the file sets before reading, so that the value can't be left over from an
+        earlier call of the function either.
+        """
+        if not is_temp(score) or self.users.get(score) != {self.file}:
+            return False
+        return score not in self.live_in and self._unread(cmds, start, score)
+
+    def _unread(self, cmds: List[Command], start: int, score: str) -> bool:
+        name = score.split(" ")[0]
+        for index in range(start, len(cmds)):
+            cmd = cmds[index]
+            if isinstance(cmd, Return) and cmd.run is None:
+                return True
+            # most of the commands don't mention the score at all
+            if name not in str(cmd):
+                continue
+            if reads_score(cmd, score):
+                return False
+            if overwrites(cmd, score):
+                return True
+        return True
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import shutil
+import zipfile
+from typing import Dict, Tuple
+
+# output path -> fingerprint of its content, as written by the previous build
+Manifest = Dict[str, str]
+
+# the earliest time a zip entry can have, so that the archive doesn't depend on when it was built
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def manifest_path(cache_folder: str, out_folder: str) -> str:
+    name = hashlib.sha1(os.path.realpath(out_folder).encode()).hexdigest()[:16]
+    return os.path.join(cache_folder, f"manifest-{name}.json")
+
+
+def load_manifest(pt: str) -> Manifest | None:
+    try:
+        with open(pt, "r") as file:
+            res = json.loads(file.read())
+    except (OSError, ValueError):
+        return None
+    return res if isinstance(res, dict) else None
+
+
+def save_manifest(pt: str, manifest: Manifest):
+    os.makedirs(os.path.dirname(pt), exist_ok=True)
+    with open(pt, "w") as file:
+        file.write(json.dumps(manifest))
+
+
+class ManifestCache:
+    """
+    Keeps the manifests in memory between the builds of a long running process. A manifest is read again if its file
+    has changed since, like when another process has built the same project.
+    """
+
+    def __init__(self) -> None:
+        # path -> (modification time and size of the file, manifest)
+        self.manifests: Dict[str, Tuple[Tuple[int, int], Manifest]] = {}
+
+    def load(self, pt: str) -> Manifest | None:
+        try:
+            st = os.stat(pt)
+        except OSError:
+            self.manifests.pop(pt, None)
+            return None
+        cached = self.manifests.get(pt)
+        if cached is not None and cached[0] == (st.st_mtime_ns, st.st_size):
+            return cached[1]
+        manifest = load_manifest(pt)
+        if manifest is not None:
+            self.manifests[pt] = ((st.st_mtime_ns, st.st_size), manifest)
+        return manifest
+
+    def save(self, pt: str, manifest: Manifest):
+        save_manifest(pt, manifest)
+        st = os.stat(pt)
+        self.manifests[pt] = ((st.st_mtime_ns, st.st_size), manifest)
+
+
+def data_folder_files(data_folder: str) -> Dict[str, str]:
+    """
+    Returns the files in the data folder as output path -> source path.
+    """
+    res = {}
+    if not os.path.isdir(data_folder):
+        return res
+    for root, _, files in os.walk(data_folder):
+        rel = os.path.relpath(root, data_folder)
+        for f in files:
+            res["data/" + (f if rel == "." else rel.replace(os.sep, "/") + "/" + f)] = os.path.join(root, f)
+    return res
+
+
+def remove_empty_dirs(out_folder: str, pt: str):
+    out_folder = os.path.realpath(out_folder)
+    pt = os.path.realpath(pt)
+    while pt != out_folder and pt.startswith(out_folder + os.sep):
+        try:
+            os.rmdir(pt)
+        except OSError:
+            return
+        pt = os.path.dirname(pt)
+
+
+def sync_output(
+        out_folder: str,
+        dp_files: Dict[str, str],
+        data_files: Dict[str, str],
+        manifest: Manifest | None
+) -> Tuple[Manifest, int, int, int]:
+    """
+    Writes the datapack files and copies the data folder into the out folder, skipping the files whose content is the
+    same as in the manifest of the previous build, and removes the files the previous build wrote but this one didn't.
+    Returns the new manifest and the written, unchanged and deleted file counts.
+    """
+    if manifest is None:
+        manifest = {}
+    new_manifest: Manifest = {}
+    to_write = []
+
+    # data folder files are fingerprinted by their stat, so unchanged assets aren't read at all
+    for name in data_files:
+        if name in dp_files:
+            continue
+        st = os.stat(data_files[name])
+        new_manifest[name] = f"s:{st.st_mtime_ns}:{st.st_size}"
+    for name in dp_files:
+        new_manifest[name] = "h:" + hashlib.sha1(dp_files[name].encode()).hexdigest()
+
+    unchanged = 0
+    for name in new_manifest:
+        pt = f"{out_folder}/{name}"
+        if manifest.get(name) == new_manifest[name] and os.path.isfile(pt):
+            unchanged += 1
+        else:
+            to_write.append(name)
+
+    made_dirs = set()
+    for name in to_write:
+        pt = f"{out_folder}/{name}"
+        dr = os.path.dirname(pt)
+        if dr not in made_dirs:
+            os.makedirs(dr, exist_ok=True)
+            made_dirs.add(dr)
+        if name in dp_files:
+            with open(pt, "w") as file:
+                file.write(dp_files[name])
+        else:
+            shutil.copy2(data_files[name], pt)
+
+    deleted = 0
+    for name in manifest:
+        if name in new_manifest:
+            continue
+        pt = f"{out_folder}/{name}"
+        if os.path.isfile(pt):
+            os.remove(pt)
+            deleted += 1
+            remove_empty_dirs(out_folder, os.path.dirname(pt))
+
+    return new_manifest, len(to_write), unchanged, deleted
+
+
+def zip_info(name: str) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(name, ZIP_DATE_TIME)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.create_system = 3  # unix, the default one depends on the platform
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def write_zip(pt: str, dp_files: Dict[str, str], data_files: Dict[str, str]) -> bool:
+    """
+    Writes the datapack files and the data folder into a zip archive without staging them on the disk. The entries
+    are sorted and have fixed timestamps, so the same input always results in the same bytes. Returns whether the
+    archive has changed.
+    """
+    names = sorted(set(dp_files.keys()) | set(data_files.keys()))
+    tmp = f"{pt}.{os.getpid()}.tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(pt)), exist_ok=True)
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name in names:
+            if name in dp_files:
+                zf.writestr(zip_info(name), dp_files[name])
+            else:
+                with open(data_files[name], "rb") as src, zf.open(zip_info(name), "w") as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+    if os.path.isfile(pt) and os.path.getsize(pt) == os.path.getsize(tmp):
+        with open(pt, "rb") as a, open(tmp, "rb") as b:
+            if a.read() == b.read():
+                os.remove(tmp)
+                return False
+    os.replace(tmp, pt)
+    return True
@@ -0,0 +1,298 @@
+import re
+from typing import Dict, List, Set, Tuple
+
+from .ir import Command, DataModify, DataRemove, Execute, Return, parse_command
+from .optimizer import TEMP_NAME, callees, only_stores, overwrites, temps_read
+
+# the temporary scores as they are written in the commands the IR understands
+TEMP_SCORE_NAME = re.compile(r"(?<![\w.])(?:int|float)_\d+(?= __temp__)")
+# the temporary paths of the radon.temp storage as they appear in the commands that aren't understood, not the macro
+# arguments like $(_0)
+SLOT_NAME = re.compile(r"(?<![\w.(])_\d+(?!\w)")
+
+
+class TempAllocator:
+    """
+    Renames the temporary values of the functions to a small set of names that are reused.
+
+    A function's commands run from top to bottom, so a temporary value is in use from the command that first mentions
+    it to the one that last does, and the ones whose ranges don't overlap can share a name. The ones that are in use
+    while a function is called can't share the names the called function uses, directly or through the functions it
+    calls, so the callees are renamed first. A temporary value keeps its name if another file uses it, if it's read
+    before it's set, or if it's in use while a function that can't be followed is called: a function tag, a function
+    name that a macro makes, or a function that can end up calling the current one again.
+    """
+
+    def __init__(self, namespace: str, temp: re.Pattern, allocated: re.Pattern) -> None:
+        self.namespace = namespace
+        # the names of the temporary values and the names they are renamed to, without the objective or the storage
+        self.temp = temp
+        self.allocated = allocated
+        # file -> the indices of the names it uses, with the ones of the functions it calls
+        self.clobbers: Dict[str, Set[int]] = {}
+        # the files that call functions that can't be followed, directly or through the functions they call
+        self.unknown: Set[str] = set()
+        self.names_before = 0
+        self.names_after = 0
+
+    def slot_name(self, index: int) -> str:
+        raise NotImplementedError
+
+    def mentioned(self, cmd: Command) -> Set[str]:
+        raise NotImplementedError
+
+    def reads(self, cmd: Command) -> Set[str]:
+        raise NotImplementedError
+
+    def overwritten(self, cmd: Command) -> Set[str]:
+        # the names whose value doesn't matter after the command
+        raise NotImplementedError
+
+    def rename(self, cmd: Command, mapping: Dict[str, str]) -> Command:
+        raise NotImplementedError
+
+    def allocate(self, files: Dict[str, List[Command]]) -> Tuple[int, int]:
+        """
+        Renames the temporary values in place, and returns the number of distinct temporary names before and after.
+        """
+        users: Dict[str, Set[str]] = {}
+        for (name, cmds) in files.items():
+            for temp in self._mentioned(cmds):
+                users.setdefault(temp, set()).add(name)
+        calls = {name: [callees(cmd, files, self.namespace) for cmd in cmds] for (name, cmds) in files.items()}
+        names_after = set(temp for (temp, used_in) in users.items() if len(used_in) > 1)
+        for scc in self._sccs(files, calls):
+            members = set(scc)
+            # the functions of a cycle can call each other in any order, so they share the names they clobber
+            clobbers = set()
+            unknown = False
+            for name in scc:
+                (mapping, indices, calls_unknown) = self._allocate_file(files[name], calls[name], users, name,
+                                                                        members)
+                if len(mapping) > 0:
+                    files[name] = [self.rename(cmd, mapping) for cmd in files[name]]
+                names_after.update(self._mentioned(files[name]))
+                clobbers.update(indices)
+                unknown = unknown or calls_unknown
+                for callee in set(c for cmd_callees in calls[name] for c in cmd_callees if c is not None):
+                    if callee not in members:
+                        clobbers.update(self.clobbers.get(callee, ()))
+                        unknown = unknown or callee in self.unknown
+            for name in scc:
+                self.clobbers[name] = clobbers
+                if unknown:
+                    self.unknown.add(name)
+        self.finish(files, calls)
+        self.names_before = len(users)
+        self.names_after = len(names_after)
+        return self.names_before, self.names_after
+
+    def finish(self, files: Dict[str, List[Command]], calls: Dict[str, List[List[str | None]]]) -> None:
+        pass
+
+    def _mentioned(self, cmds: List[Command]) -> Set[str]:
+        # the temporary names and the allocated ones
+        res = set()
+        for cmd in cmds:
+            res.update(self.mentioned(cmd))
+        return set(n for n in res if self.temp.fullmatch(n) or self.allocated.fullmatch(n))
+
+    def _sccs(self, files: Dict[str, List[Command]], calls: Dict[str, List[List[str | None]]]) -> List[List[str]]:
+        # Tarjan's algorithm, the components come out with the ones they call before them
+        graph = {name: set(c for cmd_callees in calls[name] for c in cmd_callees if c is not None) for name in files}
+        index: Dict[str, int] = {}
+        low: Dict[str, int] = {}
+        stack: List[str] = []
+        on_stack: Set[str] = set()
+        res = []
+        for root in graph:
+            if root in index:
+                continue
+            work = [(root, iter(graph[root]))]
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            while len(work) > 0:
+                (node, children) = work[-1]
+                child = next(children, None)
+                if child is not None:
+                    if child not in index:
+                        index[child] = low[child] = len(index)
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(graph[child])))
+                    elif child in on_stack:
+                        low[node] = min(low[node], index[child])
+                    continue
+                work.pop()
+                if len(work) > 0:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    scc = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        scc.append(member)
+                        if member == node:
+                            break
+                    res.append(scc)
+        return res
+
+    def _allocate_file(self, cmds: List[Command], calls: List[List[str | None]], users: Dict[str, Set[str]],
+                       name: str, scc: Set[str]) -> Tuple[Dict[str, str], Set[int], bool]:
+        # returns the new names of the file's temporary values, the indices it uses and whether it calls a function
+        # that can't be followed
+        first: Dict[str, int] = {}
+        last: Dict[str, int] = {}
+        written: Set[str] = set()
+        live_in: Set[str] = set()
+        unknown = False
+        for (i, cmd) in enumerate(cmds):
+            live_in.update(n for n in self.reads(cmd) if n not in written)
+            for temp in self.mentioned(cmd):
+                if self.temp.fullmatch(temp):
+                    first.setdefault(temp, i)
+                    last[temp] = i
+            written.update(self.overwritten(cmd))
+            if any(callee is None for callee in calls[i]):
+                unknown = True
+        indices: Set[int] = set()
+        mapping: Dict[str, str] = {}
+        # (last index, allocated index) of the temporary values that are in use
+        active: List[Tuple[int, int]] = []
+        for temp in sorted(first, key=lambda n: first[n]):
+            if users.get(temp) != {name} or temp in live_in:
+                continue
+            (start, end) = (first[temp], last[temp])
+            # a call in the last command can run before it reads the value, like execute if function
+            forbidden = set()
+            for i in range(start + 1, end + 1):
+                for callee in calls[i]:
+                    if callee is None or callee in scc or callee in self.unknown:
+                        forbidden = None
+                        break
+                    forbidden.update(self.clobbers.get(callee, ()))
+                if forbidden is None:
+                    break
+            if forbidden is None:
+                continue
+            active = [(e, r) for (e, r) in active if e >= start]
+            in_use = set(r for (_, r) in active)
+            index = 0
+            while index in in_use or index in forbidden:
+                index += 1
+            active.append((end, index))
+            indices.add(index)
+            mapping[temp] = self.slot_name(index)
+        return mapping, indices, unknown
+
+
+class RegisterAllocator(TempAllocator):
+    """
+    Renames the temporary scores to registers, r0 __temp__, r1 __temp__ and so on, so that a pack doesn't leave a fake
+    player in the scoreboard for every expression it has ever computed.
+    """
+
+    def __init__(self, namespace: str) -> None:
+        super().__init__(namespace, re.compile(r"(?:int|float)_\d+"), re.compile(r"r\d+"))
+
+    def slot_name(self, index: int) -> str:
+        return f"r{index}"
+
+    def mentioned(self, cmd: Command) -> Set[str]:
+        res = set(s.split(" ")[0] for s in cmd.score_reads() | cmd.score_writes() if s.endswith(" __temp__"))
+        if cmd.opaque:
+            res.update(TEMP_NAME.findall(str(cmd)))
+        return res
+
+    def reads(self, cmd: Command) -> Set[str]:
+        return set(s.split(" ")[0] for s in temps_read(cmd) if s.endswith(" __temp__"))
+
+    def overwritten(self, cmd: Command) -> Set[str]:
+        return set(s.split(" ")[0] for s in cmd.score_writes() if s.endswith(" __temp__") and overwrites(cmd, s))
+
+    def rename(self, cmd: Command, mapping: Dict[str, str]) -> Command:
+        text = str(cmd)
+        regex = TEMP_NAME if cmd.opaque else TEMP_SCORE_NAME
+        renamed = regex.sub(lambda m: mapping.get(m.group(0), m.group(0)), text)
+        return cmd if renamed == text else parse_command(renamed)
+
+
+class SlotAllocator(TempAllocator):
+    """
+    Renames the temporary paths of the radon.temp storage, the _<id> ones, to slots: s0, s1 and so on, or
+    <compound>.s0, <compound>.s1 if a compound is given. The functions that no other function calls remove the slots
+    they and the functions they call have used before they end, with a single command if the slots are in a compound,
+    so that the storage doesn't keep the values around.
+    """
+
+    def __init__(self, namespace: str, compound: str | None = None) -> None:
+        allocated = (re.escape(compound) + r"\." if compound else "") + r"s\d+"
+        super().__init__(namespace, re.compile(r"_\d+"), re.compile(allocated))
+        self.compound = compound
+        self.prefix = f"storage {namespace}:radon.temp "
+        # the temporary path that a location is in
+        self.root = re.compile(r"(_\d+|" + allocated + r")(?!\w)")
+        self.location = re.compile(re.escape(self.prefix) + r"(_\d+)(?!\w)")
+        self.opaque_name = re.compile(r"(?<![\w.(])(?:_\d+|" + allocated + r")(?!\w)")
+        # the number of data remove commands added to the functions
+        self.removes = 0
+
+    def slot_name(self, index: int) -> str:
+        return f"{self.compound}.s{index}" if self.compound else f"s{index}"
+
+    def _root(self, location: str) -> str | None:
+        if not location.startswith(self.prefix):
+            return None
+        match = self.root.match(location, len(self.prefix))
+        return None if match is None else match.group(1)
+
+    def mentioned(self, cmd: Command) -> Set[str]:
+        res = set(self._root(loc) for loc in cmd.data_reads() | cmd.data_writes())
+        res.discard(None)
+        if cmd.opaque:
+            res.update(self.opaque_name.findall(str(cmd)))
+        return res
+
+    def reads(self, cmd: Command) -> Set[str]:
+        res = set(self._root(loc) for loc in cmd.data_reads())
+        res.discard(None)
+        if cmd.opaque:
+            res.update(SLOT_NAME.findall(str(cmd)))
+        return res
+
+    def overwritten(self, cmd: Command) -> Set[str]:
+        if isinstance(cmd, DataModify) and cmd.mode == "set":
+            targets = [cmd.target]
+        elif isinstance(cmd, Execute) and only_stores(cmd):
+            targets = [c.target for c in cmd.stores if not c.is_score]
+        else:
+            return set()
+        # only the whole path, setting a tag inside of it keeps the rest
+        return set(t[len(self.prefix):] for t in targets if self._root(t) == t[len(self.prefix):])
+
+    def rename(self, cmd: Command, mapping: Dict[str, str]) -> Command:
+        text = str(cmd)
+        if cmd.opaque:
+            renamed = SLOT_NAME.sub(lambda m: mapping.get(m.group(0), m.group(0)), text)
+        else:
+            renamed = self.location.sub(lambda m: self.prefix + mapping.get(m.group(1), m.group(1)), text)
+        return cmd if renamed == text else parse_command(renamed)
+
+    def finish(self, files: Dict[str, List[Command]], calls: Dict[str, List[List[str | None]]]) -> None:
+        # the slots are only in use while the function that no other function calls is running, the ones it calls
+        # can only be running inside of it
+        called = set(c for callees_list in calls.values() for cmd_callees in callees_list for c in cmd_callees)
+        for (name, cmds) in files.items():
+            if name in called or len(self.clobbers[name]) == 0:
+                continue
+            if self.compound:
+                removes = [DataRemove(self.prefix + self.compound)]
+            else:
+                removes = [DataRemove(self.prefix + self.slot_name(i)) for i in sorted(self.clobbers[name])]
+            # before the return at the end, the ones behind conditions leave the slots to be overwritten next time
+            end = len(cmds) - 1 if len(cmds) > 0 and isinstance(cmds[-1], Return) and cmds[-1].run is None \
+                else len(cmds)
+            files[name] = cmds[:end] + removes + cmds[end:]
+            self.removes += len(removes)
@@ -0,0 +1,172 @@
+import json
+import multiprocessing
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+from typing import Any, Callable, Dict
+
+from .utils import VERSION_RADON
+
+Request = Dict[str, Any]
+Response = Dict[str, Any]
+
+
+def default_socket_path() -> str:
+    return os.path.join(tempfile.gettempdir(), f"radon-{os.getuid()}.sock")
+
+
+def worker_main(conn, handler: Callable[[Request], Response]):
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            return
+        if request is None:
+            return
+        conn.send(handler(request))
+
+
+class ProjectWorker:
+    """
+    A process that builds a single project. It's forked from the server, so the builtins are already loaded, and it
+    keeps the parse cache, the build graph and the output manifests of its project in memory between the builds.
+    Every project has its own process, so the working directory and the global state of one build can't leak into
+    another one.
+    """
+
+    def __init__(self, mp_ctx, handler: Callable[[Request], Response]) -> None:
+        self.conn, child = mp_ctx.Pipe()
+        self.process = mp_ctx.Process(target=worker_main, args=(child, handler), daemon=True)
+        self.process.start()
+        child.close()
+        # the builds of a project write to the same folders, so they run one at a time
+        self.lock = threading.Lock()
+
+    def run(self, request: Request) -> Response:
+        with self.lock:
+            self.conn.send(request)
+            return self.conn.recv()
+
+    def close(self):
+        # the workers forked later have a copy of the pipe as well, so closing it doesn't stop the process
+        with self.lock:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.conn.close()
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Reads one JSON request per line and writes one JSON response per line. The requests of a connection are answered
+    in order, the ones from different connections are served at the same time.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("expected an object")
+            except ValueError as e:
+                request = {}
+                response = {"ok": False, "error": f"Invalid request: {e}"}
+            else:
+                response = self.server.respond(request)
+            if "id" in request:
+                response["id"] = request["id"]
+            self.wfile.write((json.dumps(response) + "\n").encode())
+            self.wfile.flush()
+            if request.get("command") == "shutdown":
+                # shutdown() waits for serve_forever() to return, so it can't be called from a request's thread
+                threading.Thread(target=self.server.shutdown).start()
+                return
+
+
+class BuildServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, handler: Callable[[Request], Response]) -> None:
+        self.handler = handler
+        # forking keeps the modules the server has already imported
+        self.mp_ctx = multiprocessing.get_context("fork")
+        self.workers: Dict[str, ProjectWorker] = {}
+        self.workers_lock = threading.Lock()
+        super().__init__(socket_path, RequestHandler)
+
+    def get_worker(self, project: str) -> ProjectWorker:
+        with self.workers_lock:
+            worker = self.workers.get(project)
+            if worker is None:
+                worker = ProjectWorker(self.mp_ctx, self.handler)
+                self.workers[project] = worker
+            return worker
+
+    def respond(self, request: Request) -> Response:
+        command = request.get("command", "build")
+        if command == "ping":
+            return {"ok": True, "version": VERSION_RADON, "projects": list(self.workers.keys())}
+        if command == "shutdown":
+            return {"ok": True}
+        if command != "build":
+            return {"ok": False, "error": f"Unknown command: {command}"}
+        project = request.get("project")
+        if not isinstance(project, str):
+            return {"ok": False, "error": "Expected the 'project' folder of the build"}
+        project = os.path.realpath(project)
+        if not os.path.isdir(project):
+            return {"ok": False, "error": f"Directory {project} does not exist!"}
+        request = dict(request, project=project)
+        worker = self.get_worker(project)
+        try:
+            return worker.run(request)
+        except (EOFError, OSError):
+            with self.workers_lock:
+                if self.workers.get(project) is worker:
+                    del self.workers[project]
+            worker.close()
+            return {"ok": False, "error": "The build process of the project exited unexpectedly"}
+
+    def server_close(self):
+        super().server_close()
+        for worker in self.workers.values():
+            worker.close()
+        self.workers.clear()
+
+
+def remove_stale_socket(socket_path: str):
+    if not os.path.exists(socket_path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            # nothing is listening, a previous server didn't exit cleanly
+            os.remove(socket_path)
+            return
+    raise OSError(f"A server is already listening on {socket_path}")
+
+
+def serve(socket_path: str, handler: Callable[[Request], Response], on_ready: Callable[[], None] = None):
+    """
+    Serves build requests on a Unix socket until a shutdown request arrives. handler runs in the worker process of the
+    request's project.
+    """
+    remove_stale_socket(socket_path)
+    server = BuildServer(socket_path, handler)
+    try:
+        if on_ready is not None:
+            on_ready()
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -0,0 +1,39 @@
+import re
+from typing import Dict, List, Set
+
+from .ir import Command, render
+
+
+class TreeShaker:
+    """
+    Removes the function files that can never run. A file runs if it's one of the roots, the load and tick functions,
+    the functions marked with @export and the ones the other files of the pack mention, like the reward functions of
+    the advancements, or if a file that runs mentions it: calls it, schedules it or has it in a click event. Nothing is
+    removed when a file that runs calls a function whose name is only known when it runs, like $function $(name).
+    """
+
+    def __init__(self, namespace: str) -> None:
+        self.namespace = namespace
+        self.fn_ref = re.compile(re.escape(namespace) + r":([a-z0-9_./-]+)")
+        self.dynamic_ref = re.compile(r"function \$\(|" + re.escape(namespace) + r":[a-z0-9_./-]*\$\(")
+
+    def shake(self, files: Dict[str, List[Command]], roots: Set[str]) -> List[str]:
+        """
+        Removes the files no root reaches in place, and returns their names.
+        """
+        seen = set(root for root in roots if root in files)
+        queue = list(seen)
+        while len(queue) > 0:
+            text = render(files[queue.pop()])
+            if ":" not in text:
+                continue
+            if "$(" in text and self.dynamic_ref.search(text):
+                return []
+            for name in self.fn_ref.findall(text):
+                if name in files and name not in seen:
+                    seen.add(name)
+                    queue.append(name)
+        removed = sorted(name for name in files if name not in seen)
+        for name in removed:
+            del files[name]
+        return removed
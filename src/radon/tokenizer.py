@@ -1,4 +1,7 @@
-from typing import Any, Dict, List
+import re
+import sys
+from array import array
+from typing import Any, Dict, List, Tuple
 
 from .error import raise_syntax_error, raise_syntax_error_t
 
@@ -70,6 +73,8 @@ KEYWORDS = [
     "as",
 ]
 EXTRA_KEYWORDS = ["and", "or", "is", "not"]
+# the words that can follow an @ before a function definition, like @inline
+ANNOTATIONS = ["inline", "noinline", "export"]
 
 OPEN_GROUP = list("{[(")
 CLOSE_GROUP = list("}])")
@@ -77,22 +82,61 @@ CLOSE_MATCH = {"}": "{", "]": "[", ")": "("}
 
 
 class Token:
+    __slots__ = ("code", "type", "start", "end", "_value")
+
     def __init__(self, code: str, type: Any, start: int, end: int):
         self.code = code
         self.type = type
         self.start = start
         self.end = end
-        self.value = ""
-        self.update_value()
+        self._value: str | None = None
+
+    @property
+    def value(self) -> str:
+        # Sliced from the source on first access, identifiers and keywords are interned
+        value = self._value
+        if value is None:
+            value = self.code[self.start: self.end]
+            if self.type in INTERNED_TYPES:
+                value = sys.intern(value)
+            self._value = value
+        return value
 
     def update_value(self):
-        self.value = self.code[self.start: self.end]
+        self._value = None
         return self.value
 
+    def __reduce__(self):
+        # Compact pickling for the parse cache, the lazy value isn't stored
+        if self.__class__ is Token:
+            return Token, (self.code, self.type, self.start, self.end)
+        return _new_token, (self.__class__,), [getattr(self, k) for k in _pickled_slots(self.__class__)]
+
+    def __setstate__(self, state):
+        self._value = None
+        for k, v in zip(_pickled_slots(self.__class__), state):
+            setattr(self, k, v)
+
     def __str__(self) -> str:
         return f"Token(type={self.type}, start={self.start}, end={self.end}, value={self.value})"
 
 
+_slots_by_class: Dict[type, List[str]] = {}
+
+
+def _pickled_slots(cls) -> List[str]:
+    if cls not in _slots_by_class:
+        slots = []
+        for c in reversed(cls.__mro__):
+            slots.extend(k for k in c.__dict__.get("__slots__", ()) if k != "_value")
+        _slots_by_class[cls] = slots
+    return _slots_by_class[cls]
+
+
+def _new_token(cls):
+    return cls.__new__(cls)
+
+
 from .utils import (
     FLOAT_TYPE,
     INT_TYPE,
@@ -103,10 +147,16 @@ from .utils import (
     TokenType, SELECTOR_TYPE, CplDefFunction,
 )
 
+INTERNED_TYPES = frozenset({TokenType.IDENTIFIER, TokenType.KEYWORD})
+TOKEN_TYPES = tuple(TokenType)
+TOKEN_TYPE_INDEX = {t: i for i, t in enumerate(TOKEN_TYPES)}
+
 EmptyToken = Token("", TokenType.SYMBOL, 0, 0)
 
 
 class GroupToken(Token):
+    __slots__ = ("parent", "children", "open", "close", "func", "_temp")
+
     def __init__(self, code: str, start: int, end: int, children=None):
         super().__init__(code, TokenType.GROUP, start, end)
         self.parent: GroupToken = EmptyGroup
@@ -116,6 +166,11 @@ class GroupToken(Token):
         self.func: Token | None = None
         self._temp: Any = None
 
+    @property
+    def value(self) -> str:
+        # Never cached, so nested groups don't hold their own copies of the source
+        return self.code[self.start: self.end]
+
     def cpl(self, ctx):
         return ctx.transpiler.tokens_to_cpl(ctx, self.children)
 
@@ -124,6 +179,8 @@ EmptyGroup: GroupToken = Token("", TokenType.GROUP, 0, 0)  # type: ignore
 
 
 class SelectorIdentifierToken(Token):
+    __slots__ = ("selector", "sep", "name")
+
     def __init__(
             self,
             code: str,
@@ -140,6 +197,8 @@ class SelectorIdentifierToken(Token):
 
 
 class BlockIdentifierToken(Token):
+    __slots__ = ("block", "sep", "name")
+
     def __init__(
             self,
             code: str,
@@ -156,6 +215,8 @@ class BlockIdentifierToken(Token):
 
 
 class LambdaFunctionToken(Token):
+    __slots__ = ("arguments", "body")
+
     def __init__(
             self,
             code: str,
@@ -336,7 +397,6 @@ def group_tokens(tokens: List[Token]) -> List[Token]:
                 raise_syntax_error("Unexpected parentheses", token)
             parent.close = token
             parent.end = token.end
-            parent.update_value()
 
             ppc = parent.parent.children
 
@@ -391,192 +451,314 @@ def group_tokens(tokens: List[Token]) -> List[Token]:
     return parent.children
 
 
-def _tokenize_iterate(
-        code: str, tokens: List[Token], macros: List, index: List[int], can_macro: bool
-):
-    char = code[index[0]]
-    if char == EOE_CHAR:
-        tokens.append(Token(code, TokenType.EOE, index[0], index[0] + 1))
-        return
-    if char in WHITESPACE:
-        # tokens.append(Token(code, TokenType.WHITESPACE, index[0], index[0] + 1))
-        return
-    if char == EOL_CHAR:
-        tokens.append(Token(code, TokenType.EOL, index[0], index[0] + 1))
-        return
-    if (
-            char == "@"
-            and index[0] != len(code) - 1
-            and code[index[0] + 1] in list("praens")
-    ):
-        selToken = Token(code, TokenType.SELECTOR, index[0], index[0] + 2)
-        if (
-                len(tokens) > 1
-                and tokens[-1].value == ":"
-                and tokens[-1].end == index[0]
-                and tokens[-2].type == TokenType.IDENTIFIER
-        ):
-            token = SelectorIdentifierToken(
-                code,
-                start=tokens[-2].start,
-                end=index[0] + 2,
-                selector=selToken,
-                sep=tokens[-1],
-                name=tokens[-2],
-            )
-            tokens.pop()
-            tokens.pop()
-            tokens.append(token)
-            index[0] += 1
-            return
-        tokens.append(selToken)
-        index[0] += 1
-        return
-    if code[index[0]: index[0] + 8] == "#define " and (
-            len(tokens) == 0 or tokens[-1].type == TokenType.EOL
-    ):
-        if not can_macro:
-            raise_syntax_error_t("Unexpected #define", code, index[0], index[0] + 8)
-        si = index[0] + 8
-        while index[0] < len(code):
-            if code[index[0]] == "\n":
-                break
-            index[0] += 1
-        index[0] -= 1
-        m = code[si: index[0] + 1].split(" ")
-        macros.append([m[0], _tokenize(" ".join(m[1:]), False)[0][:-1]])
-        return
-    if char == ":" and index[0] != len(code) - 1 and code[index[0] + 1] == ":":
-        tokens.append(Token(code, TokenType.SYMBOL, index[0], index[0] + 2))
-        index[0] += 1
-        return
-    if char in SYMBOL:
-        tokens.append(Token(code, TokenType.SYMBOL, index[0], index[0] + 1))
-        return
-    if char == "/" and index[0] != len(code) - 1 and code[index[0] + 1] == "/":
-        while index[0] < len(code):
-            if code[index[0]] == "\n":
-                index[0] -= 1
-                break
-            index[0] += 1
-        return
-    if char == "/" and index[0] != len(code) - 1 and code[index[0] + 1] == "*":
-        line_index = 0
-        while index[0] < len(code):
-            if code[index[0]] == "\n":
-                line_index = index[0]
-            if (
-                    code[index[0]] == "*"
-                    and index[0] + 1 < len(code)
-                    and code[index[0] + 1] == "/"
-            ):
-                index[0] += 1
-                if line_index != 0:
-                    tokens.append(
-                        Token(code, TokenType.EOL, line_index, line_index + 1)
-                    )
-                break
-            index[0] += 1
-        return
+# Character classes of the lexer's dispatch table, every character that isn't in the table is a word character
+_C_WORD = 0
+_C_EOE = 1
+_C_WHITESPACE = 2
+_C_EOL = 3
+_C_AT = 4
+_C_COLON = 5
+_C_SYMBOL = 6
+_C_SLASH = 7
+_C_HASH = 8
+_C_OPERATOR = 9
+_C_QUOTE = 10
+
+# Operator candidates by their first character, longest first so the first hit is the longest match
+_OPERATOR_TABLE: Dict[str, List[str]] = {}
+for _op in sorted(OPERATORS_L, key=len, reverse=True) + OPERATORS:
+    _OPERATOR_TABLE.setdefault(_op[0], []).append(_op)
+
+_CHAR_CLASS: Dict[str, int] = {}
+for _c in _OPERATOR_TABLE:
+    _CHAR_CLASS[_c] = _C_OPERATOR
+for _c in SYMBOL:
+    _CHAR_CLASS[_c] = _C_SYMBOL
+for _c in QUOTES:
+    _CHAR_CLASS[_c] = _C_QUOTE
+for _c in WHITESPACE:
+    _CHAR_CLASS[_c] = _C_WHITESPACE
+_CHAR_CLASS[EOL_CHAR] = _C_EOL
+_CHAR_CLASS[EOE_CHAR] = _C_EOE
+_CHAR_CLASS["@"] = _C_AT
+_CHAR_CLASS[":"] = _C_COLON
+_CHAR_CLASS["/"] = _C_SLASH
+_CHAR_CLASS["#"] = _C_HASH
+
+SELECTOR_CHARS = frozenset("praens")
+KEYWORDS_SET = frozenset(KEYWORDS)
+WORD_OPERATORS_SET = frozenset(WORD_OPERATORS)
+ANNOTATIONS_SET = frozenset(ANNOTATIONS)
+_WORD_RE = re.compile("[^" + re.escape("".join(NON_WORD_CHARACTERS)) + "]+")
+
+
+_K_IDENTIFIER = TOKEN_TYPE_INDEX[TokenType.IDENTIFIER]
+_K_KEYWORD = TOKEN_TYPE_INDEX[TokenType.KEYWORD]
+_K_INT_LITERAL = TOKEN_TYPE_INDEX[TokenType.INT_LITERAL]
+_K_FLOAT_LITERAL = TOKEN_TYPE_INDEX[TokenType.FLOAT_LITERAL]
+_K_STRING_LITERAL = TOKEN_TYPE_INDEX[TokenType.STRING_LITERAL]
+_K_OPERATOR = TOKEN_TYPE_INDEX[TokenType.OPERATOR]
+_K_SYMBOL = TOKEN_TYPE_INDEX[TokenType.SYMBOL]
+_K_EOL = TOKEN_TYPE_INDEX[TokenType.EOL]
+_K_EOE = TOKEN_TYPE_INDEX[TokenType.EOE]
+_K_EOF = TOKEN_TYPE_INDEX[TokenType.EOF]
+_K_SELECTOR = TOKEN_TYPE_INDEX[TokenType.SELECTOR]
+_K_SELECTOR_IDENTIFIER = TOKEN_TYPE_INDEX[TokenType.SELECTOR_IDENTIFIER]
+
+
+class TokenStream:
+    """
+    The lexer's output buffer. Token kinds, starts and ends are stored in parallel arrays and Token objects
+    are only created once by to_tokens().
+    """
+    __slots__ = ("code", "kinds", "starts", "ends", "parts")
 
-    for op in OPERATORS_L:
-        op_got = code[index[0]: index[0] + len(op)]
-        if op_got == op and (op not in WORD_OPERATORS or code[index[0] + len(op)] == " "):
-            tokens.append(Token(code, TokenType.OPERATOR, index[0], index[0] + len(op)))
-            index[0] += len(op) - 1
-            return
-    if char in OPERATORS:
-        tokens.append(Token(code, TokenType.OPERATOR, index[0], index[0] + 1))
-        return
-    if char in QUOTES:
-        start_index = index[0]
-        index[0] += 1
-        backslash = False
-        while index[0] < len(code):
-            char2 = code[index[0]]
-            if (char2 == char and not backslash) or char2 == EOL_CHAR:
-                break
-            if char == "\\":
-                backslash = not backslash
+    def __init__(self, code: str):
+        self.code = code
+        self.kinds = array("i")
+        self.starts = array("i")
+        self.ends = array("i")
+        # (selector, sep, name) of the selector identifier tokens by their index
+        self.parts: Dict[int, Tuple[Token, Token, Token]] = {}
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def append(self, kind: int, start: int, end: int):
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def pop(self) -> Token:
+        token = self.token(len(self.kinds) - 1)
+        self.parts.pop(len(self.kinds) - 1, None)
+        self.kinds.pop()
+        self.starts.pop()
+        self.ends.pop()
+        return token
+
+    def is_value(self, index: int, value: str) -> bool:
+        start = self.starts[index]
+        return self.ends[index] - start == len(value) and self.code.startswith(value, start)
+
+    def token(self, index: int) -> Token:
+        if index < 0:
+            index += len(self.kinds)
+        start = self.starts[index]
+        end = self.ends[index]
+        if index in self.parts:
+            selector, sep, name = self.parts[index]
+            return SelectorIdentifierToken(self.code, start, end, selector, sep, name)
+        return Token(self.code, TOKEN_TYPES[self.kinds[index]], start, end)
+
+    def to_tokens(self) -> List[Token]:
+        code = self.code
+        parts = self.parts
+        tokens = []
+        append = tokens.append
+        for index, (kind, start, end) in enumerate(zip(self.kinds, self.starts, self.ends)):
+            if index in parts:
+                selector, sep, name = parts[index]
+                append(SelectorIdentifierToken(code, start, end, selector, sep, name))
             else:
-                backslash = False
-            index[0] += 1
-        if index[0] == len(code) or code[index[0]] == EOL_CHAR:
-            raise_syntax_error_t(
-                "Unterminated string", code, start_index, start_index + 1
-            )
-        value = code[start_index + 1: index[0]]
-        token: Token = Token(code, TokenType.STRING_LITERAL, start_index, index[0] + 1)
-        tokens.append(token)
-        return
-    start_index = index[0]
-    index[0] += 1
-    while index[0] < len(code):
-        char2 = code[index[0]]
-        if char2 in NON_WORD_CHARACTERS:
-            index[0] -= 1
-            break
-        index[0] += 1
-    if index[0] == len(code):
-        index[0] -= 1
-    value = code[start_index: index[0] + 1]
-    type = TokenType.IDENTIFIER
-    if value in KEYWORDS:
-        type = TokenType.KEYWORD
+                append(Token(code, TOKEN_TYPES[kind], start, end))
+        return tokens
+
+
+def _is_annotation(code: str, i: int) -> bool:
+    # @noinline isn't the @n selector
+    match = _WORD_RE.match(code, i + 1)
+    return match is not None and match.group() in ANNOTATIONS_SET
+
+
+def _tokenize_word(stream: TokenStream, start_index: int, end: int):
+    code = stream.code
+    kinds = stream.kinds
+    value = code[start_index: end]
+    kind = _K_IDENTIFIER
+    if value in KEYWORDS_SET:
+        kind = _K_KEYWORD
     elif str.isnumeric(value):
-        type = TokenType.INT_LITERAL
-    if type == TokenType.INT_LITERAL and len(tokens) > 0 and tokens[-1].value == "-" and (
-            len(tokens) == 1 or tokens[-2].type in {TokenType.OPERATOR, TokenType.SYMBOL}):
-        tokens.pop()
+        kind = _K_INT_LITERAL
+    if kind == _K_INT_LITERAL and len(kinds) > 0 and stream.is_value(-1, "-") and (
+            len(kinds) == 1 or kinds[-2] == _K_OPERATOR or kinds[-2] == _K_SYMBOL):
+        stream.pop()
         start_index -= 1
     if (
-            type == TokenType.INT_LITERAL
-            and len(tokens) > 0
-            and tokens[-1].value == "."
-            and tokens[-1].end == start_index
-            and (len(tokens) == 1 or tokens[-2].end != start_index - 1 or tokens[-2].type == TokenType.INT_LITERAL)):
-        if len(tokens) > 1 and tokens[-2].type == TokenType.INT_LITERAL:
-            tokens.pop()
-        start = tokens.pop().start
-        tokens.append(Token(code, TokenType.FLOAT_LITERAL, start, index[0] + 1))
-        return True
-    new_t = Token(code, type, start_index, index[0] + 1)
-    if (type == TokenType.IDENTIFIER and len(tokens) > 1 and tokens[-1].value == ":"
-            and tokens[-2].type == TokenType.IDENTIFIER):
-        sep = tokens.pop()
-        ident = tokens.pop()
-        tokens.append(SelectorIdentifierToken(code, ident.start, index[0] + 1, new_t, sep, ident))
-        return True
-    tokens.append(new_t)
-
+            kind == _K_INT_LITERAL
+            and len(kinds) > 0
+            and stream.is_value(-1, ".")
+            and stream.ends[-1] == start_index
+            and (len(kinds) == 1 or stream.ends[-2] != start_index - 1 or kinds[-2] == _K_INT_LITERAL)):
+        if len(kinds) > 1 and kinds[-2] == _K_INT_LITERAL:
+            stream.pop()
+        start = stream.pop().start
+        stream.append(_K_FLOAT_LITERAL, start, end)
+        return
+    if (kind == _K_IDENTIFIER and len(kinds) > 1 and stream.is_value(-1, ":")
+            and kinds[-2] == _K_IDENTIFIER):
+        sep = stream.pop()
+        ident = stream.pop()
+        stream.parts[len(kinds)] = (Token(code, TokenType.IDENTIFIER, start_index, end), sep, ident)
+        stream.append(_K_SELECTOR_IDENTIFIER, ident.start, end)
+        return
+    stream.append(kind, start_index, end)
 
-def _tokenize(code: str, can_macro=True):
-    code = code.replace("\r", "")
 
-    tokens: List[Token] = []
+def _tokenize_stream(code: str, can_macro=True):
+    stream = TokenStream(code)
     macros = []
 
-    index = [0]
+    kinds = stream.kinds
+    char_class = _CHAR_CLASS
+    operator_table = _OPERATOR_TABLE
+    word_match = _WORD_RE.match
+    append = stream.append
     length = len(code)
-    while index[0] < length:
-        _tokenize_iterate(code, tokens, macros, index, can_macro)
-        index[0] += 1
+    i = 0
+    while i < length:
+        char = code[i]
+        cls = char_class.get(char, _C_WORD)
+        if cls == _C_WHITESPACE:
+            i += 1
+            continue
+        if cls == _C_EOL:
+            append(_K_EOL, i, i + 1)
+            i += 1
+            continue
+        if cls == _C_EOE:
+            append(_K_EOE, i, i + 1)
+            i += 1
+            continue
+        if cls == _C_AT and i + 1 < length and code[i + 1] in SELECTOR_CHARS and not _is_annotation(code, i):
+            if (
+                    len(kinds) > 1
+                    and stream.is_value(-1, ":")
+                    and stream.ends[-1] == i
+                    and kinds[-2] == _K_IDENTIFIER
+            ):
+                sep = stream.pop()
+                name = stream.pop()
+                stream.parts[len(kinds)] = (Token(code, TokenType.SELECTOR, i, i + 2), sep, name)
+                append(_K_SELECTOR_IDENTIFIER, name.start, i + 2)
+            else:
+                append(_K_SELECTOR, i, i + 2)
+            i += 2
+            continue
+        if cls == _C_HASH and code.startswith("#define ", i) and (
+                len(kinds) == 0 or kinds[-1] == _K_EOL
+        ):
+            if not can_macro:
+                raise_syntax_error_t("Unexpected #define", code, i, i + 8)
+            line_end = code.find(EOL_CHAR, i)
+            if line_end == -1:
+                line_end = length
+            m = code[i + 8: line_end].split(" ")
+            macros.append([m[0], _tokenize(" ".join(m[1:]), False)[0][:-1]])
+            i = line_end
+            continue
+        if cls == _C_COLON and code.startswith("::", i):
+            append(_K_SYMBOL, i, i + 2)
+            i += 2
+            continue
+        if cls == _C_AT or cls == _C_COLON or cls == _C_SYMBOL:
+            append(_K_SYMBOL, i, i + 1)
+            i += 1
+            continue
+        if cls == _C_SLASH:
+            if code.startswith("//", i):
+                i = code.find(EOL_CHAR, i)
+                if i == -1:
+                    break
+                continue
+            if code.startswith("/*", i):
+                comment_end = code.find("*/", i + 1)
+                if comment_end == -1:
+                    break
+                line_index = code.rfind(EOL_CHAR, i, comment_end)
+                if line_index != -1:
+                    append(_K_EOL, line_index, line_index + 1)
+                i = comment_end + 2
+                continue
+            cls = _C_OPERATOR
+        if cls == _C_OPERATOR:
+            op_got = None
+            for op in operator_table[char]:
+                if code.startswith(op, i) and (op not in WORD_OPERATORS_SET or code.startswith(" ", i + len(op))):
+                    op_got = op
+                    break
+            if op_got is not None:
+                append(_K_OPERATOR, i, i + len(op_got))
+                i += len(op_got)
+                continue
+        elif cls == _C_QUOTE:
+            end = code.find(char, i + 1)
+            line_end = code.find(EOL_CHAR, i + 1, length if end == -1 else end)
+            if end == -1 or line_end != -1:
+                raise_syntax_error_t(
+                    "Unterminated string", code, i, i + 1
+                )
+            append(_K_STRING_LITERAL, i, end + 1)
+            i = end + 1
+            continue
+        end = word_match(code, i).end()
+        _tokenize_word(stream, i, end)
+        i = end
 
-    tokens.append(Token(code, TokenType.EOF, length, length))
-    return tokens, macros
+    append(_K_EOF, length, length)
+    return stream, macros
+
+
+def _tokenize(code: str, can_macro=True):
+    (stream, macros) = _tokenize_stream(code.replace("\r", ""), can_macro)
+    return stream.to_tokens(), macros
+
+
+def _expand_macro(name: str, table: Dict[str, List[Token]], expanded: Dict[str, List[Token]], visiting: List[str]):
+    if name in expanded:
+        return expanded[name]
+    visiting.append(name)
+    body = []
+    for token in table[name]:
+        if token.type == TokenType.IDENTIFIER and token.value in table:
+            if token.value in visiting:
+                raise_syntax_error(f"Recursive macro definition: {' -> '.join(visiting + [token.value])}", token)
+            body.extend(_expand_macro(token.value, table, expanded, visiting))
+        else:
+            body.append(token)
+    visiting.pop()
+    expanded[name] = body
+    return body
+
+
+def macro_table(macros: List) -> Dict[str, List[Token]]:
+    """
+    Turns the [name, tokens] list of #define macros into a name -> tokens dictionary. Macros that are used
+    inside other macros' bodies are expanded once here, so applying the table is a single lookup per token.
+    The first definition of a name wins.
+    """
+    table: Dict[str, List[Token]] = {}
+    for name, body in macros:
+        if name not in table:
+            table[name] = body
+    expanded: Dict[str, List[Token]] = {}
+    for name in table:
+        _expand_macro(name, table, expanded, [])
+    return expanded
 
 
 def apply_macros(tokens: List[Token], macros: List):
+    if len(macros) == 0:
+        return tokens
+    table = macro_table(macros)
     new_tokens = []
     for token in tokens:
-        found = False
-        for macro in macros:
-            if token.type == TokenType.IDENTIFIER and token.value == macro[0]:
-                found = True
-                new_tokens.extend(macro[1])
-                break
-        if not found:
-            new_tokens.append(token)
+        if token.type == TokenType.IDENTIFIER:
+            body = table.get(token.value)
+            if body is not None:
+                new_tokens.extend(body)
+                continue
+        new_tokens.append(token)
     return new_tokens
 
 
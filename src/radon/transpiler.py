@@ -1,11 +1,13 @@
 import json
 import os
+import re
 import sys
 import traceback
 from importlib import util
 from types import FunctionType
-from typing import Any, Dict, List, Union, Literal
+from typing import Any, Dict, List, Set, Tuple, Union, Literal
 
+from .cache import ModuleEntry, file_hash, module_key
 from .dp_ast import (
     ENDERS,
     ContinueStatement,
@@ -27,7 +29,39 @@ from .dp_ast import (
     parse_str, parse, DefineEnumStatement
 )
 from .error import raise_syntax_error, raise_syntax_error_t, show_warning, raise_error, RadonError
+from .ir import (
+    Command,
+    Condition,
+    DataGet,
+    DataModify,
+    DataRemove,
+    Execute,
+    FunctionCall,
+    Raw,
+    Return,
+    Schedule,
+    ScoreCondition,
+    ScoreGet,
+    ScoreLiteral,
+    ScoreOperation,
+    ScoreReset,
+    Store,
+    lift,
+    lift_all,
+    mentions_data,
+    mentions_score,
+    modify_with,
+    render,
+)
 from .nbt_definitions import ENTITIES_OBJ
+from .arguments import ArgumentAllocator
+from .constants import ConstantPropagator
+from .guards import GuardEliminator
+from .inliner import Inliner
+from .optimizer import PeepholeOptimizer, callees
+from .registers import RegisterAllocator, SlotAllocator
+from .shaker import TreeShaker
+from .unroller import LoopUnroller
 from .tokenizer import (
     BlockIdentifierToken,
     GroupToken,
@@ -48,7 +82,7 @@ from .utils import (
     TokenType,
     get_uuid,
     INT_LIMIT,
-    CplDefArray, reset_expr_id, FLOAT_PREC, CplDefFunction, get_float_limit
+    CplDefArray, reset_expr_id, FLOAT_PREC, CplDefFunction, get_float_limit, get_expr_id, set_expr_id, VERSION_RADON
 )
 
 cwd = os.path.dirname(os.path.abspath(sys.argv[0]))
@@ -110,7 +144,7 @@ class FunctionArgument:
 
 
 class LoopDeclaration:
-    def __init__(self, eid: str, file: List[str], file_path: str, continue_: str):
+    def __init__(self, eid: str, file: List[str], file_path: str, continue_: Command):
         self.eid = eid
         self.file = file
         self.file_path = file_path
@@ -128,7 +162,9 @@ class FunctionDeclaration:
             function: Any = None,
             file_name: str = "",
             class_name: str | None = None,
-            raw_args: List[int] = None
+            raw_args: List[int] = None,
+            inline: bool | None = None,
+            export: bool = False
     ):
         if arguments is None:
             arguments = []
@@ -143,6 +179,56 @@ class FunctionDeclaration:
         self.function = function
         self.class_name = class_name
         self.raw_args = raw_args
+        self.inline = inline  # @inline or @noinline, None if it wasn't marked
+        self.export = export  # @export
+
+
+class FunctionTable:
+    """
+    The declared functions indexed by name. Overloads of a name are kept in the order they were added, which is the
+    order they are tried in when resolving a call.
+    """
+
+    def __init__(self):
+        self._by_name: Dict[str, List[FunctionDeclaration]] = {}
+        self._all: Dict[int, FunctionDeclaration] = {}
+
+    def append(self, fn: FunctionDeclaration):
+        if id(fn) in self._all:
+            self.remove(fn)
+        self._all[id(fn)] = fn
+        if fn.name in self._by_name:
+            self._by_name[fn.name].append(fn)
+        else:
+            self._by_name[fn.name] = [fn]
+
+    def extend(self, fns: List[FunctionDeclaration]):
+        for fn in fns:
+            self.append(fn)
+
+    def remove(self, fn: FunctionDeclaration):
+        del self._all[id(fn)]
+        overloads = self._by_name[fn.name]
+        overloads.remove(fn)
+        if len(overloads) == 0:
+            del self._by_name[fn.name]
+
+    def overloads(self, name: str) -> List[FunctionDeclaration]:
+        return self._by_name.get(name, [])
+
+    def first(self, name: str) -> FunctionDeclaration | None:
+        overloads = self._by_name.get(name)
+        return overloads[0] if overloads else None
+
+    @property
+    def last(self) -> FunctionDeclaration:
+        return next(reversed(self._all.values()))
+
+    def __iter__(self):
+        return iter(list(self._all.values()))
+
+    def __len__(self):
+        return len(self._all)
 
 
 class ClassDeclaration:
@@ -197,6 +283,10 @@ class TranspilerContext:
         return new
 
 
+def _same_items(a: List[Any], b: List[Any]) -> bool:
+    return len(a) == len(b) and all(x is y for (x, y) in zip(a, b))
+
+
 def _get_def(v: Any | CplDef):
     return v if isinstance(v, CplDef) else v.unique_type
 
@@ -306,6 +396,17 @@ from .builtin import rmath, print as _no, pyeval, time, swap, stdvar, listener,
 
 _ = [rmath, _no, pyeval, time, swap, stdvar, listener, exit, recipe, success, raycast, getpos, data]
 
+# the libraries above, imported python files can add more with add_lib
+default_builtin_fns = {k: list(v) for (k, v) in builtin_fns.items()}
+default_builtin_vars = dict(builtin_vars)
+
+
+def reset_builtins():
+    builtin_fns.clear()
+    builtin_fns.update({k: list(v) for (k, v) in default_builtin_fns.items()})
+    builtin_vars.clear()
+    builtin_vars.update(default_builtin_vars)
+
 
 def get_fn_macro_obj(ctx: TranspilerContext):
     if not ctx.function:
@@ -321,10 +422,27 @@ def get_fn_macro_obj(ctx: TranspilerContext):
     return " {" + ",".join(d) + "}"
 
 
+# \$( is an escaped macro argument, the rest are the interpolations: $(), $str(), $jstr(), $dstr(), $dat() and $loc()
+CMD_REPL_REGEX = re.compile(r"\\\$\(|\$(|str|jstr|dstr|dat|loc)\(")
+CMD_PAREN_REGEX = re.compile(r"[()]")
+
+# folders of the files that are only called by the generated code, so they can be merged when they are the same
+# the files that can run the functions of the pack: the function tags, the advancements with their rewards and the
+# function files
+FUNCTION_RUNNERS = re.compile(r"(?:^|/)(?:tags/functions?|advancements?)/.+\.json$|\.mcfunction$")
+MERGEABLE_FOLDERS = ("__if__/", "__else__/", "__execute__/", "__cmd__/", "__lambda__/", "__temp__/", "__loop__/",
+                     "__schedule__/")
+# the attributes of the transpiler that transpiling a module can change, the ones a reused module changes again
+MODULE_STATE = ("files", "dependencies", "variables", "classes", "data", "tempFiles", "loops", "dp_files", "builtin_fns",
+                "builtin_vars", "main_file", "tick_file", "init_libs", "imported", "functions", "unrolled_loops")
+
+
 class Transpiler:
     def __init__(self, statements: List[Statement], macros: List[Statement], pack_namespace: str = "mypack",
                  pack_description: str = "", pack_format: int = 48, main_dir: str = "./",
-                 main_file_path: str = "main.rn", debug_mode=False) -> None:
+                 main_file_path: str = "main.rn", debug_mode=False, parse_cache=None, optimize=False,
+                 temp_compound: str | None = None, data_files: Dict[str, str] | None = None,
+                 module_cache=None) -> None:
         reset_expr_id()
         self.files = dict()
         self.dp_files = dict()
@@ -333,7 +451,7 @@ class Transpiler:
         self.pack_format = pack_format
         self.main_dir = main_dir
         self.variables: Dict[str, VariableDeclaration] = dict()
-        self.functions: List[FunctionDeclaration] = []
+        self.functions = FunctionTable()
         self.classes: Dict[str, ClassDeclaration] = dict()
         self.loops: Dict[Any, LoopDeclaration] = dict()
         self.init_libs = []
@@ -345,6 +463,49 @@ class Transpiler:
         self.builtin_vars = builtin_vars
         self.s = "" if self.pack_format >= 48 else "s"
         self.debug_mode = debug_mode
+        self.optimize = optimize
+        # how many calls were replaced with the commands of the functions, and why each function was or wasn't inlined
+        self.inlined_calls = 0
+        self.inline_decisions: List[Tuple[str, str]] = []
+        # how many arguments are passed in scores instead of the storage
+        self.score_arguments = 0
+        # how many for loops were unrolled
+        self.unrolled_loops = 0
+        self.unroller = LoopUnroller(builtin_fns, builtin_vars, self._variable_access)
+        # the files of the functions being transpiled right now, which don't have all of their commands yet
+        self.defining: Set[str] = set()
+        # how many checks of the __returned__, __break__ and __continue__ flags and their resets were removed
+        self.guards_removed = 0
+        # the files of the data folder, output path -> source path, which can call the functions of the pack too
+        self.data_files = data_files or {}
+        # source path -> text of the files of the data folder that can run the functions, once a pass has read them
+        self.data_functions: Dict[str, str] | None = None
+        # the function files that were removed because nothing runs them
+        self.removed_files: List[str] = []
+        # how many commands the constant propagation changed or removed
+        self.constants_folded = 0
+        # rule name -> how many times the peephole optimizer applied it
+        self.peephole_counts: Dict[str, int] = {}
+        # the distinct temporary score names before and after the register allocation
+        self.temp_names = (0, 0)
+        # the compound of the radon.temp storage that keeps the temporary paths, None to keep them at the top
+        self.temp_compound = temp_compound
+        # the distinct temporary paths of the radon.temp storage before and after the slot allocation
+        self.temp_paths = (0, 0)
+        self.parse_cache = parse_cache  # type: ParseCache | None
+        # file -> files it imports, used by watch mode to find out if a change affects the build
+        self.dependencies: Dict[str, List[str]] = {os.path.realpath(main_file_path): []}
+        # the .rn files that were imported, and the chain of the ones being transpiled right now
+        self.imported: Set[str] = set()
+        self.import_stack: List[str] = [os.path.realpath(main_file_path)]
+        # the modules transpiled by the previous build of watch mode, which are reused when nothing before them changed
+        self.module_cache = module_cache  # type: ModuleCache | None
+        # the key of everything transpiled so far, and how much of the text of each file being transpiled it covers
+        self.module_key = module_key(VERSION_RADON, pack_namespace, str(pack_format), os.path.realpath(main_file_path),
+                                     str(debug_mode), str(optimize), str(temp_compound))
+        self.import_offsets: List[int] = [0]
+        # the files the import statements have read, in order
+        self.read_files: List[str] = []
 
         if len(statements) == 0:
             self.files = {}
@@ -379,33 +540,237 @@ class Transpiler:
         if len(self.variables.keys()) > 0:
             self.load_file.insert(0, f'scoreboard objectives add {self.pack_namespace}.global dummy "{self.pack_namespace}:global"')
 
-        # remove the lines after immediate returns
+        # lift the strings the builtins have added, and remove the commands after immediate returns
         for file in self.files:
-            lines = self.files[file]
-            if len(lines) == 0:
-                continue
-            index = 0
-            for index, line in enumerate(lines):
-                if line.startswith("return "):
+            lines = lift_all(self.files[file])
+            for index, cmd in enumerate(lines):
+                if isinstance(cmd, Return):
+                    lines = lines[:index + 1]
                     break
-            self.files[file] = lines[:index + 1]
+            self.files[file] = lines
+        # every function can be run with /function, the files of the blocks only run where they are called, and the
+        # data folder can only run them by their names, which change between builds, so only -O needs to read it
+        referenced = self._referenced_files(self.optimize)
+        self.guards_removed = GuardEliminator(self.pack_namespace).eliminate(
+            self.files, {"__load__", "tick"} | set(f.file_name for f in self.functions) | referenced)
+        if self.optimize:
+            inliner = Inliner(self.pack_namespace)
+            functions = {f.file_name: (f.name, f.inline) for f in self.functions if f.type == "radon"}
+            self.inlined_calls = inliner.inline(self.files, {k: v for (k, v) in functions.items() if k in self.files})
+            self.inline_decisions = inliner.decisions
+            arguments = {f.file_name: [arg.store.location for arg in f.arguments] for f in self.functions
+                         if f.type == "radon" and f.file_name in self.files
+                         and all(arg.store_via == "stack" for arg in f.arguments)}
+            self.score_arguments = ArgumentAllocator(self.pack_namespace).allocate(self.files, arguments)
+            self.constants_folded = ConstantPropagator(self.pack_namespace, MERGEABLE_FOLDERS).propagate(
+                self.files, referenced, self._unparsed_functions())
+            exported = set(f.file_name for f in self.functions if f.export)
+            self.removed_files = TreeShaker(self.pack_namespace).shake(
+                self.files, {"__load__", "tick"} | exported | referenced)
+            self.peephole_counts = PeepholeOptimizer().optimize(self.files)
+            self.temp_names = RegisterAllocator(self.pack_namespace).allocate(self.files)
+        if self.optimize or self.temp_compound is not None:
+            self.temp_paths = SlotAllocator(self.pack_namespace, self.temp_compound).allocate(self.files)
+        self._merge_duplicate_files()
         if self.debug_mode:
             for file in self.files:
-                lines = self.files[file]
                 new_file = []
-                for line in lines:
-                    new_file.append(line)
-                    if line.startswith("scoreboard players "):
-                        spl = line.split(" ")
-                        new_file.append('tellraw @a ["' + spl[3] + " " + spl[4] + ' = ",{"score":{"name":"' + spl[
-                            3] + '","objective":"' + spl[4] + '"}}]')
+                for cmd in self.files[file]:
+                    new_file.append(cmd)
+                    if isinstance(cmd, (ScoreLiteral, ScoreOperation, ScoreReset)):
+                        (name, objective) = cmd.target.split(" ")
+                    elif isinstance(cmd, ScoreGet):
+                        (name, objective) = cmd.source.split(" ")
+                    else:
+                        continue
+                    new_file.append(Raw('tellraw @a ["' + name + " " + objective + ' = ",{"score":{"name":"' + name
+                                        + '","objective":"' + objective + '"}}]'))
                 self.files[file] = new_file
 
+    def _referenced_files(self, data_folder: bool = True) -> Set[str]:
+        # the files that the function tags and the advancements of the pack mention, and the ones the files of the data
+        # folder that can run functions mention
+        fn_ref = re.compile(re.escape(self.pack_namespace) + r":([a-z0-9_./-]+)")
+        res = set()
+        for (name, content) in self.dp_files.items():
+            if isinstance(content, str) and FUNCTION_RUNNERS.search(name):
+                res.update(fn_ref.findall(content))
+        if data_folder:
+            for content in self._data_functions().values():
+                res.update(fn_ref.findall(content))
+        return res
+
+    def _unparsed_functions(self) -> List[str]:
+        # the text of the function files that aren't transpiled: the ones of the data folder and the imported ones
+        res = [render(cmds) for (file, cmds) in self.files.items() if file.startswith("__imported__/")]
+        res.extend(content for (source, content) in self._data_functions().items() if source.endswith(".mcfunction"))
+        return res
+
+    def _data_functions(self) -> Dict[str, str]:
+        # the files of the data folder are only read by the passes that look into them, which makes the output depend
+        # on them
+        if self.data_functions is None:
+            self.data_functions = {}
+            for (name, source) in self.data_files.items():
+                if FUNCTION_RUNNERS.search(name):
+                    with open(source, "r", encoding="utf-8") as file:
+                        self.data_functions[source] = file.read()
+                    self.dependencies.setdefault(os.path.realpath(source), [])
+        return self.data_functions
+
+    def _variable_access(self, fn_name: str, name: str) -> Literal["read", "write"] | None:
+        # what calling the function can do to the score of the variable through any chain of calls, "write" when the
+        # calls can't be followed, like the ones of a function tag or of a function that isn't complete yet
+        overloads = self.functions.overloads(fn_name)
+        if len(overloads) == 0 or any(f.type != "radon" or f.function == "replace me" for f in overloads):
+            return "write"
+        word = re.compile(r"\b" + re.escape(name) + r"\b")
+        queue = [f.file_name for f in overloads]
+        seen = set(queue)
+        res = None
+        while len(queue) > 0:
+            file = queue.pop()
+            if file in self.defining or file not in self.files:
+                return "write"
+            for line in self.files[file]:
+                cmd = lift(line)
+                for target in callees(cmd, self.files, self.pack_namespace):
+                    if target is None:
+                        return "write"
+                    if target not in seen:
+                        seen.add(target)
+                        queue.append(target)
+                if word.search(str(cmd)) is None:
+                    continue
+                if cmd.opaque or any(score.split(" ")[0] == name for score in cmd.score_writes()):
+                    return "write"
+                res = "read"
+        return res
+
+    def _merge_duplicate_files(self):
+        # merges the generated files with the same content, until merging doesn't make any more of them the same
+        fn_ref = re.compile(re.escape(self.pack_namespace) + r":([a-z0-9_./-]+)")
+        contents = {file: render(self.files[file]) for file in self.files}
+        # "schedule ... replace" would cancel the other file's schedule if they were merged
+        scheduled = set()
+        for content in contents.values():
+            if "schedule function " in content:
+                scheduled.update(re.findall(r"schedule function " + fn_ref.pattern, content))
+        while True:
+            merged = {}
+            by_content = {}
+            for file in contents:
+                if not file.startswith(MERGEABLE_FOLDERS) or file in scheduled:
+                    continue
+                # a file calling itself is the same as another file calling itself
+                key = fn_ref.sub(lambda m: "\0" if m.group(1) == file else m.group(0), contents[file])
+                if key in by_content:
+                    merged[file] = by_content[key]
+                else:
+                    by_content[key] = file
+            if len(merged) == 0:
+                break
+            for file in merged:
+                del contents[file]
+
+            def repl(m):
+                name = merged.get(m.group(1))
+                return m.group(0) if name is None else f"{self.pack_namespace}:{name}"
+
+            for file in contents:
+                if ":" in contents[file]:
+                    contents[file] = fn_ref.sub(repl, contents[file])
+            for file in self.dp_files:
+                if isinstance(self.dp_files[file], str):
+                    self.dp_files[file] = fn_ref.sub(repl, self.dp_files[file])
+        if len(contents) != len(self.files):
+            self.files = {file: lift_all(text.split("\n")) if text else [] for (file, text) in contents.items()}
+
+    def _resolve_import(self, ctx: TranspilerContext, statement: Statement, pt: str) -> str:
+        # imports are relative to the importing file, the working directory is left alone
+        full = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(ctx.radon_path)), pt))
+        if not os.path.isfile(full):
+            raise_syntax_error("File not found", statement)
+        self.dependencies.setdefault(os.path.realpath(ctx.radon_path), []).append(full)
+        self.dependencies.setdefault(full, [])
+        self.read_files.append(full)
+        return full
+
+    def _advance_module_key(self, statement: Statement, *files: str) -> str:
+        # adds the text before the import statement and the files it reads to the key of the state
+        if self.module_cache is not None:
+            start = self.import_offsets[-1]
+            self.module_key = module_key(self.module_key, statement.code[start:statement.start],
+                                         *(f"{pt}\0{file_hash(pt)}" for pt in files))
+            self.import_offsets[-1] = max(start, statement.end)
+        return self.module_key
+
+    def _module_state(self) -> Dict[str, Any]:
+        # a shallow copy of what transpiling a module can change, the lists inside the dictionaries, like the files,
+        # are only added to after they're created, so their lengths are enough
+        res = {}
+        for name in MODULE_STATE:
+            value = getattr(self, name)
+            if isinstance(value, dict):
+                values = list(value.values())
+                res[name] = (list(value), values, [len(v) if isinstance(v, list) else -1 for v in values])
+            elif isinstance(value, (list, set, FunctionTable)):
+                res[name] = list(value)
+            else:
+                res[name] = value
+        return res
+
+    def _module_changes(self, before: Dict[str, Any]) -> Dict[str, Any] | None:
+        # what changed since the state was taken: the new values of the dictionaries' keys and the new contents of the
+        # rest, None if a key was removed
+        res = {}
+        for name in MODULE_STATE:
+            (old, value) = (before[name], getattr(self, name))
+            if isinstance(value, dict):
+                (keys, values, lengths) = old
+                new_keys = list(value)
+                if new_keys[:len(keys)] != keys:
+                    return None
+                new_values = list(value.values())
+                changed = {}
+                for (index, v) in enumerate(new_values):
+                    if index >= len(keys) or v is not values[index] or lengths[index] >= 0 and len(v) != lengths[index]:
+                        changed[new_keys[index]] = list(v) if isinstance(v, list) else v
+                if len(changed) > 0:
+                    res[name] = changed
+            elif isinstance(value, (list, set, FunctionTable)):
+                if not _same_items(old, list(value)):
+                    res[name] = list(value)
+            elif value != old:
+                res[name] = value
+        return res
+
+    def _apply_module_changes(self, changes: Dict[str, Any]):
+        # the lists are changed in place, the load file and the main file are referenced by other attributes
+        for (name, change) in changes.items():
+            value = getattr(self, name)
+            if isinstance(value, dict):
+                for (k, v) in change.items():
+                    if isinstance(v, list) and isinstance(value.get(k), list):
+                        value[k][:] = v
+                    else:
+                        value[k] = list(v) if isinstance(v, list) else v
+            elif isinstance(value, list):
+                value[:] = change
+            elif isinstance(value, set):
+                value.clear()
+                value.update(change)
+            elif isinstance(value, FunctionTable):
+                self.functions = FunctionTable()
+                self.functions.extend(change)
+            else:
+                setattr(self, name, change)
+
     def get_datapack_files(self):
         fn_folder = "function" + self.s
         dp_files = dict()
         for file in self.files:
-            dp_files[f"data/{self.pack_namespace}/{fn_folder}/{file}.mcfunction"] = "\n".join(self.files[file])
+            dp_files[f"data/{self.pack_namespace}/{fn_folder}/{file}.mcfunction"] = render(self.files[file])
         dp_files["pack.mcmeta"] = json.dumps({
             "pack": {
                 "pack_format": self.pack_format,
@@ -432,12 +797,12 @@ class Transpiler:
         k = f"literal_num_{num}"
         if k not in self.data:
             self.data[k] = True
-            self.load_file.append(f"scoreboard players set literal_{num} __temp__ {num}")
+            self.load_file.append(ScoreLiteral("set", f"literal_{num} __temp__", num))
         return CplScore(None, f"literal_{num}", "float" if isf else "int")
 
     def get_temp_file_name(self, content: str | List[str]):
         if isinstance(content, list):
-            content = "\n".join(content)
+            content = render(content)
         if content in self.tempFiles:
             return self.tempFiles[content]
         file_name = f"__temp__/{get_uuid()}"
@@ -446,11 +811,7 @@ class Transpiler:
         return file_name
 
     def get_all_fn_by_name(self, name):
-        ls = []
-        for fn in self.functions:
-            if fn.name == name:
-                ls.append(fn)
-        return ls
+        return list(self.functions.overloads(name))
 
     def check_args(self, args1, args2, base):
         if len(args1) != len(args2):
@@ -485,16 +846,13 @@ class Transpiler:
                 base)
 
     def get_fn(self, name, arguments: List[Cpl | CplDef], base) -> FunctionDeclaration | None:
-        for fn in self.functions:
-            if fn.name == name and self.check_args(fn.arguments, arguments, base):
+        for fn in self.functions.overloads(name):
+            if self.check_args(fn.arguments, arguments, base):
                 return fn
         return None
 
     def fn_exists(self, name):
-        for fn in self.functions:
-            if fn.name == name:
-                return fn
-        return None
+        return self.functions.first(name)
 
     def _transpile_statement(self, ctx: TranspilerContext, statement: Statement):
         if isinstance(statement, DefineEnumStatement):
@@ -559,7 +917,7 @@ class Transpiler:
 
             for mt in statement.methods:
                 self._transpile_statement(class_ctx, mt)
-                fn = self.functions[-1]
+                fn = self.functions.last
                 new_methods.append(fn.name)
             cls.methods = new_methods
 
@@ -567,25 +925,20 @@ class Transpiler:
                 self._transpile(class_ctx, parse(
                     tokenize("fn " + name + "() {}")[0],
                     [], list(self.classes.keys())))
-                fn = self.functions[-1]
+                fn = self.functions.last
                 methods.append(fn)
             return
         if isinstance(statement, ImportStatement):
             pt = statement.path.value[1:-1]
             if pt.endswith(".py"):
-                bef = os.getcwd()
-                os.chdir(os.path.dirname(ctx.radon_path))
-                if not os.path.exists(pt) or not os.path.isfile(pt):
-                    os.chdir(bef)
-                    raise_syntax_error("File not found", statement)
+                pt = self._resolve_import(ctx, statement, pt)
+                self._advance_module_key(statement, pt)
                 try:
                     lib_module = import_module_from_path(pt)
                 except Exception as e:
-                    os.chdir(bef)
                     raise_error("Import error", str(e), statement)
                     raise e
                 attrs = get_module_attr(lib_module)
-                os.chdir(bef)
                 if statement.as_ is not None:
                     name = statement.as_.value
                     if name not in self.variables:
@@ -606,13 +959,9 @@ class Transpiler:
             if pt.endswith(".mcfunction"):
                 if statement.as_ is None:
                     raise_syntax_error("Expected 'as' in mcfunction import statement", statement)
-                bef = os.getcwd()
-                os.chdir(os.path.dirname(ctx.radon_path))
-                if not os.path.exists(pt) or not os.path.isfile(pt):
-                    os.chdir(bef)
-                    raise_syntax_error("File not found", statement)
+                pt = self._resolve_import(ctx, statement, pt)
+                self._advance_module_key(statement, pt)
                 content = open(pt, "r", encoding="utf-8").read()
-                os.chdir(bef)
                 fn_id = get_uuid()
                 self.files[f"__imported__/{fn_id}"] = content.split("\n")
                 self.functions.append(FunctionDeclaration(
@@ -624,14 +973,40 @@ class Transpiler:
             if pt.endswith(".rn"):
                 if statement.as_ is not None:
                     raise_syntax_error("Unexpected 'as' in radon file import statement", statement)
-                bef = os.getcwd()
-                os.chdir(os.path.dirname(ctx.radon_path))
-                if not os.path.exists(pt) or not os.path.isfile(pt):
-                    os.chdir(bef)
-                    raise_syntax_error("File not found", statement)
+                pt = self._resolve_import(ctx, statement, pt)
+                if pt in self.import_stack:
+                    cycle = self.import_stack[self.import_stack.index(pt):] + [pt]
+                    raise_syntax_error(
+                        "Circular import: " + " -> ".join(os.path.relpath(p, self.main_dir) for p in cycle),
+                        statement
+                    )
+                if pt in self.imported:
+                    # every module is transpiled once, importing it again doesn't do anything
+                    return True
+                self.imported.add(pt)
+                key = self._advance_module_key(statement)
+                reads = len(self.read_files) - 1
+                # the output of the previous build is reused if nothing before the import and in the module changed,
+                # a module imported inside a function or a loop depends on them too
+                reusable = (self.module_cache is not None and ctx.function is None and ctx.loop is None
+                            and ctx.class_name is None and ctx.file is self.main_file)
+                entry = self.module_cache.get(key) if reusable else None
+                if entry is not None:
+                    self._apply_module_changes(entry.changes)
+                    set_expr_id(entry.expr_id)
+                    self.read_files.extend(f for (f, _) in entry.files[1:])
+                    self.module_key = entry.key_after
+                    return True
+                before = self._module_state() if reusable else None
                 content = open(pt, "r", encoding="utf-8").read()
-                os.chdir(bef)
-                (tokens, macros) = tokenize(content)
+                class_names = list(ctx.transpiler.classes.keys())
+                if self.parse_cache is not None:
+                    (statements, _) = self.parse_cache.parse(content, class_names)
+                else:
+                    (tokens, macros) = tokenize(content)
+                    statements = parse(tokens, macros, class_names)
+                self.import_stack.append(pt)
+                self.import_offsets.append(0)
                 ctx.transpiler._transpile(
                     TranspilerContext(
                         transpiler=ctx.transpiler,
@@ -641,39 +1016,51 @@ class Transpiler:
                         function=None,
                         loop=None,
                         class_name=None
-                    ), parse(tokens, macros, list(ctx.transpiler.classes.keys()))
+                    ), statements
                 )
+                self.import_stack.pop()
+                self.import_offsets.pop()
+                if self.module_cache is not None:
+                    files = [(f, file_hash(f)) for f in self.read_files[reads:]]
+                    self.module_key = module_key(key, *(f"{f}\0{h}" for (f, h) in files))
+                    # a python file can change anything, not only the state of the transpiler
+                    changes = self._module_changes(before) if before is not None else None
+                    if changes is not None and not any(f.endswith(".py") for (f, _) in files):
+                        self.module_cache.put(key, ModuleEntry(files, changes, get_expr_id(), self.module_key))
                 return True
             raise_syntax_error("Invalid import", statement)
         if isinstance(statement, ScheduleStatement):
             file_name = self._run_safe("__schedule__", statement.body, ctx)
-            ctx.file.append(
-                f"schedule function {self.pack_namespace}:{file_name} {statement.time.value} replace"
-            )
+            ctx.file.append(Schedule(f"{self.pack_namespace}:{file_name}", statement.time.value, "replace"))
             _return_safe(ctx)
             return True
         if statement.type == StatementType.BREAK:
             if not ctx.loop:
                 raise_syntax_error("Cannot use break outside of loop", statement)
             if ctx.file is ctx.loop.file:
-                ctx.file.append("return 0")
+                ctx.file.append(Return(0))
             else:
                 loop_id = ctx.loop.eid
-                ctx.file.append(f"scoreboard players set __break__{loop_id} __temp__ 1")
-                ctx.file.append(f"return 0")
+                ctx.file.append(ScoreLiteral("set", f"__break__{loop_id} __temp__", 1))
+                ctx.file.append(Return(0))
             return True
         if isinstance(statement, ContinueStatement):
             if not ctx.loop:
                 raise_syntax_error("Cannot use continue outside of loop", statement)
             if ctx.file is ctx.loop.file:
                 ctx.file.append(ctx.loop.continue_)
-                ctx.file.append("return 0")
+                ctx.file.append(Return(0))
             else:
                 loop_id = ctx.loop.eid
-                ctx.file.append(f"scoreboard players set __continue__{loop_id} __temp__ 1")
-                ctx.file.append(f"return 0")
+                ctx.file.append(ScoreLiteral("set", f"__continue__{loop_id} __temp__", 1))
+                ctx.file.append(Return(0))
             return True
         if isinstance(statement, LoopStatement):
+            unrolled = self.unroller.unroll(statement, self.optimize)
+            if unrolled is not None:
+                self.unrolled_loops += 1
+                self._transpile(ctx, unrolled)
+                return True
             file_name = self._run_safe(
                 "__loop__",
                 statement.body,
@@ -685,12 +1072,11 @@ class Transpiler:
                     function=ctx.function,
                     loop=statement)
             )
-            mac = get_fn_macro_obj(ctx)
-            ctx.file.append(f"{'$' if mac else ''}function {self.pack_namespace}:{file_name}" + mac)
+            ctx.file.append(self._call(file_name, get_fn_macro_obj(ctx)))
             loop_file = self.files[file_name]
             loop_id = int(file_name.split("/")[-1])
-            loop_file.insert(0, f"scoreboard players set __break__{loop_id} __temp__ 0")
-            loop_file.insert(0, f"scoreboard players set __continue__{loop_id} __temp__ 0")
+            loop_file.insert(0, ScoreLiteral("set", f"__break__{loop_id} __temp__", 0))
+            loop_file.insert(0, ScoreLiteral("set", f"__continue__{loop_id} __temp__", 0))
             loop_c = self.loops[loop_id]
             loop_file.append(loop_c.continue_)
             return True
@@ -717,17 +1103,17 @@ class Transpiler:
             if isinstance(resp, CplNBT):
                 resp = resp.cache(ctx, force="score")
             if isinstance(resp, CplScore):
-                if_cmd = f"execute unless score {resp.location} matches 0..0 run "
-                unless_cmd = f"execute if score {resp.location} matches 0..0 run "
+                if_cond = ScoreCondition(True, resp.location, "matches", "0..0")
+                unless_cond = ScoreCondition(False, resp.location, "matches", "0..0")
             elif isinstance(resp, CplSelector):
-                if_cmd = f"execute if entity {resp.value} run "
-                unless_cmd = f"execute unless entity {resp.value} run "
+                if_cond = Condition(["if", "entity", resp.value])
+                unless_cond = Condition(["unless", "entity", resp.value])
             else:
                 raise "Invalid condition"
             has_one = (has_if or has_else) and (not has_if or not has_else)
             if has_one:
                 one_body = statement.body if has_if else statement.elseBody
-                i_cmd = if_cmd if has_if else unless_cmd
+                i_cond = if_cond if has_if else unless_cond
                 if (
                         ctx.loop
                         and one_body
@@ -735,15 +1121,15 @@ class Transpiler:
                         and len(one_body) == 1
                         and one_body[0].type == StatementType.BREAK
                 ):
-                    ctx.file.append(f"{i_cmd}return 0")
+                    ctx.file.append(Execute([i_cond], Return(0)))
                     return True
 
             if has_if:
                 if_name = self._run_safe("__if__", statement.body, ctx)
-                ctx.file.append(f"{if_cmd}function {self.pack_namespace}:{if_name}")
+                ctx.file.append(Execute([if_cond], FunctionCall(f"{self.pack_namespace}:{if_name}")))
             if has_else:
                 else_name = self._run_safe("__else__", statement.elseBody, ctx)
-                ctx.file.append(f"{unless_cmd}function {self.pack_namespace}:{else_name}")
+                ctx.file.append(Execute([unless_cond], FunctionCall(f"{self.pack_namespace}:{else_name}")))
             _return_safe(ctx)
             return True
         if isinstance(statement, InlineStatement):
@@ -751,28 +1137,32 @@ class Transpiler:
             ret = self.tokens_to_cpl(ctx, expr_tokens)
             if isinstance(ret, CplScore):
                 # Cleaning the return results of the inline expression since they aren't going to be used
-                cl1 = f"scoreboard players operation {ret.location} = "
-                cl2 = f"execute store result score {ret.location} run "
-                cl3 = f"execute store result score {ret.location} run data get"
-                cl4 = f"execute store result score {ret.location} run scoreboard players get"
-                if len(ctx.file) > 0 and (
-                        ctx.file[-1].startswith(cl1)
-                        or ctx.file[-1].startswith(cl3)
-                        or ctx.file[-1].startswith(cl4)
-                ):
+                last = lift(ctx.file[-1]) if len(ctx.file) > 0 else None
+                if is_score_copy(last, ret.location):
                     ctx.file.pop()
                     return True
-                if len(ctx.file) > 0 and ctx.file[-1].startswith(cl2):
-                    ctx.file[-1] = ctx.file[-1][len(cl2):]
-                if len(ctx.file) > 1 and ret.location not in ctx.file[-1] and ctx.file[-2].startswith(cl1):
+                if is_score_store(last, ret.location):
+                    if isinstance(last.run, (DataGet, ScoreGet)):
+                        ctx.file.pop()
+                        return True
+                    ctx.file[-1] = last = last.run
+                if (
+                        len(ctx.file) > 1
+                        and not mentions_score(last, ret.location)
+                        and is_score_copy(lift(ctx.file[-2]), ret.location)
+                ):
                     ctx.file.pop(-2)
             if isinstance(ret, CplNBT) and ret.location.startswith(f"storage {self.pack_namespace}:radon.temp "):
                 # Cleaning the return results of the inline expression since they aren't going to be used
-                cl1 = f"data modify {ret.location} set from"
-                if len(ctx.file) > 0 and ctx.file[-1].startswith(cl1):
+                last = lift(ctx.file[-1]) if len(ctx.file) > 0 else None
+                if is_data_copy(last, ret.location):
                     ctx.file.pop()
                     return True
-                if len(ctx.file) > 1 and ctx.file[-2].startswith(cl1) and ret.location not in ctx.file[-1]:
+                if (
+                        len(ctx.file) > 1
+                        and not mentions_data(last, ret.location)
+                        and is_data_copy(lift(ctx.file[-2]), ret.location)
+                ):
                     ctx.file.pop(-2)
                     return True
             return True
@@ -806,22 +1196,15 @@ class Transpiler:
                 cls = self.classes[fn_name]
                 ret_loc = CplObjectNBT(statement.name, f"storage {self.pack_namespace}:variables this[-1]",
                                        cls.attributes.unique_type)
-            count = 0
-            new_functions = []
-            for f in self.functions:
-                if fn_name == f.name:
-                    count += 1
-                    if self.check_args(f.arguments, arguments, statement.name):
-                        if f.function == "replace me":
-                            count -= 1
-                            continue
-                        raise_syntax_error(
-                            "Function with the same name and arguments already exists",
-                            statement.name
-                        )
-                new_functions.append(f)
-            self.functions.clear()
-            self.functions.extend(new_functions)
+            for f in list(self.functions.overloads(fn_name)):
+                if self.check_args(f.arguments, arguments, statement.name):
+                    if f.function == "replace me":
+                        self.functions.remove(f)
+                        continue
+                    raise_syntax_error(
+                        "Function with the same name and arguments already exists",
+                        statement.name
+                    )
             file_name = statement.name.value.lower()
             if ctx.class_name is not None:
                 cls = self.classes[ctx.class_name]
@@ -837,7 +1220,9 @@ class Transpiler:
                 returns=ret_loc,
                 arguments=arguments,
                 file_name=file_name,
-                class_name=ctx.class_name
+                class_name=ctx.class_name,
+                inline=statement.inline,
+                export=statement.export
             )
 
             self.functions.append(f)
@@ -849,7 +1234,8 @@ class Transpiler:
                     macro = f"$({arg.name})"
                     if t.type == "string":
                         macro = f'"{macro}"'
-                    fn_file.append(f"$data modify {arg.store.location} append value {macro}")
+                    fn_file.append(Raw(f"$data modify {arg.store.location} append value {macro}"))
+            self.defining.add(file_name)
             self._transpile(
                 TranspilerContext(
                     transpiler=self,
@@ -861,12 +1247,14 @@ class Transpiler:
                     class_name=ctx.class_name),
                 statement.body
             )
+            self.defining.discard(file_name)
             if is_class_init:
                 cls = self.classes[ctx.class_name]
-                fn_file.insert(0, f"data modify storage {self.pack_namespace}:variables this append {cls.sample.get_data_str(ctx)}")
+                fn_file.insert(0, modify_with(f"storage {self.pack_namespace}:variables this", "append",
+                                              cls.sample.get_data_str(ctx)))
             if f.returns == "auto":
                 f.returns = "void"
-            fn_file.insert(0, f"scoreboard players set __returned__ __temp__ 0")
+            fn_file.insert(0, ScoreLiteral("set", "__returned__ __temp__", 0))
             return True
         if isinstance(statement, ReturnStatement):
             if not ctx.function:
@@ -894,8 +1282,8 @@ class Transpiler:
                     ctx.function.returns._set(ctx, cpl)
 
             if ctx.file is not self.files[ctx.function.file_name]:
-                ctx.file.append(f"scoreboard players set __returned__ __temp__ 1")
-            ctx.file.append(f"return 0")
+                ctx.file.append(ScoreLiteral("set", "__returned__ __temp__", 1))
+            ctx.file.append(Return(0))
             return True
         if isinstance(statement, IntroduceVariableStatement):
             name = statement.name.value
@@ -919,19 +1307,20 @@ class Transpiler:
             mac = get_fn_macro_obj(ctx)
             if has_repl:
                 fid = f"__execute__/{get_uuid()}"
-                self.files[fid] = [f"$execute {cmd_str} run function {self.pack_namespace}:{exec_name}{mac}"]
+                self.files[fid] = [Raw(f"$execute {cmd_str} run function {self.pack_namespace}:{exec_name}{mac}")]
                 for arg in ctx.function.arguments:
                     if arg.store_via == "macro":
-                        ctx.file.append(f"data modify storage {self.pack_namespace}:radon.temp _cmd_mem set value " + "{}")
+                        ctx.file.append(DataModify(f"storage {self.pack_namespace}:radon.temp _cmd_mem", "set", "value", "{}"))
                         break
                 if mac:
                     for arg in ctx.function.arguments:
                         if arg.store_via == "macro":
-                            ctx.file.append(f"$data modify storage {self.pack_namespace}:radon.temp _cmd_mem.{arg.name} set value '$({arg.name})'")
-                ctx.file.append(f"function {self.pack_namespace}:{fid} with storage {self.pack_namespace}:radon.temp _cmd_mem")
+                            ctx.file.append(Raw(f"$data modify storage {self.pack_namespace}:radon.temp _cmd_mem.{arg.name} set value '$({arg.name})'"))
+                ctx.file.append(FunctionCall(f"{self.pack_namespace}:{fid}", f"storage {self.pack_namespace}:radon.temp _cmd_mem"))
             else:
-                ctx.file.append(
-                    f"{'$' if mac else ''}execute {cmd_str} run function {self.pack_namespace}:{exec_name}{mac}")
+                line = f"execute {cmd_str} run function {self.pack_namespace}:{exec_name}{mac}"
+                # the subcommands are written by the user, so they are parsed like the builtins' commands
+                ctx.file.append(Raw("$" + line) if mac else lift(line))
             _return_safe(ctx)
             return True
         raise_syntax_error("Invalid statement", statement)
@@ -953,13 +1342,13 @@ class Transpiler:
         if isinstance(loop, LoopStatement):
             st = loop
             mac = get_fn_macro_obj(ctx)
-            continue_ = f"{'$' if mac else ''}function {self.pack_namespace}:{file_name}" + mac
+            continue_ = self._call(file_name, mac)
             if st.time:
                 if mac:
                     raise_syntax_error(
                         "Cannot use timed loops inside macro functions, move the loop into a normal function and run it there.",
                         st.time)
-                continue_ = f"schedule function {self.pack_namespace}:{file_name} {st.time.value} replace"
+                continue_ = Schedule(f"{self.pack_namespace}:{file_name}", st.time.value, "replace")
             loop = LoopDeclaration(
                 eid=eid,
                 file=new_file,
@@ -968,7 +1357,7 @@ class Transpiler:
             )
             if st.step:
                 step_name = f"__loop__/__step__/{get_uuid()}"
-                loop.continue_ = f"{'$' if mac else ''}function {self.pack_namespace}:{step_name}{mac}"
+                loop.continue_ = self._call(step_name, mac)
                 self.files[step_name] = []
                 self._transpile(TranspilerContext(
                     transpiler=self,
@@ -991,6 +1380,12 @@ class Transpiler:
         )
         return file_name
 
+    def _call(self, file_name: str, mac: str) -> Command:
+        # the function call of a generated file, which is a macro line in macro functions
+        if mac:
+            return Raw(f"$function {self.pack_namespace}:{file_name}{mac}")
+        return FunctionCall(f"{self.pack_namespace}:{file_name}")
+
     def _chains_to_args(self, chains: List[List[List[Token]]]):
         arg_names = []
         arguments = []
@@ -1024,93 +1419,83 @@ class Transpiler:
         return arguments
 
     def proc_cmd(self, ctx: TranspilerContext, cmd: str, base):
-        cmd_str = ""
+        cmd = " ".join(s[:-1] if s[-1] == "\\" else s for s in cmd.strip().split("\n"))
+        if "$" not in cmd:
+            return cmd, False
+        parts = []
         i = 0
         has_repl = False
         repl_i = 0
-        cmd = " ".join(s[:-1] if s[-1] == "\\" else s for s in cmd.strip().split("\n"))
         before_index = len(ctx.file)
-        while i < len(cmd):
-            if cmd[i: i + 3] == "\\$(":
+        while True:
+            m = CMD_REPL_REGEX.search(cmd, i)
+            if m is None:
+                parts.append(cmd[i:])
+                break
+            si = m.start()
+            parts.append(cmd[i:si])
+            kind = m.group(1)
+            if kind is None:
                 if self.pack_format < 18:
                     raise_syntax_error_t(
                         f"Macros are not supported in the pack format {self.pack_format}. "
                         f"Consider using a version > (17 or 1.20.1 or 23w35a)",
                         cmd,
-                        i,
-                        i + 3,
+                        si,
+                        si + 3,
                     )
-                cmd_str += "$("
-                i += 3
+                parts.append("$(")
+                i = m.end()
                 continue
-            if (
-                    cmd[i: i + 2] == "$("
-                    or cmd[i: i + 5] == "$str("
-                    or cmd[i: i + 6] == "$jstr("
-                    or cmd[i: i + 6] == "$dstr("
-                    or cmd[i: i + 5] == "$dat("
-                    or cmd[i: i + 5] == "$loc("
-            ):
-                si = i
-                k = 0
-                fp = 0
-                while i < len(cmd):
-                    i += 1
-                    c = cmd[i]
-                    if c == "(":
-                        if fp == 0:
-                            fp = i
-                        k += 1
-                    if c == ")":
-                        k -= 1
-                        if k == 0:
-                            break
-                if cmd[i] != ")":
-                    raise_syntax_error_t("Unterminated parentheses", cmd, si, i + 1)
-                repl = cmd[fp + 1: i]
-                (expr_tokens, _) = tokenize(repl)
-                expr_tokens = expr_tokens[:-1]
-                try:
-                    val = self.tokens_to_cpl(ctx, expr_tokens)
-                except RadonError as e:
-                    raise_syntax_error(e.text,
-                                       Token(base.code, TokenType.POINTER, base.start + si, base.start + i))
-                    raise e
+            fp = m.end() - 1
+            k = 0
+            i = -1
+            for p in CMD_PAREN_REGEX.finditer(cmd, fp):
+                k += 1 if p.group() == "(" else -1
+                if k == 0:
+                    i = p.start()
+                    break
+            if i == -1:
+                raise_syntax_error_t("Unterminated parentheses", cmd, si, len(cmd))
+            repl = cmd[fp + 1: i]
+            (expr_tokens, _) = tokenize(repl)
+            expr_tokens = expr_tokens[:-1]
+            try:
+                val = self.tokens_to_cpl(ctx, expr_tokens)
+            except RadonError as e:
+                raise_syntax_error(e.text,
+                                   Token(base.code, TokenType.POINTER, base.start + si, base.start + i))
+                raise e
 
-                if cmd[si + 1] == "(":
-                    cmd_str += f"$(_{repl_i})"
-                    val.cache(
-                        ctx, nbt_loc=f"storage {self.pack_namespace}:radon.temp _cmd_mem._{repl_i}", force="nbt"
-                    )
+            if kind == "":
+                parts.append(f"$(_{repl_i})")
+                val.cache(
+                    ctx, nbt_loc=f"storage {self.pack_namespace}:radon.temp _cmd_mem._{repl_i}", force="nbt"
+                )
 
-                    has_repl = True
-                    repl_i += 1
+                has_repl = True
+                repl_i += 1
+
+            elif kind == "str" or kind == "jstr":
+                parts.append(val.tellraw_object_str(ctx))
+            elif kind == "dstr":
+                py_val = val.get_py_value()
+                if py_val is not None:
+                    parts.append(str(py_val))
+                else:
+                    parts.append(val.tellraw_object_str(ctx))
+            elif kind == "dat":
+                parts.append(val.get_data_str(ctx))
+            elif kind == "loc":
+                if not isinstance(val, CplScore) and not isinstance(val, CplNBT):
+                    val = val.cache(ctx, force="nbt")
+                parts.append(val.location)
 
-                elif cmd[si + 1] == "s":
-                    cmd_str += val.tellraw_object_str(ctx)
-                elif cmd[si + 1:si + 1] == "ds":
-                    py_val = val.get_py_value()
-                    if py_val is not None:
-                        cmd_str += str(py_val)
-                    else:
-                        cmd_str += val.tellraw_object_str(ctx)
-                elif cmd[si + 1] == "j":
-                    cmd_str += val.tellraw_object_str(ctx)
-                elif cmd[si + 1:si + 2] == "da":
-                    cmd_str += val.get_data_str(ctx)
-                elif cmd[si + 1] == "l":
-                    if not isinstance(val, CplScore) and not isinstance(val, CplNBT):
-                        val = val.cache(ctx, force="nbt")
-                    cmd_str += val.location
-
-                i += 1
-                continue
-            cmd_str += cmd[i]
             i += 1
         if has_repl:
-            ctx.file.insert(before_index, f"data modify storage {self.pack_namespace}:radon.temp _cmd_mem set value " + "{}")
+            ctx.file.insert(before_index, DataModify(f"storage {self.pack_namespace}:radon.temp _cmd_mem", "set", "value", "{}"))
 
-        return cmd_str, has_repl
+        return "".join(parts), has_repl
 
     def run_cmd(self, ctx: TranspilerContext, pointer: Token, score_loc=None, type="result") -> Cpl:
         file = ctx.file
@@ -1121,7 +1506,7 @@ class Transpiler:
         eid_val = CplScore(pointer, eid, "int")
 
         if not has_repl:
-            file.append(f"execute store {type} score {eid} run {cmd_str}")
+            file.append(Execute([Store(type, eid)], lift(cmd_str)))
             return eid_val
 
         cmd_file = []
@@ -1134,10 +1519,9 @@ class Transpiler:
             cmd_id = get_uuid()
             file_name = f"__cmd__/{cmd_id}"
         self.files[file_name] = cmd_file
-        cmd_file.append("$return run " + cmd_str)
-        file.append(
-            f"execute store {type} score {eid} run function {self.pack_namespace}:{file_name} with storage {self.pack_namespace}:radon.temp _cmd_mem"
-        )
+        cmd_file.append(Raw("$return run " + cmd_str))
+        file.append(Execute([Store(type, eid)], FunctionCall(f"{self.pack_namespace}:{file_name}",
+                                                             f"storage {self.pack_namespace}:radon.temp _cmd_mem")))
         return eid_val
 
     def _nbt_var_loc(self, ctx: TranspilerContext, token: Token) -> str:
@@ -1475,7 +1859,7 @@ class Transpiler:
                     if (isinstance(var_name_token, SelectorIdentifierToken)
                             or isinstance(var_name_token, BlockIdentifierToken)):
                         nbt_loc = self._nbt_var_loc(ctx, var_name_token)
-                        ctx.file.append(f"data modify {nbt_loc} set value {json.dumps(cpl.get_py_value())}")
+                        ctx.file.append(DataModify(nbt_loc, "set", "value", json.dumps(cpl.get_py_value())))
                         del self.variables[var_name]
                     return cpl
             else:
@@ -1492,12 +1876,12 @@ class Transpiler:
             if variable_cpl.unique_type.type in {"int", "float"} and isinstance(cpl, CplSelector):
                 variable_cpl._set(ctx, CplInt(t0[0], 0))
                 if isinstance(variable_cpl, CplScore):
-                    set_1 = f"scoreboard players set {variable_cpl.location} 1"
+                    set_1 = ScoreLiteral("set", variable_cpl.location, 1)
                 elif isinstance(variable_cpl, CplNBT):
-                    set_1 = f"data modify storage {self.pack_namespace}:variables {variable_cpl.location} set value 1"
+                    set_1 = DataModify(f"storage {self.pack_namespace}:variables {variable_cpl.location}", "set", "value", "1")
                 else:
                     raise ValueError("")
-                ctx.file.append(f"execute if entity {cpl.value} run {set_1}")
+                ctx.file.append(Execute([Condition(["if", "entity", cpl.value])], set_1))
                 return variable_cpl
 
             if variable_cpl.unique_type == "int" and cpl.unique_type == "float":
@@ -1581,12 +1965,11 @@ class Transpiler:
 
         found_fn = None
         available = []
-        for f in self.functions:
-            if f.name == name:
-                available.append(f"{f.name}({', '.join(str(arg.unique_type) + ' ' + arg.name for arg in f.arguments)})")
-                if self.check_args(f.arguments, args, base):
-                    found_fn = f
-                    break
+        for f in self.functions.overloads(name):
+            available.append(f"{f.name}({', '.join(str(arg.unique_type) + ' ' + arg.name for arg in f.arguments)})")
+            if self.check_args(f.arguments, args, base):
+                found_fn = f
+                break
         if found_fn is None:
             available_str = "\n".join(available)
             raise_syntax_error(f"Invalid arguments. Available usages:\n{available_str}", base)
@@ -1610,7 +1993,7 @@ class Transpiler:
                         f"data modify {store_at.location} append value {store_at.unique_type.content.get_sample_value()}")
                     val.cache(ctx, nbt_loc=f"{store_at.location}[-1]", force="nbt")
                 else:
-                    ctx.file.append(f"data modify {store_at.location} append {val.get_data_str(ctx)}")
+                    ctx.file.append(modify_with(store_at.location, "append", val.get_data_str(ctx)))
             elif arg.store_via == "macro":
                 val.cache(ctx, nbt_loc=f"storage {self.pack_namespace}:radon.temp _fn_args_macro.{found_fn.id}.{arg.name}", force="nbt")
                 has_any_macro_argument = True
@@ -1619,8 +2002,8 @@ class Transpiler:
 
         if found_fn.type == "mcfunction-imported":
             eid = f"int_{get_uuid()} __temp__"
-            ctx.file.append(
-                f"execute store result score {eid} run function {self.pack_namespace}:{found_fn.file_name} with storage fn_mem")
+            ctx.file.append(Execute([Store("result", eid)], FunctionCall(f"{self.pack_namespace}:{found_fn.file_name}",
+                                                                         "storage fn_mem")))
             return CplScore(base, eid)
 
         if found_fn.type == "python":
@@ -1629,12 +2012,12 @@ class Transpiler:
         actually_returning = CplInt(base, 0)
 
         if found_fn.type == "radon":
-            ctx.file.append(f"function {self.pack_namespace}:{found_fn.file_name}" + (
-                f" with storage {self.pack_namespace}:radon.temp _fn_args_macro.{found_fn.id}" if has_any_macro_argument else ""
-            ))
+            ctx.file.append(FunctionCall(f"{self.pack_namespace}:{found_fn.file_name}", (
+                f"storage {self.pack_namespace}:radon.temp _fn_args_macro.{found_fn.id}" if has_any_macro_argument else None
+            )))
             for index, arg in enumerate(fn_args):
                 if arg.store_via == "stack":
-                    ctx.file.append(f"data remove {arg.store.location}[-1]")
+                    ctx.file.append(DataRemove(f"{arg.store.location}[-1]"))
 
             # the line after these comments is for the case where you call a function inside a function
             # example:
@@ -1652,7 +2035,7 @@ class Transpiler:
             #   return
             # }
             if ctx.function and returns != "void":
-                ctx.file.append(f"scoreboard players set __returned__ __temp__ 0")
+                ctx.file.append(ScoreLiteral("set", "__returned__ __temp__", 0))
             if isinstance(returns, str):
                 if returns == "auto":
                     raise_syntax_error(
@@ -1665,8 +2048,9 @@ class Transpiler:
             class_name = name
 
         if class_name is not None and ctx.file is not self.main_file:
-            ctx.file.append(f"data modify storage {self.pack_namespace}:radon.temp class_this set from storage {self.pack_namespace}:variables this[-1]")
-            ctx.file.append(f"data remove storage {self.pack_namespace}:variables this[-1]")
+            ctx.file.append(DataModify(f"storage {self.pack_namespace}:radon.temp class_this", "set", "from",
+                                       f"storage {self.pack_namespace}:variables this[-1]"))
+            ctx.file.append(DataRemove(f"storage {self.pack_namespace}:variables this[-1]"))
             actually_returning = CplObjectNBT(base, f"storage {self.pack_namespace}:radon.temp class_this",
                                               self.classes[class_name].sample.unique_type)
 
@@ -1701,28 +2085,45 @@ class Transpiler:
         return self.compute_tokens(ctx, ls[0], ls[1].value, ls[2])
 
 
+def is_score_copy(cmd: Command | None, location: str) -> bool:
+    return isinstance(cmd, ScoreOperation) and cmd.target == location and cmd.op == "="
+
+
+def is_score_store(cmd: Command | None, location: str) -> bool:
+    # execute store result score <location> run <command>
+    return (
+            isinstance(cmd, Execute)
+            and len(cmd.clauses) == 1
+            and isinstance(cmd.clauses[0], Store)
+            and cmd.clauses[0].mode == "result"
+            and cmd.clauses[0].is_score
+            and cmd.clauses[0].target == location
+            and cmd.run is not None
+    )
+
+
+def is_data_copy(cmd: Command | None, location: str) -> bool:
+    return isinstance(cmd, DataModify) and cmd.target == location and cmd.mode == "set" and cmd.kind == "from"
+
+
+def _flag_set(name: str) -> ScoreCondition:
+    return ScoreCondition(False, f"{name} __temp__", "matches", "1..1")
+
+
 def _return_safe(ctx: TranspilerContext):
     if ctx.function:
-        ctx.file.append(
-            f"execute if score __returned__ __temp__ matches 1..1 run return 0"
-        )
+        ctx.file.append(Execute([_flag_set("__returned__")], Return(0)))
     if ctx.loop:
         if ctx.file is ctx.loop.file:
-            ctx.file.append(
-                f"execute if score __break__{ctx.loop.eid} __temp__ matches 1..1 run return 0"
-            )
+            ctx.file.append(Execute([_flag_set(f"__break__{ctx.loop.eid}")], Return(0)))
             cou = ctx.loop.continue_
-            mac = ""
-            if cou[0] == "$":
-                mac = "$"
-                cou = cou[1:]
-            ctx.file.append(
-                f"{mac}execute if score __continue__{ctx.loop.eid} __temp__ matches 1..1 run return run {cou}"
-            )
+            if isinstance(cou, Raw) and str(cou)[0] == "$":
+                # a macro line, the whole command has to be one
+                ctx.file.append(Raw(
+                    f"$execute if score __continue__{ctx.loop.eid} __temp__ matches 1..1 run return run {str(cou)[1:]}"
+                ))
+            else:
+                ctx.file.append(Execute([_flag_set(f"__continue__{ctx.loop.eid}")], Return(run=cou)))
         else:
-            ctx.file.append(
-                f"execute if score __break__{ctx.loop.eid} __temp__ matches 1..1 run return 0"
-            )
-            ctx.file.append(
-                f"execute if score __continue__{ctx.loop.eid} __temp__ matches 1..1 run return 0"
-            )
+            ctx.file.append(Execute([_flag_set(f"__break__{ctx.loop.eid}")], Return(0)))
+            ctx.file.append(Execute([_flag_set(f"__continue__{ctx.loop.eid}")], Return(0)))
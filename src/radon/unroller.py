@@ -0,0 +1,279 @@
+import copy
+import re
+from typing import Callable, Dict, List, Tuple
+
+from .dp_ast import COMMANDS, BreakStatement, ContinueStatement, ExecuteMacroStatement, IfFlowStatement, \
+    InlineStatement, LoopStatement, Statement, parse_str
+from .tokenizer import INC_OP, SET_OP, GroupToken, Token, TokenType, tokenize
+
+# the most statements, counting the ones inside blocks, a loop can be unrolled into without the unroll hint
+UNROLL_LIMIT = 64
+# how many iterations each call runs when a loop is too large to be unrolled fully
+UNROLL_FACTOR = 4
+# the most iterations a loop can have to be unrolled, a loop with more is most likely infinite
+MAX_ITERATIONS = 1 << 16
+COMPARISONS = {
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "!=": lambda a, b: a != b,
+}
+# the builtins that can write the variables they are given
+WRITING_BUILTINS = ("swap",)
+
+
+def _int(tokens: List[Token]) -> int | None:
+    if len(tokens) == 1 and tokens[0].type == TokenType.INT_LITERAL:
+        return int(tokens[0].value)
+    if len(tokens) == 2 and tokens[0].value == "-" and tokens[1].type == TokenType.INT_LITERAL:
+        return -int(tokens[1].value)
+    return None
+
+
+class LoopUnroller:
+    """
+    Unrolls the for loops that run a number of times that is known at compile time: the ones that set a variable to
+    an int, compare it with an int and only change it by adding or subtracting an int in the iterator. Every iteration
+    is a copy of the body where the variable is replaced with its value, so arr[i] becomes a path of the storage, and
+    the variable is set to the value it ends with after them. The copies also set the variable when the body can read it
+    in another way, like in a command or a function that is called.
+
+    A loop that would be unrolled into more than UNROLL_LIMIT statements runs UNROLL_FACTOR iterations each time its
+    function is called instead, and the ones that are left are unrolled after it. A loop isn't unrolled if its body
+    changes the variable, calls a function or runs a command that can change it, can break, continue or return, or
+    defines something, like a function.
+    """
+
+    def __init__(self, builtin_fns: Dict[str, list], builtin_vars: Dict[str, object],
+                 access: Callable[[str, str], str | None]) -> None:
+        self.builtin_fns = builtin_fns
+        self.builtin_vars = builtin_vars
+        # function name, variable -> "read" or "write" if calling the function can read or write the variable
+        self.access = access
+        # whether the body of the loop being checked can read the variable without the tokens that are replaced
+        self.reads = False
+
+    def unroll(self, statement: LoopStatement, optimize: bool) -> List[Statement] | None:
+        """
+        Returns the statements that replace the loop, None to keep it. A loop without the unroll hint is only unrolled
+        when optimizing.
+        """
+        if (statement.unroll is None and not optimize) or statement.unroll == 1:
+            return None
+        counted = self.counted(statement)
+        if counted is None:
+            return None
+        (name, values, final) = counted
+        # the first statement checks the condition
+        body = statement.body[1:]
+        self.reads = False
+        if not self._fits(body, name, True):
+            return None
+        size = max(1, self._size(body))
+        factor = statement.unroll
+        if factor is None:
+            if size * len(values) <= UNROLL_LIMIT:
+                factor = 0
+            elif size * UNROLL_FACTOR <= UNROLL_LIMIT:
+                factor = UNROLL_FACTOR
+            else:
+                return None
+        if factor == 0 or factor >= len(values):
+            return self._iterations(body, name, values, final)
+        # the loop runs until the iterations that are left are fewer than the factor
+        count = len(values) - len(values) % factor
+        bound = values[count] if count < len(values) else final
+        guard = copy.copy(statement.body[0])
+        guard.condition = tokenize(f"{name} {'<' if final > values[0] else '>'} {self._literal(bound)}")[0][:-1]
+        loop_body = [guard]
+        for n in range(factor):
+            if n > 0:
+                loop_body.extend(statement.step)
+            loop_body.extend(body)
+        loop = LoopStatement(statement.code, statement.start, statement.end, None, loop_body, statement.step)
+        return [loop] + self._iterations(body, name, values[count:], final)
+
+    def counted(self, statement: LoopStatement) -> Tuple[str, List[int], int] | None:
+        """
+        Returns the variable of the loop, the values it has in each iteration and the value it ends with, None if the
+        loop doesn't run a number of times that is known at compile time.
+        """
+        if statement.time is not None or statement.init is None or statement.condition is None \
+                or len(statement.step) != 1 or not isinstance(statement.init, InlineStatement) \
+                or not isinstance(statement.step[0], InlineStatement):
+            return None
+        init = statement.init.exprTokens
+        if len(init) < 3 or init[0].type != TokenType.IDENTIFIER or init[1].value != "=":
+            return None
+        name = init[0].value
+        start = _int(init[2:])
+        condition = statement.condition
+        if start is None or len(condition) < 3 or condition[0].type != TokenType.IDENTIFIER \
+                or condition[0].value != name or condition[1].value not in COMPARISONS:
+            return None
+        stop = _int(condition[2:])
+        step = self._step(statement.step[0].exprTokens, name)
+        if stop is None or step is None:
+            return None
+        compare = COMPARISONS[condition[1].value]
+        values = []
+        value = start
+        while compare(value, stop):
+            if len(values) == MAX_ITERATIONS:
+                return None
+            values.append(value)
+            value += step
+        return name, values, value
+
+    def _step(self, tokens: List[Token], name: str) -> int | None:
+        # how much the iterator adds to the variable
+        if len(tokens) == 2 and tokens[0].value == name and tokens[1].value in INC_OP:
+            return 1 if tokens[1].value == "++" else -1
+        if len(tokens) == 2 and tokens[1].value == name and tokens[0].value in INC_OP:
+            return 1 if tokens[0].value == "++" else -1
+        if len(tokens) >= 3 and tokens[0].value == name and tokens[1].value in ("+=", "-="):
+            amount = _int(tokens[2:])
+            if amount is not None:
+                return amount if tokens[1].value == "+=" else -amount
+        return None
+
+    def _fits(self, statements: List[Statement], name: str, top: bool) -> bool:
+        # whether the statements can be copied with the variable replaced, top when they aren't in a nested loop
+        for st in statements:
+            if isinstance(st, (BreakStatement, ContinueStatement)):
+                if top:
+                    return False
+            elif isinstance(st, InlineStatement):
+                if not self._fits_tokens(st.exprTokens, name):
+                    return False
+            elif isinstance(st, IfFlowStatement):
+                if not self._fits_tokens(st.condition, name) or not self._fits(st.body, name, top) \
+                        or not self._fits(st.elseBody or [], name, top):
+                    return False
+            elif isinstance(st, LoopStatement):
+                # a timed loop runs after the variable has its last value
+                if st.time is not None or not self._fits(st.body, name, False) \
+                        or not self._fits(st.step, name, False):
+                    return False
+            elif isinstance(st, ExecuteMacroStatement):
+                # the command can store a result in the variable
+                if re.search(r"\b" + re.escape(name) + r"\b", st.command):
+                    return False
+                if not self._fits(st.body, name, top):
+                    return False
+            else:
+                return False
+        return True
+
+    def _fits_tokens(self, tokens: List[Token], name: str) -> bool:
+        for (index, token) in enumerate(tokens):
+            prev = tokens[index - 1] if index > 0 else None
+            if token.type == TokenType.LAMBDA_FUNCTION:
+                return False
+            if token.type == TokenType.IDENTIFIER and token.value == name:
+                after = tokens[index + 1].value if index + 1 < len(tokens) else None
+                if after in SET_OP or after in INC_OP or prev is not None and prev.value in INC_OP:
+                    return False
+            elif token.type == TokenType.IDENTIFIER and token.value in COMMANDS:
+                # the command can change the variable, or run a function that does
+                if self._command_uses(tokens, name):
+                    return False
+                self.reads = True
+            elif token.type == TokenType.SYMBOL and token.value == "$" \
+                    or token.type == TokenType.STRING_LITERAL and "$" in token.value:
+                # the macros read the variable when they run
+                self.reads = True
+            if not isinstance(token, GroupToken):
+                continue
+            if token.type == TokenType.FUNCTION_CALL:
+                fn_name = token.func.value
+                if prev is not None and prev.value == ".":
+                    owner = tokens[index - 2] if index > 1 else None
+                    if owner is None or owner.value not in self.builtin_vars:
+                        # a method of a class, which isn't followed
+                        return False
+                elif fn_name not in self.builtin_fns:
+                    access = self.access(fn_name, name)
+                    if access == "write":
+                        return False
+                    if access == "read":
+                        self.reads = True
+                elif fn_name in WRITING_BUILTINS or any(fn.type == "python-raw" for fn in self.builtin_fns[fn_name]):
+                    # these use the code of their arguments, which isn't replaced
+                    if self._mentions(token.children, name):
+                        return False
+            if not self._fits_tokens(token.children, name):
+                return False
+        return True
+
+    def _command_uses(self, tokens: List[Token], name: str) -> bool:
+        # whether the command mentions the variable anywhere, or runs a function
+        word = re.compile(r"\b" + re.escape(name) + r"\b")
+        return any(token.value == "function" or not isinstance(token, GroupToken) and word.search(token.value)
+                   or isinstance(token, GroupToken) and self._command_uses(token.children, name) for token in tokens)
+
+    def _mentions(self, tokens: List[Token], name: str) -> bool:
+        return any(token.type == TokenType.IDENTIFIER and token.value == name
+                   or isinstance(token, GroupToken) and self._mentions(token.children, name) for token in tokens)
+
+    def _size(self, statements: List[Statement]) -> int:
+        res = 0
+        for st in statements:
+            res += 1
+            if isinstance(st, IfFlowStatement):
+                res += self._size(st.body) + self._size(st.elseBody or [])
+            elif isinstance(st, (LoopStatement, ExecuteMacroStatement)):
+                res += self._size(st.body)
+        return res
+
+    def _literal(self, value: int) -> str:
+        return str(value) if value >= 0 else f"({value})"
+
+    def _iterations(self, body: List[Statement], name: str, values: List[int], final: int) -> List[Statement]:
+        # the variable already has the first value
+        res = []
+        for (n, value) in enumerate(values):
+            if self.reads and n > 0:
+                res.extend(parse_str(f"{name} = {value}")[0])
+            literal = tokenize(self._literal(value))[0][:-1]
+            res.extend(self._substitute(st, name, literal) for st in body)
+        if len(values) > 0:
+            res.extend(parse_str(f"{name} = {final}")[0])
+        return res
+
+    def _substitute(self, st: Statement, name: str, literal: List[Token]) -> Statement:
+        res = copy.copy(st)
+        if isinstance(st, InlineStatement):
+            res.exprTokens = self._substitute_tokens(st.exprTokens, name, literal)
+        elif isinstance(st, IfFlowStatement):
+            res.condition = self._substitute_tokens(st.condition, name, literal)
+            res.body = [self._substitute(s, name, literal) for s in st.body]
+            if st.elseBody:
+                res.elseBody = [self._substitute(s, name, literal) for s in st.elseBody]
+        elif isinstance(st, LoopStatement):
+            res.body = [self._substitute(s, name, literal) for s in st.body]
+            res.step = [self._substitute(s, name, literal) for s in st.step]
+            if st.init is not None:
+                res.init = self._substitute(st.init, name, literal)
+            if st.condition is not None:
+                res.condition = self._substitute_tokens(st.condition, name, literal)
+        elif isinstance(st, ExecuteMacroStatement):
+            res.body = [self._substitute(s, name, literal) for s in st.body]
+        return res
+
+    def _substitute_tokens(self, tokens: List[Token], name: str, literal: List[Token]) -> List[Token]:
+        res = []
+        for (index, token) in enumerate(tokens):
+            if token.type == TokenType.IDENTIFIER and token.value == name:
+                prev = tokens[index - 1].value if index > 0 else None
+                after = tokens[index + 1].value if index + 1 < len(tokens) else None
+                # an attribute, or a key of an object
+                if prev != "." and after != ":":
+                    res.extend(literal)
+                    continue
+            if isinstance(token, GroupToken):
+                token = copy.copy(token)
+                token.children = self._substitute_tokens(token.children, name, literal)
+            res.append(token)
+        return res
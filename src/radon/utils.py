@@ -1,5 +1,7 @@
+import sys
 from enum import Enum
 from typing import Dict, Union, List, Any
+from weakref import WeakValueDictionary
 
 FLOAT_PREC = 1000
 INT_LIMIT = 2147483647
@@ -150,6 +152,16 @@ def reset_expr_id():
     _expr_id = 0
 
 
+def get_expr_id():
+    return _expr_id
+
+
+def set_expr_id(value: int):
+    # used to continue after a module whose output was reused, as if it had been transpiled
+    global _expr_id
+    _expr_id = value
+
+
 def get_uuid():
     global _expr_id
     _expr_id += 1
@@ -188,15 +200,54 @@ class UniversalStrMixin:
         return f"{self.__class__.__name__}({', '.join(attributes)})"
 
 
+class CplDefMeta(type):
+    """
+    Hash-conses the types using it, constructing one with the same children returns the existing one.
+    """
+
+    def __init__(cls, name, bases, attrs):
+        super().__init__(name, bases, attrs)
+        # children are keyed by identity, they are kept alive by the interned type itself
+        cls.interned = WeakValueDictionary()
+
+    def __call__(cls, *args):
+        key = cls.intern_key(*args)
+        t = cls.interned.get(key)
+        if t is None:
+            t = super().__call__(*args)
+            cls.interned[key] = t
+        return t
+
+
 class CplDef:
     def __init__(self, type: str):
         self.type = type
+        self._str = None
+        self._hash = None
+
+    def _to_str(self) -> str:
+        return object.__repr__(self)
+
+    def __str__(self) -> str:
+        # the structural key of the type, interned so that comparing two of them is an identity check
+        if self._str is None:
+            self._str = sys.intern(self._to_str())
+        return self._str
 
     def __eq__(self, other) -> bool:
+        if self is other:
+            return True
+        if isinstance(other, CplDef):
+            return (self._str or str(self)) is (other._str or str(other))
         return str(self) == str(other)
 
     def __ne__(self, other):
-        return str(self) != str(other)
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(str(self))
+        return self._hash
 
     def get_sample_value(self) -> str:
         return ""
@@ -215,57 +266,77 @@ class VariableDeclaration:
         self.get_func = get_func
 
 
-class CplDefInt(CplDef):
+class CplDefInt(CplDef, metaclass=CplDefMeta):
     def __init__(self):
         super().__init__("int")
 
-    def __str__(self) -> str:
+    @staticmethod
+    def intern_key():
+        return ()
+
+    def _to_str(self) -> str:
         return "int"
 
     def get_sample_value(self) -> str:
         return "0"
 
 
-class CplDefFloat(CplDef):
+class CplDefFloat(CplDef, metaclass=CplDefMeta):
     def __init__(self):
         super().__init__("float")
 
-    def __str__(self) -> str:
+    @staticmethod
+    def intern_key():
+        return ()
+
+    def _to_str(self) -> str:
         return "float"
 
     def get_sample_value(self) -> str:
         return "0.0"
 
 
-class CplDefString(CplDef):
+class CplDefString(CplDef, metaclass=CplDefMeta):
     def __init__(self):
         super().__init__("string")
 
-    def __str__(self) -> str:
+    @staticmethod
+    def intern_key():
+        return ()
+
+    def _to_str(self) -> str:
         return "string"
 
     def get_sample_value(self) -> str:
         return "''"
 
 
-class CplDefArray(CplDef):
+class CplDefArray(CplDef, metaclass=CplDefMeta):
     def __init__(self, content: CplDef):
         super().__init__("array")
         self.content = content
 
-    def __str__(self) -> str:
+    @staticmethod
+    def intern_key(content):
+        return id(content)
+
+    def _to_str(self) -> str:
         return str(self.content) + "[]"
 
     def get_sample_value(self) -> str:
         return f"[{self.content.get_sample_value()}]"
 
 
-class CplDefTuple(CplDef):
+class CplDefTuple(CplDef, metaclass=CplDefMeta):
     def __init__(self, content: List[CplDef]):
         super().__init__("tuple")
         self.content = content
 
-    def __str__(self) -> str:
+    @staticmethod
+    def intern_key(content):
+        return tuple(map(id, content))
+
+    def _to_str(self) -> str:
         return "[" + ", ".join(map(str, self.content)) + "]"
 
     def get_sample_value(self) -> str:
@@ -275,10 +346,11 @@ class CplDefTuple(CplDef):
 class CplDefObject(CplDef):
     def __init__(self, type: Dict[str, CplDef], class_name: str | None = None):
         super().__init__("object")
+        # not interned, the attributes of a class are added after its type is created
         self.content = type
         self.class_name = class_name
 
-    def __str__(self) -> str:
+    def _to_str(self) -> str:
         if self.class_name:
             return self.class_name
         return (
@@ -295,24 +367,32 @@ class CplDefObject(CplDef):
         )
 
 
-class CplDefSelector(CplDef):
+class CplDefSelector(CplDef, metaclass=CplDefMeta):
     def __init__(self):
         super().__init__("selector")
 
-    def __str__(self) -> str:
+    @staticmethod
+    def intern_key():
+        return ()
+
+    def _to_str(self) -> str:
         return "selector"
 
     def get_sample_value(self) -> str:
         raise "Selectors cannot be sampled"
 
 
-class CplDefFunction(CplDef):
+class CplDefFunction(CplDef, metaclass=CplDefMeta):
     def __init__(self, arguments: List[CplDef], returns: CplDef | None):
         super().__init__("string")
         self.arguments = arguments
         self.returns = returns
 
-    def __str__(self) -> str:
+    @staticmethod
+    def intern_key(arguments, returns):
+        return tuple(map(id, arguments)), id(returns)
+
+    def _to_str(self) -> str:
         return "((" + ", ".join(map(str, self.arguments)) + ") => " + str(self.returns or "void") + ")"
 
     def get_sample_value(self) -> str:
@@ -0,0 +1,249 @@
+import ctypes
+import errno
+import os
+import select
+import struct
+import sys
+from time import sleep, time
+from typing import Dict, List, Tuple
+
+# path -> "created", "modified" or "deleted"
+Changes = Dict[str, str]
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+              | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_within(pt: str, folder: str) -> bool:
+    return pt == folder or pt.startswith(folder.rstrip(os.sep) + os.sep)
+
+
+def add_change(changes: Changes, pt: str, kind: str):
+    old = changes.get(pt)
+    if old is None or kind == "deleted":
+        changes[pt] = kind
+    elif old == "deleted" and kind == "created":
+        changes[pt] = "modified"
+
+
+class Watcher:
+    """
+    Watches the given folders recursively and the given files for changes. The output folders given in ignore are
+    skipped. wait() blocks until something changes, then keeps collecting the changes until there are none for the
+    debounce window, so saving many files at once results in a single build.
+    """
+
+    def __init__(self, folders: List[str], files: List[str], ignore: List[str], debounce: float = 0.1) -> None:
+        self.folders = [os.path.realpath(f) for f in folders]
+        self.files = set(os.path.realpath(f) for f in files)
+        # an output folder containing a watched folder, like the project folder itself, shouldn't hide it
+        self.ignore = [
+            os.path.realpath(f) for f in ignore
+            if not any(is_within(folder, os.path.realpath(f)) for folder in self.folders)
+        ]
+        self.debounce = debounce
+
+    def is_ignored(self, pt: str) -> bool:
+        return any(is_within(pt, f) for f in self.ignore)
+
+    def read(self, timeout: float | None) -> Changes | None:
+        # None means that changes might have been missed and everything should be rebuilt
+        raise NotImplementedError
+
+    def wait(self, timeout: float | None = None) -> Changes | None:
+        changes = self.read(timeout)
+        while changes:
+            more = self.read(self.debounce)
+            if more is None:
+                return None
+            if not more:
+                break
+            for pt in more:
+                add_change(changes, pt, more[pt])
+        return changes
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(Watcher):
+    """
+    Linux inotify based watcher, sleeps in the kernel until a watched folder changes.
+    """
+
+    def __init__(self, folders: List[str], files: List[str], ignore: List[str], debounce: float = 0.1) -> None:
+        super().__init__(folders, files, ignore, debounce)
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.inotify_add_watch = libc.inotify_add_watch
+        self.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # watch descriptor -> (folder, is recursive)
+        self.watches: Dict[int, Tuple[str, bool]] = {}
+        try:
+            for folder in self.folders:
+                self.add_folder(folder, None)
+            for pt in self.files:
+                self.add_watch(os.path.dirname(pt), False)
+        except OSError:
+            self.close()
+            raise
+
+    def add_watch(self, folder: str, recursive: bool) -> bool:
+        wd = self.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                # out of watches, changes in this folder would be missed silently
+                raise OSError(err, "inotify watch limit reached")
+            return False
+        # a folder watched both ways is reported as recursive, the file filter only applies to non-recursive ones
+        if wd not in self.watches or recursive:
+            self.watches[wd] = (folder, recursive)
+        return True
+
+    def add_folder(self, folder: str, changes: Changes | None):
+        if self.is_ignored(folder) or not self.add_watch(folder, True):
+            return
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        self.add_folder(entry.path, changes)
+                    elif changes is not None:
+                        # created along with a new folder, before it could be watched
+                        add_change(changes, entry.path, "created")
+        except OSError:
+            pass
+
+    def read(self, timeout: float | None) -> Changes | None:
+        try:
+            readable, _, _ = select.select([self.fd], [], [], timeout)
+        except InterruptedError:
+            return {}
+        if not readable:
+            return {}
+        changes: Changes = {}
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+                if wd not in self.watches or not name:
+                    continue
+                (folder, recursive) = self.watches[wd]
+                pt = os.path.join(folder, os.fsdecode(name))
+                if not recursive and pt not in self.files:
+                    continue
+                if self.is_ignored(pt):
+                    continue
+                if mask & IN_ISDIR:
+                    if recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                        self.add_folder(pt, changes)
+                    elif mask & (IN_DELETE | IN_MOVED_FROM):
+                        # the files inside are gone as well, but there is no event for each of them
+                        return None
+                    continue
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    add_change(changes, pt, "created")
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    add_change(changes, pt, "deleted")
+                else:
+                    add_change(changes, pt, "modified")
+        return changes
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher(Watcher):
+    """
+    Fallback for platforms without inotify, compares the modification times of the files every interval seconds.
+    """
+
+    def __init__(self, folders: List[str], files: List[str], ignore: List[str], debounce: float = 0.1,
+                 interval: float = 0.3) -> None:
+        super().__init__(folders, files, ignore, debounce)
+        self.interval = interval
+        self.snapshot = self.take_snapshot()
+
+    def scan(self, folder: str, snapshot: Dict[str, float]):
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not self.is_ignored(entry.path):
+                            self.scan(entry.path, snapshot)
+                    else:
+                        # DirEntry caches the stat result, on Windows it comes with the listing itself
+                        snapshot[entry.path] = entry.stat().st_mtime
+        except OSError:
+            pass
+
+    def take_snapshot(self) -> Dict[str, float]:
+        snapshot = {}
+        for folder in self.folders:
+            if not self.is_ignored(folder):
+                self.scan(folder, snapshot)
+        for pt in self.files:
+            try:
+                snapshot[pt] = os.stat(pt).st_mtime
+            except OSError:
+                pass
+        return snapshot
+
+    def read(self, timeout: float | None) -> Changes | None:
+        end = None if timeout is None else time() + timeout
+        while True:
+            sleep(self.interval if end is None else max(0.0, min(self.interval, end - time())))
+            new_snapshot = self.take_snapshot()
+            old_snapshot = self.snapshot
+            self.snapshot = new_snapshot
+            changes: Changes = {}
+            for pt in new_snapshot:
+                if pt not in old_snapshot:
+                    changes[pt] = "created"
+                elif new_snapshot[pt] != old_snapshot[pt]:
+                    changes[pt] = "modified"
+            for pt in old_snapshot:
+                if pt not in new_snapshot:
+                    changes[pt] = "deleted"
+            if changes or (end is not None and time() >= end):
+                return changes
+
+
+def create_watcher(folders: List[str], files: List[str], ignore: List[str], debounce: float = 0.1) -> Watcher:
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folders, files, ignore, debounce)
+        except (OSError, AttributeError):
+            # no inotify in this libc, or ran out of instances/watches
+            pass
+    return PollingWatcher(folders, files, ignore, debounce)